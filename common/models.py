@@ -1,6 +1,6 @@
 import numpy as np
 import tensorflow as tf
-from common.utils.tf import leaky_relu
+from common.utils.tf import leaky_relu, get_channel_axis, get_layers_data_format, NHWC
 
 
 _default = object()
@@ -127,7 +127,7 @@ class ConvNetwork(RestorableNetwork):
     def __init__(self, name, layer_specs=None,
                  activation_fn=leaky_relu,
                  last_activation_fn=_default,
-                 regularizer=None, padding='SAME', dense_net=False):
+                 regularizer=None, padding='SAME', dense_net=False, data_format=NHWC):
         """
         Generic conv-net
         :param name: Str. For variable scoping.
@@ -139,6 +139,7 @@ class ConvNetwork(RestorableNetwork):
         :param regularizer: Tf regularizer such as tf.contrib.layers.l2_regularizer.
         :param padding: Str. Either 'SAME' or 'VALID' case insensitive.
         :param dense_net: Bool. If true, then it is expected that all layers have the same width and height.
+        :param data_format: Str. NHWC or NCHW. Layout of the feature maps. The variables are the same for both.
         """
         super().__init__(name)
         self.layer_specs = layer_specs
@@ -146,6 +147,7 @@ class ConvNetwork(RestorableNetwork):
         self.regularizer = regularizer
         self.padding = padding
         self.dense_net = dense_net
+        self.data_format = data_format
 
         if last_activation_fn == _default:
             self.last_activation_fn = self.activation_fn
@@ -154,7 +156,8 @@ class ConvNetwork(RestorableNetwork):
 
     def _get_conv_tower(self, features):
         """
-        :param features: Tensor. Feature map of shape [batch_size, H, W, num_features].
+        :param features: Tensor. Feature map of shape [batch_size, H, W, num_features], or
+                         [batch_size, num_features, H, W] if the data_format is NCHW.
         :return: final_output: Tensor of shape [batch_size, H, W, num_output_features].
                  layer_outputs: List of all convolution outputs of the network. The last item is the final_output.
                  dense_outputs: List of tensors. This can be used to chain this dense-net to another. The last item
@@ -191,6 +194,7 @@ class ConvNetwork(RestorableNetwork):
                                                activation=None,
                                                kernel_regularizer=self.regularizer,
                                                bias_regularizer=self.regularizer,
+                                               data_format=get_layers_data_format(self.data_format),
                                                name=conv_name)
             if activation_fn is not None:
                 with tf.variable_scope(conv_name + '_activation'):
@@ -198,7 +202,7 @@ class ConvNetwork(RestorableNetwork):
 
             if self.dense_net:
                 # Dense layer output consists of all previous layer outputs and the input.
-                dense_outputs.append(tf.concat([inputs, previous_output], axis=-1))
+                dense_outputs.append(tf.concat([inputs, previous_output], axis=get_channel_axis(self.data_format)))
 
             layer_outputs.append(previous_output)
 
@@ -0,0 +1,169 @@
+import glob
+import os
+import re
+import shutil
+import threading
+import numpy as np
+import tensorflow as tf
+
+
+class AsyncCheckpointWriter:
+    def __init__(self, checkpoint_prefix, variables=None, npz_file=None, npz_variables=None, max_to_keep=5):
+        """
+        Saves checkpoints from a background thread so that training only stalls for the copy of the variables into host
+        memory. The snapshot is written with a tf.train.Saver into a separate graph, so the checkpoints can be restored
+        by a regular tf.train.Saver of the training graph. The meta graph is not written.
+        Only 1 write is in flight at a time. Saving while the previous write hasn't finished waits for it first.
+        :param checkpoint_prefix: Str. I.e. '<checkpoint_directory>/model.ckpt'. The global step is appended to this.
+        :param variables: List of variables to checkpoint. Defaults to all global variables (i.e. the default of
+                          tf.train.Saver), and is evaluated when this is constructed.
+        :param npz_file: Str or None. If not None, npz_variables are also saved here in the format of
+                         RestorableNetwork.save_to, so that RestorableNetwork.restore_from can read it.
+        :param npz_variables: List of variables to save to npz_file, i.e. tf.trainable_variables(model.name).
+        :param max_to_keep: Int. Number of most recent checkpoints to keep. If npz_file is given, this many
+                            step-numbered copies of it are kept as well (i.e. 'pwcnet_weights-1000.npz').
+        """
+        if variables is None:
+            variables = tf.global_variables()
+        if npz_variables is None:
+            npz_variables = []
+        assert npz_file is None or len(npz_variables) > 0
+        self.checkpoint_prefix = checkpoint_prefix
+        self.npz_file = npz_file
+        self.max_to_keep = max_to_keep
+
+        # The npz variables are snapshotted in the same run as the checkpoint variables.
+        self.variables = list(variables)
+        self.snapshot_tensors = [variable.value() for variable in self.variables]
+        self.npz_names = [variable.name for variable in npz_variables]
+        npz_indices = {variable.name: i for i, variable in enumerate(self.variables)}
+        for variable in npz_variables:
+            if variable.name not in npz_indices:
+                npz_indices[variable.name] = len(self.snapshot_tensors)
+                self.snapshot_tensors.append(variable.value())
+        self.npz_indices = [npz_indices[name] for name in self.npz_names]
+
+        # Initialized on the first write, on the background thread.
+        self.write_graph = None  # Graph that holds a copy of the variables for the saver.
+        self.write_session = None  # Session of write_graph.
+        self.write_saver = None  # Saver of write_graph.
+        self.write_placeholders = None  # List of placeholders to feed the snapshot values with.
+        self.write_initializers = None  # List of ops that assign the placeholders to the copied variables.
+
+        self.thread = None
+        self.exception = None
+        self.last_save_path = None
+
+    def save(self, session, global_step):
+        """
+        Takes a snapshot of the variables and starts writing it on the background thread.
+        :param session: Tensorflow session.
+        :param global_step: Int. Appended to the checkpoint and npz names.
+        :return: Nothing.
+        """
+        self.wait()
+        values = session.run(self.snapshot_tensors)
+        self.thread = threading.Thread(target=self._write, args=(values, int(global_step)))
+        self.thread.start()
+
+    def wait(self):
+        """
+        Blocks until the write in flight (if any) finishes. Raises the exception of the write if it failed.
+        :return: Str or None. Path of the last checkpoint that was written.
+        """
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        if self.exception is not None:
+            exception = self.exception
+            self.exception = None
+            raise exception
+        return self.last_save_path
+
+    def close(self):
+        """
+        Waits for the write in flight and releases the background session.
+        :return: Nothing.
+        """
+        self.wait()
+        if self.write_session is not None:
+            self.write_session.close()
+            self.write_session = None
+
+    def _write(self, values, global_step):
+        """
+        Runs on the background thread.
+        :param values: List of np arrays. Snapshot of self.snapshot_tensors.
+        :param global_step: Int.
+        :return: Nothing.
+        """
+        try:
+            if self.npz_file is not None:
+                self._write_npz({name: values[i] for name, i in zip(self.npz_names, self.npz_indices)}, global_step)
+            self._write_checkpoint(values[:len(self.variables)], global_step)
+        except Exception as e:
+            print('Writing the checkpoint for step', global_step, 'failed:', e)
+            self.exception = e
+
+    def _write_checkpoint(self, values, global_step):
+        """
+        :param values: List of np arrays. 1 for each of self.variables.
+        :param global_step: Int.
+        :return: Nothing.
+        """
+        if self.write_graph is None:
+            self._create_write_graph()
+        feed_dict = dict(zip(self.write_placeholders, values))
+        self.write_session.run(self.write_initializers, feed_dict=feed_dict)
+        # The saver writes to temporary files and renames them, and it deletes checkpoints beyond max_to_keep.
+        self.last_save_path = self.write_saver.save(self.write_session, self.checkpoint_prefix,
+                                                    global_step=global_step, write_meta_graph=False)
+
+    def _create_write_graph(self):
+        """
+        Creates a graph with 1 variable per checkpointed variable, saved under the original variable's name.
+        :return: Nothing.
+        """
+        self.write_graph = tf.Graph()
+        with self.write_graph.as_default():
+            self.write_placeholders = []
+            self.write_initializers = []
+            var_list = {}
+            for i, variable in enumerate(self.variables):
+                placeholder = tf.placeholder(variable.dtype.base_dtype, shape=variable.get_shape())
+                write_variable = tf.Variable(placeholder, trainable=False, name='variable_%d' % i)
+                self.write_placeholders.append(placeholder)
+                self.write_initializers.append(write_variable.initializer)
+                var_list[variable.op.name] = write_variable
+            self.write_saver = tf.train.Saver(var_list=var_list, max_to_keep=self.max_to_keep)
+        self.write_session = tf.Session(graph=self.write_graph, config=tf.ConfigProto(device_count={'GPU': 0}))
+
+    def _write_npz(self, save_dict, global_step):
+        """
+        Writes the step-numbered npz file, copies it over npz_file, and deletes the old step-numbered files.
+        Both files are written under a temporary name and then renamed, so a crash never leaves a partial file behind.
+        :param save_dict: Dict of np arrays. Key is the name of the variable.
+        :param global_step: Int.
+        :return: Nothing.
+        """
+        base, extension = os.path.splitext(self.npz_file)
+        step_file = '%s-%d%s' % (base, global_step, extension)
+        temp_file = step_file + '.tmp'
+        # Writing through a file object stops np.savez from appending another extension.
+        with open(temp_file, 'wb') as f:
+            np.savez(f, **save_dict)
+        os.replace(temp_file, step_file)
+
+        temp_file = self.npz_file + '.tmp'
+        shutil.copyfile(step_file, temp_file)
+        os.replace(temp_file, self.npz_file)
+
+        # Rotate the step-numbered files.
+        pattern = re.compile(re.escape(base) + r'-(\d+)' + re.escape(extension) + '$')
+        step_files = []
+        for path in glob.glob(glob.escape(base) + '-*' + extension):
+            match = pattern.match(path)
+            if match is not None:
+                step_files.append((int(match.group(1)), path))
+        for _, path in sorted(step_files)[:-self.max_to_keep]:
+            os.remove(path)
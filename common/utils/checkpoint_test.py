@@ -0,0 +1,58 @@
+import numpy as np
+import os
+import shutil
+import tempfile
+import unittest
+import tensorflow as tf
+from common.utils.checkpoint import AsyncCheckpointWriter
+
+
+class TestAsyncCheckpointWriter(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.sess = tf.Session()
+
+    def tearDown(self):
+        self.sess.close()
+        shutil.rmtree(self.directory)
+
+    def test_save_and_restore(self):
+        with tf.variable_scope('checkpoint_test_scope'):
+            variable_1 = tf.get_variable('variable_1', shape=(2, 3), dtype=tf.float32,
+                                         initializer=tf.constant_initializer(1.0))
+            variable_2 = tf.get_variable('variable_2', shape=(), dtype=tf.int32, trainable=False,
+                                         initializer=tf.constant_initializer(2))
+        npz_file = os.path.join(self.directory, 'weights.npz')
+        writer = AsyncCheckpointWriter(os.path.join(self.directory, 'model.ckpt'), variables=[variable_1, variable_2],
+                                       npz_file=npz_file, npz_variables=[variable_1], max_to_keep=2)
+        self.sess.run(tf.global_variables_initializer())
+
+        for step in range(1, 4):
+            self.sess.run(variable_1.assign(np.full((2, 3), step, dtype=np.float32)))
+            writer.save(self.sess, step)
+            # Changing the variables while the write is in flight must not affect it.
+            self.sess.run(variable_1.assign(np.zeros((2, 3), dtype=np.float32)))
+        save_path = writer.wait()
+        writer.close()
+
+        # Only the last 2 checkpoints and npz copies are kept.
+        self.assertEqual(os.path.join(self.directory, 'model.ckpt-3'), save_path)
+        self.assertEqual(save_path, tf.train.latest_checkpoint(self.directory))
+        checkpoint_paths = tf.train.get_checkpoint_state(self.directory).all_model_checkpoint_paths
+        self.assertListEqual(['model.ckpt-2', 'model.ckpt-3'], [os.path.basename(path) for path in checkpoint_paths])
+        self.assertFalse(os.path.isfile(os.path.join(self.directory, 'weights-1.npz')))
+        self.assertTrue(os.path.isfile(os.path.join(self.directory, 'weights-2.npz')))
+        self.assertTrue(os.path.isfile(os.path.join(self.directory, 'weights-3.npz')))
+
+        saved_np = np.load(npz_file)
+        self.assertListEqual([variable_1.name], list(saved_np.keys()))
+        self.assertTrue(np.allclose(np.full((2, 3), 3.0), saved_np[variable_1.name]))
+
+        tf.train.Saver([variable_1, variable_2]).restore(self.sess, save_path)
+        value_1, value_2 = self.sess.run([variable_1, variable_2])
+        self.assertTrue(np.allclose(np.full((2, 3), 3.0), value_1))
+        self.assertEqual(2, value_2)
+
+
+if __name__ == '__main__':
+    unittest.main()
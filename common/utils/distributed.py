@@ -0,0 +1,267 @@
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+import numpy as np
+import tensorflow as tf
+
+
+DEFAULT_BASE_PORT = 29500
+
+
+class RingAllReduce:
+    def __init__(self, rank, num_workers, host='127.0.0.1', base_port=DEFAULT_BASE_PORT, connect_timeout=120.0):
+        """
+        Averages numpy arrays across worker processes with a ring all-reduce over TCP sockets.
+        Worker i listens on base_port + i and sends to worker (i + 1) % num_workers, so every worker only ever talks
+        to its 2 neighbours and sends 2 * (num_workers - 1) / num_workers times the size of the data per all-reduce.
+        All workers must call the collective functions (all_reduce, broadcast) in the same order with arrays of the
+        same shapes and dtypes.
+        :param rank: Int. Index of this worker, between [0, num_workers).
+        :param num_workers: Int.
+        :param host: Str. Host that all workers are on.
+        :param base_port: Int. Worker i listens on base_port + i.
+        :param connect_timeout: Float. Seconds to wait for the neighbouring workers to come up.
+        """
+        assert 0 <= rank < num_workers
+        self.rank = rank
+        self.num_workers = num_workers
+        self.host = host
+        self.base_port = base_port
+        self.connect_timeout = connect_timeout
+
+        # Initialized during connect().
+        self.send_socket = None  # Socket to the next worker in the ring.
+        self.recv_socket = None  # Socket from the previous worker in the ring.
+
+    def connect(self):
+        """
+        Connects this worker to its neighbours in the ring. Blocks until the neighbours have connected.
+        :return: Nothing.
+        """
+        if self.num_workers == 1:
+            return
+
+        server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        server.bind((self.host, self.base_port + self.rank))
+        server.listen(1)
+
+        # Connecting succeeds as soon as the next worker is listening, even before it accepts, so this can't deadlock.
+        next_port = self.base_port + (self.rank + 1) % self.num_workers
+        deadline = time.time() + self.connect_timeout
+        while True:
+            try:
+                self.send_socket = socket.create_connection((self.host, next_port))
+                break
+            except ConnectionRefusedError:
+                if time.time() > deadline:
+                    raise
+                time.sleep(0.1)
+        self.send_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+        server.settimeout(self.connect_timeout)
+        self.recv_socket, _ = server.accept()
+        self.recv_socket.settimeout(None)
+        server.close()
+
+    def close(self):
+        """
+        :return: Nothing.
+        """
+        for sock in [self.send_socket, self.recv_socket]:
+            if sock is not None:
+                sock.close()
+        self.send_socket = None
+        self.recv_socket = None
+
+    def all_reduce(self, arrays):
+        """
+        Averages the arrays element-wise across all workers. Integer arrays are averaged in floating point and rounded
+        to the nearest integer.
+        :param arrays: List of np arrays.
+        :return: List of np arrays with the same shapes and dtypes as arrays.
+        """
+        if self.num_workers == 1 or len(arrays) == 0:
+            return [np.array(array) for array in arrays]
+
+        buffer = self._flatten(arrays)
+        is_floating = np.issubdtype(buffer.dtype, np.floating)
+        if not is_floating:
+            buffer = buffer.astype(np.float64)
+        chunks = np.array_split(buffer, self.num_workers)
+
+        # Reduce-scatter. Afterwards, this worker holds the fully summed chunk (rank + 1) % num_workers.
+        for step in range(self.num_workers - 1):
+            send_idx = (self.rank - step) % self.num_workers
+            recv_idx = (self.rank - step - 1) % self.num_workers
+            chunks[recv_idx] += self._send_recv(chunks[send_idx], chunks[recv_idx])
+
+        # All-gather. Pass the fully summed chunks around the ring.
+        for step in range(self.num_workers - 1):
+            send_idx = (self.rank - step + 1) % self.num_workers
+            recv_idx = (self.rank - step) % self.num_workers
+            chunks[recv_idx][...] = self._send_recv(chunks[send_idx], chunks[recv_idx])
+
+        buffer /= self.num_workers
+        if not is_floating:
+            buffer = np.rint(buffer)
+        return self._unflatten(buffer, arrays)
+
+    def broadcast(self, arrays, root=0):
+        """
+        Sends the arrays of the root worker to all other workers.
+        :param arrays: List of np arrays.
+        :param root: Int. Rank of the worker to broadcast from.
+        :return: List of np arrays. The root worker's arrays.
+        """
+        if self.num_workers == 1 or len(arrays) == 0:
+            return [np.array(array) for array in arrays]
+
+        buffer = self._flatten(arrays)
+        if self.rank != root:
+            buffer = self._recv_like(buffer)
+        # Forward around the ring until the worker before the root.
+        if (self.rank + 1) % self.num_workers != root:
+            self.send_socket.sendall(buffer.tobytes())
+        return self._unflatten(buffer, arrays)
+
+    def get_tf_all_reduce(self, tensors):
+        """
+        Creates an op that averages the tensors across all workers when run.
+        :param tensors: List of tensors.
+        :return: List of tensors with the same shapes and dtypes as tensors.
+        """
+        if self.num_workers == 1 or len(tensors) == 0:
+            return tensors
+
+        def _all_reduce(*arrays):
+            return self.all_reduce(list(arrays))
+
+        with tf.name_scope('ring_all_reduce'):
+            reduced = tf.py_func(_all_reduce, tensors, [tensor.dtype for tensor in tensors], stateful=True)
+            for reduced_tensor, tensor in zip(reduced, tensors):
+                reduced_tensor.set_shape(tensor.get_shape())
+            return reduced
+
+    def get_all_reduced_gradients(self, grads_and_vars):
+        """
+        :param grads_and_vars: List of (gradient, variable) tuples, i.e. from optimizer.compute_gradients.
+        :return: List of (gradient, variable) tuples where the gradients are averaged across all workers. Variables
+                 without gradients are dropped.
+        """
+        grads_and_vars = [(tf.convert_to_tensor(g), v) for g, v in grads_and_vars if g is not None]
+        reduced_grads = self.get_tf_all_reduce([g for g, _ in grads_and_vars])
+        return [(g, v) for g, (_, v) in zip(reduced_grads, grads_and_vars)]
+
+    def broadcast_variables(self, session, variables=None, root=0):
+        """
+        Overwrites the variables on all workers with the values on the root worker.
+        :param session: Tensorflow session.
+        :param variables: List of variables. Defaults to all global variables.
+        :param root: Int. Rank of the worker to broadcast from.
+        :return: Nothing.
+        """
+        if variables is None:
+            variables = tf.global_variables()
+        values = self.broadcast(session.run(variables), root=root)
+        for variable, value in zip(variables, values):
+            variable.load(value, session)
+
+    def _send_recv(self, send_array, recv_like):
+        """
+        Sends to the next worker while receiving from the previous worker.
+        Sending is done on a separate thread so that all workers sending at once can't fill up the socket buffers and
+        deadlock.
+        :param send_array: Np array.
+        :param recv_like: Np array. The received array has the same shape and dtype as this.
+        :return: Np array.
+        """
+        sender = threading.Thread(target=self.send_socket.sendall, args=(send_array.tobytes(),))
+        sender.start()
+        received = self._recv_like(recv_like)
+        sender.join()
+        return received
+
+    def _recv_like(self, like):
+        """
+        :param like: Np array.
+        :return: Np array with the same shape and dtype as like.
+        """
+        received = bytearray(like.nbytes)
+        view = memoryview(received)
+        num_received = 0
+        while num_received < like.nbytes:
+            num_bytes = self.recv_socket.recv_into(view[num_received:])
+            if num_bytes == 0:
+                raise ConnectionError('Worker %d lost its connection to the previous worker.' % self.rank)
+            num_received += num_bytes
+        return np.frombuffer(received, dtype=like.dtype).reshape(like.shape)
+
+    @staticmethod
+    def _flatten(arrays):
+        """
+        :param arrays: List of np arrays.
+        :return: 1D np array. Copy of all arrays concatenated together.
+        """
+        dtype = np.result_type(*arrays)
+        return np.concatenate([np.asarray(array, dtype=dtype).ravel() for array in arrays])
+
+    @staticmethod
+    def _unflatten(buffer, arrays):
+        """
+        :param buffer: 1D np array.
+        :param arrays: List of np arrays that were flattened into buffer.
+        :return: List of np arrays with the same shapes and dtypes as arrays.
+        """
+        unflattened = []
+        offset = 0
+        for array in arrays:
+            array = np.asarray(array)
+            unflattened.append(buffer[offset:offset + array.size].reshape(array.shape).astype(array.dtype))
+            offset += array.size
+        return unflattened
+
+
+def launch_workers(num_workers, rank_arg='--worker_rank'):
+    """
+    Re-runs the current command in num_workers child processes, each with rank_arg=<rank> appended, and waits for them.
+    Intra-op threads are split evenly between the workers through OMP_NUM_THREADS.
+    :param num_workers: Int.
+    :param rank_arg: Str. Commandline argument that the workers read their rank from.
+    :return: Int. Non-zero if any worker failed.
+    """
+    env = os.environ.copy()
+    env.setdefault('OMP_NUM_THREADS', str(max(1, os.cpu_count() // num_workers)))
+    command = [sys.executable, '-m', get_main_module()] + sys.argv[1:]
+    processes = [subprocess.Popen(command + ['%s=%d' % (rank_arg, rank)], env=env) for rank in range(num_workers)]
+    return_code = 0
+    for process in processes:
+        return_code = process.wait() or return_code
+    return return_code
+
+
+def get_main_module():
+    """
+    :return: Str. Module name of the __main__ module, i.e. 'mains.train_pwcnet' when run with python -m.
+    """
+    main_module = sys.modules['__main__']
+    if getattr(main_module, '__spec__', None) is not None:
+        return main_module.__spec__.name
+    # Run as a script. Convert the path to a module name relative to the working directory.
+    path = os.path.relpath(os.path.abspath(main_module.__file__))
+    return os.path.splitext(path)[0].replace(os.sep, '.')
+
+
+def configure_worker_session(config_proto, num_workers):
+    """
+    Splits the CPU threads evenly between the worker processes on this host.
+    :param config_proto: Tensorflow ConfigProto.
+    :param num_workers: Int. Number of worker processes on this host.
+    :return: Nothing.
+    """
+    num_threads = max(1, os.cpu_count() // num_workers)
+    config_proto.intra_op_parallelism_threads = num_threads
+    config_proto.inter_op_parallelism_threads = num_threads
@@ -0,0 +1,107 @@
+import multiprocessing
+import random
+import unittest
+import numpy as np
+import tensorflow as tf
+from common.utils.distributed import RingAllReduce
+
+
+def _run_worker(rank, num_workers, base_port, shapes, results):
+    """
+    Does an all-reduce and a broadcast with arrays filled with the worker's rank.
+    """
+    all_reducer = RingAllReduce(rank, num_workers, base_port=base_port, connect_timeout=30.0)
+    all_reducer.connect()
+    arrays = [np.full(shape, rank, dtype=np.float32) for shape in shapes]
+    arrays.append(np.arange(6, dtype=np.float32).reshape((2, 3)) * (rank + 1))
+    reduced = all_reducer.all_reduce(arrays)
+    broadcasted = all_reducer.broadcast([np.full((3,), rank + 10, dtype=np.int32)], root=1)
+    integer_reduced = all_reducer.all_reduce([np.full((4,), 2 * rank, dtype=np.int64)])
+    all_reducer.close()
+    results.put((rank, reduced, broadcasted, integer_reduced[0]))
+
+
+def _run_tf_worker(rank, num_workers, base_port, results):
+    """
+    Runs the all-reduced gradients of a graph with gradients filled with the worker's rank.
+    """
+    all_reducer = RingAllReduce(rank, num_workers, base_port=base_port, connect_timeout=30.0)
+    all_reducer.connect()
+    with tf.Graph().as_default():
+        variable = tf.Variable(tf.zeros((2, 3)))
+        unused_variable = tf.Variable(tf.zeros((4,)))
+        gradient = tf.fill((2, 3), float(rank))
+        grads_and_vars = all_reducer.get_all_reduced_gradients([(gradient, variable), (None, unused_variable)])
+        with tf.Session() as session:
+            reduced = session.run([g for g, _ in grads_and_vars])
+        static_shapes = [g.get_shape().as_list() for g, _ in grads_and_vars]
+    all_reducer.close()
+    results.put((rank, reduced, static_shapes))
+
+
+class TestRingAllReduce(unittest.TestCase):
+    def test_single_worker(self):
+        all_reducer = RingAllReduce(0, 1)
+        all_reducer.connect()
+        arrays = [np.ones((2, 2), dtype=np.float32), np.zeros((3,), dtype=np.int32)]
+        reduced = all_reducer.all_reduce(arrays)
+        self.assertEqual(2, len(reduced))
+        for array, reduced_array in zip(arrays, reduced):
+            self.assertEqual(array.dtype, reduced_array.dtype)
+            self.assertTrue(np.allclose(array, reduced_array))
+
+    def test_multiple_workers(self):
+        for num_workers in [2, 3, 4]:
+            self.run_workers_helper(num_workers)
+
+    def test_tf_all_reduce(self):
+        # The workers are spawned rather than forked, because each of them runs a Tensorflow session.
+        worker_results = self.start_workers_helper(multiprocessing.get_context('spawn'), _run_tf_worker, 2, ())
+        self.assertEqual(2, len(worker_results))
+        for rank, reduced, static_shapes in worker_results:
+            # The unused variable without a gradient is dropped.
+            self.assertEqual(1, len(reduced))
+            self.assertListEqual([2, 3], static_shapes[0])
+            self.assertEqual(np.float32, reduced[0].dtype)
+            self.assertTrue(np.allclose(np.full((2, 3), 0.5), reduced[0]))
+
+    def start_workers_helper(self, context, target, num_workers, args):
+        """
+        Runs target(rank, num_workers, base_port, *args, results) in num_workers processes.
+        :return: List of the results that the workers put in the results queue.
+        """
+        base_port = random.randint(20000, 40000)
+        results = context.Queue()
+        processes = [context.Process(target=target, args=(rank, num_workers, base_port) + args + (results,))
+                     for rank in range(num_workers)]
+        for process in processes:
+            process.start()
+        worker_results = [results.get(timeout=60) for _ in range(num_workers)]
+        for process in processes:
+            process.join()
+            self.assertEqual(0, process.exitcode)
+        return worker_results
+
+    def run_workers_helper(self, num_workers):
+        # Includes arrays smaller than the number of workers so that some ring chunks are empty.
+        shapes = [(1,), (5, 7), (2, 3, 4), (1000,)]
+        worker_results = self.start_workers_helper(multiprocessing, _run_worker, num_workers, (shapes,))
+
+        expected_mean = np.mean(np.arange(num_workers))
+        expected_last = np.arange(6, dtype=np.float32).reshape((2, 3)) * np.mean(np.arange(num_workers) + 1)
+        self.assertEqual(num_workers, len(worker_results))
+        for rank, reduced, broadcasted, integer_reduced in worker_results:
+            self.assertEqual(len(shapes) + 1, len(reduced))
+            for shape, reduced_array in zip(shapes, reduced):
+                self.assertTupleEqual(shape, reduced_array.shape)
+                self.assertEqual(np.float32, reduced_array.dtype)
+                self.assertTrue(np.allclose(expected_mean, reduced_array))
+            self.assertTrue(np.allclose(expected_last, reduced[-1]))
+            self.assertEqual(np.int32, broadcasted[0].dtype)
+            self.assertTrue(np.array_equal(np.full((3,), 11, dtype=np.int32), broadcasted[0]))
+            self.assertEqual(np.int64, integer_reduced.dtype)
+            self.assertTrue(np.array_equal(np.full((4,), num_workers - 1), integer_reduced))
+
+
+if __name__ == '__main__':
+    unittest.main()
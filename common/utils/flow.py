@@ -1,18 +1,8 @@
-# To resolve some issues with MacOS and matplotlib:
-# https://stackoverflow.com/questions/2512225/matplotlib-plots-not-showing-up-in-mac-osx
-import platform
-if platform.system() == 'Darwin':
-    import matplotlib
-    matplotlib.use('TkAgg')
-import cv2
-import matplotlib.pyplot as plt
+# OpenCV and matplotlib are slow to import, so they are imported on first use.
 import numpy as np
 import tensorflow as tf
-from common.utils.pfm import load_pfm
-
-
-FLOW_CHANNELS = 2
-FLOW_TAG_FLOAT = 202021.25
+from common.utils.flow_io import FLOW_CHANNELS, FLOW_TAG_FLOAT, load_flow_file
+from common.utils.img import get_pyplot
 
 
 def read_flow_file(file_name):
@@ -22,28 +12,7 @@ def read_flow_file(file_name):
     :return: Numpy array of shape (height, width, FLOW_CHANNELS).
         Returns None if the tag in the file header was invalid.
     """
-    if file_name.endswith('.flo'):
-        with open(file_name, 'rb') as file:
-            tag = np.fromfile(file, dtype=np.float32, count=1)[0]
-            if tag != FLOW_TAG_FLOAT:
-                return None
-            width = np.fromfile(file, dtype=np.int32, count=1)[0]
-            height = np.fromfile(file, dtype=np.int32, count=1)[0]
-
-            num_image_floats = width * height * FLOW_CHANNELS
-            image = np.fromfile(file, dtype=np.float32, count=num_image_floats)
-            image = image.reshape((height, width, FLOW_CHANNELS))
-
-            return image
-    elif file_name.endswith('.pfm'):
-        np_array, scale = load_pfm(file_name)
-        if scale != 1.0:
-            raise Exception('Pfm flow scale must be 1.0.')
-        # PFM file convention has the y axis going upward. This is unconventional, so we need to flip it.
-        # Also, PFM can only have 1 or 3 colour channels. For flow, the last channel is set to 0.0.
-        return np.flip(np_array[..., 0:2], axis=0)
-    else:
-        raise Exception('Not a supported flow format.')
+    return load_flow_file(file_name)
 
 
 def write_flow_file(file_name, flow):
@@ -93,6 +62,7 @@ def get_flow_visualization(flow):
     value = radius_clipped
 
     hsv_img = (np.clip(np.stack([hue, saturation, value], axis=-1) * 255, 0, 255)).astype(dtype=np.uint8)
+    import cv2
     return cv2.cvtColor(hsv_img, cv2.COLOR_HSV2RGB)
 
 
@@ -128,6 +98,7 @@ def show_flow_image(flow):
     :param flow: Numpy array of shape (Height, Width, 2).
     :return: Nothing.
     """
+    plt = get_pyplot()
     plt.imshow(get_flow_visualization(flow))
     plt.show()
 
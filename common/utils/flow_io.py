@@ -0,0 +1,104 @@
+import collections
+import numpy as np
+from multiprocessing.pool import ThreadPool
+
+
+FLOW_CHANNELS = 2
+FLOW_TAG_FLOAT = 202021.25
+# Size of the .flo header, which is a float32 tag followed by the int32 width and height.
+FLO_HEADER_BYTES = 12
+
+
+def map_flow_file(file_name):
+    """
+    Memory-maps a .flo or .pfm flow file without reading or copying its payload. Pages are read from disk as the
+    returned array is accessed.
+    :param file_name: Str.
+    :return: Read-only np array view of shape (height, width, FLOW_CHANNELS). Its dtype can be big-endian for .pfm
+             files. Returns None if the tag in the .flo file header was invalid.
+    """
+    if file_name.endswith('.flo'):
+        return _map_flo(file_name)
+    elif file_name.endswith('.pfm'):
+        return _map_pfm(file_name)
+    else:
+        raise Exception('Not a supported flow format.')
+
+
+def load_flow_file(file_name):
+    """
+    Reads a .flo or .pfm flow file into memory.
+    :param file_name: Str.
+    :return: Contiguous float32 np array of shape (height, width, FLOW_CHANNELS) in native byte order.
+             Returns None if the tag in the .flo file header was invalid.
+    """
+    flow = map_flow_file(file_name)
+    if flow is None:
+        return None
+    # This is the only copy, and it also resolves the byte order and the flip of .pfm files.
+    return np.array(flow, dtype=np.float32, order='C')
+
+
+def read_flow_files(file_names, num_threads=4, prefetch=16):
+    """
+    Reads flow files on a pool of threads, ahead of when they are consumed.
+    :param file_names: Iterable of str.
+    :param num_threads: Int. Number of reader threads.
+    :param prefetch: Int. Maximum number of flows that are read but not yet consumed.
+    :return: Generator of flows in the format of load_flow_file, in the same order as file_names.
+    """
+    assert prefetch >= 1
+    pool = ThreadPool(num_threads)
+    pending = collections.deque()
+    try:
+        for file_name in file_names:
+            pending.append(pool.apply_async(load_flow_file, (file_name,)))
+            if len(pending) >= prefetch:
+                yield pending.popleft().get()
+        while len(pending) > 0:
+            yield pending.popleft().get()
+    finally:
+        pool.terminate()
+
+
+def _map_flo(file_name):
+    """
+    :param file_name: Str.
+    :return: See map_flow_file.
+    """
+    header = np.fromfile(file_name, dtype=np.int32, count=FLO_HEADER_BYTES // 4)
+    if header[:1].view(np.float32)[0] != FLOW_TAG_FLOAT:
+        return None
+    width, height = int(header[1]), int(header[2])
+    return np.memmap(file_name, dtype=np.float32, mode='r', offset=FLO_HEADER_BYTES,
+                     shape=(height, width, FLOW_CHANNELS))
+
+
+def _map_pfm(file_name):
+    """
+    :param file_name: Str.
+    :return: See map_flow_file.
+    """
+    with open(file_name, 'rb') as file:
+        header = file.readline().rstrip()
+        if header == b'PF':
+            num_channels = 3
+        elif header == b'Pf':
+            num_channels = 1
+        else:
+            raise Exception('Not a PFM file.')
+        dimensions = file.readline().split()
+        if len(dimensions) != 2:
+            raise Exception('Malformed PFM header.')
+        width, height = int(dimensions[0]), int(dimensions[1])
+        scale = float(file.readline().rstrip())
+        offset = file.tell()
+
+    # A negative scale means little-endian.
+    dtype = np.dtype('<f4') if scale < 0 else np.dtype('>f4')
+    if abs(scale) != 1.0:
+        raise Exception('Pfm flow scale must be 1.0.')
+    data = np.memmap(file_name, dtype=dtype, mode='r', offset=offset, shape=(height, width, num_channels))
+    # PFM file convention has the y axis going upward. This is unconventional, so the rows are flipped with a negative
+    # stride. Also, PFM can only have 1 or 3 colour channels. For flow, the last channel is set to 0.0.
+    return data[::-1, :, 0:FLOW_CHANNELS]
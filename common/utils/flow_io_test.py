@@ -0,0 +1,86 @@
+import os
+import unittest
+import numpy as np
+from common.utils.data import silently_remove_file
+from common.utils.flow_io import map_flow_file, load_flow_file, read_flow_files, FLOW_TAG_FLOAT
+from common.utils.pfm import load_pfm
+
+
+class TestFlowIO(unittest.TestCase):
+    def setUp(self):
+        self.flo_file = 'common/utils/test_data/frame_0001.flo'
+        self.pfm_file = 'common/utils/test_data/flow.pfm'
+        self.temp_files = []
+
+    def _get_temp_file(self, extension):
+        file_name = 'common/utils/test_data/temp_flow_io_test_file_%d%s' % (len(self.temp_files), extension)
+        self.temp_files.append(file_name)
+        return file_name
+
+    def test_flo(self):
+        with open(self.flo_file, 'rb') as file:
+            self.assertEqual(FLOW_TAG_FLOAT, np.fromfile(file, dtype=np.float32, count=1)[0])
+            width, height = np.fromfile(file, dtype=np.int32, count=2)
+            expected = np.fromfile(file, dtype=np.float32).reshape((height, width, 2))
+
+        mapped = map_flow_file(self.flo_file)
+        self.assertIsInstance(mapped, np.memmap)
+        self.assertFalse(mapped.flags.writeable)
+        self.assertTupleEqual((436, 1024, 2), mapped.shape)
+        self.assertTrue(np.array_equal(expected, mapped))
+
+        loaded = load_flow_file(self.flo_file)
+        self.assertNotIsInstance(loaded, np.memmap)
+        self.assertTrue(loaded.flags.c_contiguous)
+        self.assertTrue(np.array_equal(expected, loaded))
+
+    def test_invalid_flo(self):
+        file_name = self._get_temp_file('.flo')
+        np.asarray([1.0, 0.0, 0.0], dtype=np.float32).tofile(file_name)
+        self.assertIsNone(map_flow_file(file_name))
+        self.assertIsNone(load_flow_file(file_name))
+
+    def test_pfm(self):
+        data, scale = load_pfm(self.pfm_file)
+        self.assertEqual(1.0, scale)
+        expected = np.flip(data[..., 0:2], axis=0)
+
+        mapped = map_flow_file(self.pfm_file)
+        self.assertTupleEqual((540, 960, 2), mapped.shape)
+        # The flip and the channel slice are views of the memory map.
+        self.assertIsInstance(mapped.base, np.memmap)
+        self.assertTrue(np.array_equal(expected, mapped))
+
+        loaded = load_flow_file(self.pfm_file)
+        self.assertEqual(np.float32, loaded.dtype)
+        self.assertTrue(loaded.dtype.isnative)
+        self.assertTrue(loaded.flags.c_contiguous)
+        self.assertTrue(np.array_equal(expected, loaded))
+
+    def test_pfm_endianness(self):
+        # Rows are stored bottom to top.
+        flow = np.random.rand(3, 4, 2).astype(np.float32)
+        data = np.concatenate([flow, np.zeros((3, 4, 1), dtype=np.float32)], axis=-1)[::-1]
+        for dtype, scale in [('<f4', '-1.0'), ('>f4', '1.0')]:
+            file_name = self._get_temp_file('.pfm')
+            with open(file_name, 'wb') as file:
+                file.write(('PF\n4 3\n%s\n' % scale).encode('latin-1'))
+                file.write(data.astype(dtype).tobytes())
+            self.assertEqual(np.dtype(dtype), map_flow_file(file_name).dtype)
+            self.assertTrue(np.array_equal(flow, load_flow_file(file_name)))
+
+    def test_read_flow_files(self):
+        file_names = [self.flo_file, self.pfm_file, self.flo_file, self.pfm_file, self.flo_file]
+        flows = list(read_flow_files(file_names, num_threads=2, prefetch=2))
+        self.assertEqual(len(file_names), len(flows))
+        for file_name, flow in zip(file_names, flows):
+            self.assertTrue(np.array_equal(load_flow_file(file_name), flow))
+        self.assertListEqual([], list(read_flow_files([])))
+
+    def tearDown(self):
+        for file_name in self.temp_files:
+            silently_remove_file(file_name)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,21 +1,31 @@
-# To resolve some issues with MacOS and matplotlib:
-# https://stackoverflow.com/questions/2512225/matplotlib-plots-not-showing-up-in-mac-osx
+# OpenCV and matplotlib are slow to import, so they are imported on first use.
 import platform
-if platform.system() == 'Darwin':
-    import matplotlib
-    matplotlib.use('TkAgg')
-import cv2
-import matplotlib.pyplot as plt
+import sys
 import numpy as np
 import tensorflow as tf
 
 
+def get_pyplot():
+    """
+    Imports matplotlib.pyplot on first use.
+    :return: The matplotlib.pyplot module.
+    """
+    # To resolve some issues with MacOS and matplotlib:
+    # https://stackoverflow.com/questions/2512225/matplotlib-plots-not-showing-up-in-mac-osx
+    if platform.system() == 'Darwin' and 'matplotlib.pyplot' not in sys.modules:
+        import matplotlib
+        matplotlib.use('TkAgg')
+    import matplotlib.pyplot as plt
+    return plt
+
+
 def show_image(img):
     """
     Opens a window displaying the image.
     :param img: Numpy array of shape (Height, Width, Channels)
     :return: Nothing.
     """
+    plt = get_pyplot()
     plt.imshow(img)
     plt.show()
 
@@ -26,6 +36,7 @@ def read_image(img_path, as_float=False):
     :param as_float: Bool. If true, then return the image as floats between [0, 1] instead of uint8s between [0, 255].
     :return:
     """
+    import cv2
     img = cv2.imread(img_path)
     img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
     if as_float:
@@ -34,6 +45,18 @@ def read_image(img_path, as_float=False):
         return img
 
 
+def write_image(img_path, img):
+    """
+    :param img_path: Str.
+    :param img: Numpy array of shape (Height, Width, 3). RGB, either uint8s between [0, 255] or floats between [0, 1].
+    :return: Nothing.
+    """
+    import cv2
+    if img.dtype != np.uint8:
+        img = (np.clip(img, 0.0, 1.0) * 255.0 + 0.5).astype(np.uint8)
+    cv2.imwrite(img_path, cv2.cvtColor(img, cv2.COLOR_RGB2BGR))
+
+
 def tf_random_crop(images, crop_size):
     """
     Picks a random crop region based on crop_size, and applies the same crop rect to all images.
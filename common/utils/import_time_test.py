@@ -0,0 +1,60 @@
+import os
+import subprocess
+import sys
+import unittest
+
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Modules that nearly every entry point imports transitively.
+UTILITY_MODULES = ['common.utils.flow', 'common.utils.flow_io', 'common.utils.img', 'common.utils.tf',
+                   'common.utils.input_adapter', 'pwcnet.model']
+# Modules that are slow to import and must only be imported on first use.
+LAZY_MODULES = ['matplotlib', 'cv2', 'tensorflow.contrib']
+# Import time of the utility modules on top of Tensorflow and numpy, in microseconds.
+IMPORT_TIME_BUDGET_US = 500000
+
+
+def get_import_times(modules, preloaded_modules):
+    """
+    Runs python -X importtime in a fresh interpreter.
+    :param modules: List of str. Modules to import.
+    :param preloaded_modules: List of str. Modules that are imported beforehand, so that they are not counted.
+    :return: Dict. Key is the name of every module that got imported and value is a tuple of (cumulative import time
+             in microseconds (int), nesting depth (int)). Top level imports have a depth of 0.
+    """
+    statements = ['import ' + module for module in preloaded_modules + modules]
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', '; '.join(statements)],
+                            cwd=REPO_ROOT, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+    assert result.returncode == 0, result.stderr
+    import_times = {}
+    for line in result.stderr.splitlines():
+        # Lines look like 'import time:       123 |       4567 |   package.module'.
+        if not line.startswith('import time:'):
+            continue
+        fields = line[len('import time:'):].split('|')
+        if len(fields) != 3 or not fields[1].strip().isdigit():
+            continue
+        # Every nesting level indents the name by 2 more spaces.
+        depth = (len(fields[2]) - len(fields[2].lstrip()) - 1) // 2
+        import_times[fields[2].strip()] = (int(fields[1]), depth)
+    return import_times
+
+
+class TestImportTime(unittest.TestCase):
+    def test_import_time(self):
+        import_times = get_import_times(UTILITY_MODULES, preloaded_modules=['numpy', 'tensorflow'])
+
+        for module in import_times.keys():
+            for lazy_module in LAZY_MODULES:
+                self.assertFalse(module == lazy_module or module.startswith(lazy_module + '.'),
+                                 msg=module + ' must be imported lazily.')
+
+        # Utility modules that import each other are only counted once, by the top level import.
+        total_time = sum(import_times[module][0] for module in UTILITY_MODULES
+                         if module in import_times and import_times[module][1] == 0)
+        print('Utility modules import time: %.1f ms' % (total_time / 1000.0))
+        self.assertLess(total_time, IMPORT_TIME_BUDGET_US)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,234 @@
+import numpy as np
+
+
+class IncrementalInference:
+    def __init__(self, run, size_multiple, tile_size=32, padding=64, margin=32, change_threshold=0.02,
+                 max_changed_fraction=0.5):
+        """
+        Runs a dense network on a stream of inputs that only change in small regions, i.e. surveillance or
+        screen-capture footage. The inputs are compared with those of the previous run tile by tile, and the network
+        only runs on padded regions around the changed tiles. The outputs within a margin of the changed tiles are
+        pasted from the regions, and the others are copied from the previous run, so the compute scales with the changed
+        area rather than the frame area.
+        The margin should cover the receptive field of the network and the largest motion, since a change moves the
+        outputs that far. The padding should cover the margin plus the receptive field, otherwise the pasted outputs can
+        differ from those of the whole frame.
+        Usage for PWCNet:
+            engine = InferenceEngine(lambda inputs: model.get_forward(*inputs)[0], ...)
+            incremental = IncrementalInference(lambda inputs: engine.run([x[np.newaxis] for x in inputs])[0],
+                                               model.get_size_multiple())
+            flow = incremental.run([image_a, image_b])
+        Usage for ContextInterp (see mains/interpolate_frames.py):
+            engine = InferenceEngine(lambda inputs: model.get_forward(inputs[0], inputs[1], t)[0], ...)
+            incremental = IncrementalInference(
+                lambda inputs: engine.run([x[np.newaxis] for x in inputs], shared_values=[0.5])[0],
+                model.get_size_multiple())
+            interpolated = incremental.run([image_a, image_b])
+        Every region size is a new resolution for an InferenceEngine. The sizes are powers of 2 times size_multiple (or
+        the frame size), so there are only a few of them, but its max_cached_shapes should still be generous.
+        :param run: Function that takes a list of np arrays of shape [h, w, C] and returns an np array of shape
+                    [h, w, C'], i.e. an image or a flow. h and w are multiples of size_multiple.
+        :param size_multiple: Int. The height and width of the regions are multiples of this, and so are their offsets.
+        :param tile_size: Int. Changes are detected per tile of this size.
+        :param padding: Int. Pixels of context around the changed tiles. It is rounded up to size_multiple.
+        :param margin: Int. Pixels around the changed tiles whose outputs are updated. Must be less than the padding.
+        :param change_threshold: Float. A tile has changed if any of its pixels differs by more than this in any input,
+                                 averaged over the channels.
+        :param max_changed_fraction: Float. If the regions cover more of the frame than this, the whole frame is run.
+        """
+        assert size_multiple >= 1 and tile_size >= 1
+        assert 0 <= margin < padding
+        self.run_fn = run
+        self.size_multiple = size_multiple
+        self.tile_size = tile_size
+        self.padding = padding
+        self.margin = margin
+        self.change_threshold = change_threshold
+        self.max_changed_fraction = max_changed_fraction
+
+        self.previous_inputs = None
+        self.previous_output = None
+        # Pixels over all runs, and pixels that the network ran on.
+        self.num_pixels = 0
+        self.num_computed_pixels = 0
+
+    def run(self, inputs):
+        """
+        :param inputs: List of np arrays of shape [H, W, C]. H and W must be multiples of size_multiple.
+        :return: Np array of shape [H, W, C']. The output of run for the whole frame.
+        """
+        height, width = inputs[0].shape[:2]
+        assert height % self.size_multiple == 0 and width % self.size_multiple == 0
+        self.num_pixels += height * width
+
+        if not self._is_comparable(inputs):
+            output = self.run_fn(inputs)
+            self.num_computed_pixels += height * width
+        else:
+            changed_mask = self.get_changed_mask(inputs)
+            regions = self.get_regions(changed_mask)
+            region_area = sum((bottom - top) * (right - left) for top, left, bottom, right in regions)
+            if region_area > self.max_changed_fraction * height * width:
+                output = self.run_fn(inputs)
+                self.num_computed_pixels += height * width
+            else:
+                output = np.copy(self.previous_output)
+                update_mask = self.get_update_mask(changed_mask)
+                for top, left, bottom, right in regions:
+                    region_output = self.run_fn([x[top:bottom, left:right] for x in inputs])
+                    region_mask = update_mask[top:bottom, left:right]
+                    output[top:bottom, left:right][region_mask] = region_output[region_mask]
+                self.num_computed_pixels += region_area
+
+        self.previous_inputs = [np.copy(x) for x in inputs]
+        self.previous_output = output
+        return np.copy(output)
+
+    def reset(self):
+        """
+        Forgets the previous run, i.e. at a scene cut. The next run is on the whole frame.
+        :return: Nothing.
+        """
+        self.previous_inputs = None
+        self.previous_output = None
+
+    def get_computed_fraction(self):
+        """
+        :return: Float. Fraction of the pixels of all runs that the network ran on.
+        """
+        return self.num_computed_pixels / max(self.num_pixels, 1)
+
+    def get_changed_mask(self, inputs):
+        """
+        :param inputs: List of np arrays of shape [H, W, C].
+        :return: Bool np array of shape [H, W]. True at the pixels of the changed tiles.
+        """
+        height, width = inputs[0].shape[:2]
+        difference = np.zeros((height, width), dtype=np.float32)
+        for x, previous_x in zip(inputs, self.previous_inputs):
+            np.maximum(difference, np.mean(np.abs(x - previous_x), axis=-1), out=difference)
+
+        # Partial tiles at the bottom and right are padded with zeros, which never count as a change.
+        num_tiles_h = -(-height // self.tile_size)
+        num_tiles_w = -(-width // self.tile_size)
+        padded = np.zeros((num_tiles_h * self.tile_size, num_tiles_w * self.tile_size), dtype=np.float32)
+        padded[:height, :width] = difference
+        tile_differences = padded.reshape(num_tiles_h, self.tile_size, num_tiles_w, self.tile_size).max(axis=(1, 3))
+        changed_tiles = tile_differences > self.change_threshold
+        changed_mask = np.repeat(np.repeat(changed_tiles, self.tile_size, axis=0), self.tile_size, axis=1)
+        return changed_mask[:height, :width]
+
+    def get_update_mask(self, changed_mask):
+        """
+        :param changed_mask: Bool np array of shape [H, W]. See get_changed_mask.
+        :return: Bool np array of shape [H, W]. True at the pixels within the margin of the changed tiles, whose
+                 outputs are taken from the regions.
+        """
+        update_mask = np.zeros_like(changed_mask)
+        for top, left, bottom, right in self._get_changed_tiles(changed_mask):
+            update_mask[max(top - self.margin, 0):bottom + self.margin,
+                        max(left - self.margin, 0):right + self.margin] = True
+        return update_mask
+
+    def get_regions(self, changed_mask):
+        """
+        :param changed_mask: Bool np array of shape [H, W]. See get_changed_mask.
+        :return: List of (top, left, bottom, right) tuples. Disjoint regions that contain every changed tile along with
+                 its padding, aligned to size_multiple. Their heights and widths are powers of 2 times size_multiple,
+                 or those of the frame.
+        """
+        height, width = changed_mask.shape
+        regions = []
+        for top, left, bottom, right in self._get_changed_tiles(changed_mask):
+            regions.append((self._round_down(max(top - self.padding, 0)),
+                            self._round_down(max(left - self.padding, 0)),
+                            self._round_up(min(bottom + self.padding, height)),
+                            self._round_up(min(right + self.padding, width))))
+        # Growing the regions to their bucket sizes can make them overlap again.
+        while True:
+            regions = [self._bucket_region(region, height, width) for region in regions]
+            merged = _merge_overlapping_regions(regions)
+            if len(merged) == len(regions):
+                return merged
+            regions = merged
+
+    def _get_changed_tiles(self, changed_mask):
+        """
+        :param changed_mask: Bool np array of shape [H, W]. See get_changed_mask.
+        :return: List of (top, left, bottom, right) tuples. The changed tiles, clipped to the frame.
+        """
+        height, width = changed_mask.shape
+        changed_tiles = changed_mask[::self.tile_size, ::self.tile_size]
+        tiles = []
+        for tile_y, tile_x in zip(*np.nonzero(changed_tiles)):
+            top = tile_y * self.tile_size
+            left = tile_x * self.tile_size
+            tiles.append((top, left, min(top + self.tile_size, height), min(left + self.tile_size, width)))
+        return tiles
+
+    def _bucket_region(self, region, height, width):
+        """
+        Grows a region to the bucket size of its height and width, towards the bottom and right unless it would leave
+        the frame. This bounds the number of resolutions that the network runs on.
+        :param region: Tuple of (top, left, bottom, right), aligned to size_multiple.
+        :param height: Int. Height of the frame, a multiple of size_multiple.
+        :param width: Int. Width of the frame, a multiple of size_multiple.
+        :return: Tuple of (top, left, bottom, right).
+        """
+        top, left, bottom, right = region
+        region_height = self._get_bucket_size(bottom - top, height)
+        region_width = self._get_bucket_size(right - left, width)
+        top = min(top, height - region_height)
+        left = min(left, width - region_width)
+        return top, left, top + region_height, left + region_width
+
+    def _get_bucket_size(self, size, frame_size):
+        """
+        :param size: Int. A multiple of size_multiple, at most frame_size.
+        :param frame_size: Int.
+        :return: Int. The smallest power of 2 times size_multiple that fits size, clipped to frame_size.
+        """
+        bucket_size = self.size_multiple
+        while bucket_size < size:
+            bucket_size *= 2
+        return min(bucket_size, frame_size)
+
+    def _is_comparable(self, inputs):
+        """
+        :param inputs: List of np arrays.
+        :return: Bool. Whether there was a previous run with inputs of the same shapes.
+        """
+        if self.previous_inputs is None or len(self.previous_inputs) != len(inputs):
+            return False
+        return all(x.shape == previous_x.shape for x, previous_x in zip(inputs, self.previous_inputs))
+
+    def _round_down(self, size):
+        return size // self.size_multiple * self.size_multiple
+
+    def _round_up(self, size):
+        return -(-size // self.size_multiple) * self.size_multiple
+
+
+def _merge_overlapping_regions(regions):
+    """
+    Merges overlapping regions into their bounding boxes until none overlap.
+    :param regions: List of (top, left, bottom, right) tuples.
+    :return: List of (top, left, bottom, right) tuples.
+    """
+    merged = list(set(regions))
+    did_merge = True
+    while did_merge:
+        did_merge = False
+        for i in range(len(merged)):
+            for j in range(i + 1, len(merged)):
+                top_i, left_i, bottom_i, right_i = merged[i]
+                top_j, left_j, bottom_j, right_j = merged[j]
+                if top_i < bottom_j and top_j < bottom_i and left_i < right_j and left_j < right_i:
+                    merged[i] = (min(top_i, top_j), min(left_i, left_j), max(bottom_i, bottom_j),
+                                 max(right_i, right_j))
+                    del merged[j]
+                    did_merge = True
+                    break
+            if did_merge:
+                break
+    return sorted(merged)
@@ -0,0 +1,105 @@
+import numpy as np
+import unittest
+from common.utils.incremental import IncrementalInference
+
+
+def _blur(inputs):
+    """
+    A stand-in for a network, with a receptive field of 5x5 pixels. It averages both inputs and blurs them twice.
+    """
+    image = (inputs[0] + inputs[1]) / 2.0
+    for _ in range(2):
+        padded = np.pad(image, [[1, 1], [1, 1], [0, 0]], mode='edge')
+        image = sum(padded[y:y + image.shape[0], x:x + image.shape[1]] for y in range(3) for x in range(3)) / 9.0
+    return image
+
+
+class TestIncrementalInference(unittest.TestCase):
+    def setUp(self):
+        self.region_shapes = []
+
+        def _run(inputs):
+            height, width = inputs[0].shape[:2]
+            self.assertEqual(0, height % 16)
+            self.assertEqual(0, width % 16)
+            self.region_shapes.append((height, width))
+            return _blur(inputs)
+
+        self.incremental = IncrementalInference(_run, 16, tile_size=16, padding=8, margin=4,
+                                               change_threshold=0.01)
+        self.image_a = np.random.rand(128, 192, 3).astype(np.float32)
+        self.image_b = np.random.rand(128, 192, 3).astype(np.float32)
+
+    def test_first_run(self):
+        output = self.incremental.run([self.image_a, self.image_b])
+        self.assertTrue(np.allclose(_blur([self.image_a, self.image_b]), output))
+        self.assertListEqual([(128, 192)], self.region_shapes)
+        self.assertAlmostEqual(1.0, self.incremental.get_computed_fraction())
+
+    def test_unchanged(self):
+        self.incremental.run([self.image_a, self.image_b])
+        output = self.incremental.run([self.image_a.copy(), self.image_b.copy()])
+        self.assertTrue(np.allclose(_blur([self.image_a, self.image_b]), output))
+        # Only the first run ran the network.
+        self.assertEqual(1, len(self.region_shapes))
+        self.assertAlmostEqual(0.5, self.incremental.get_computed_fraction())
+
+    def test_changed_regions(self):
+        self.incremental.run([self.image_a, self.image_b])
+        # Two small changes far apart, one of them at the border.
+        next_image_b = self.image_b.copy()
+        next_image_b[40:44, 100:110] = 0.0
+        next_image_b[120:128, 0:5] = 1.0
+        output = self.incremental.run([self.image_a, next_image_b])
+        self.assertTrue(np.allclose(_blur([self.image_a, next_image_b]), output, atol=1e-6))
+
+        # The tiles [32, 48) x [96, 112) and [112, 128) x [0, 16), padded by 8 and aligned to 16. The first region is
+        # grown from 48 x 48 to its bucket size.
+        self.assertListEqual([(128, 192), (64, 64), (32, 32)], self.region_shapes)
+        self.assertListEqual([(16, 80, 80, 144), (96, 0, 128, 32)],
+                             self.incremental.get_regions(self.incremental.get_changed_mask([self.image_a,
+                                                                                             self.image_b])))
+
+    def test_change_at_tile_edge(self):
+        self.incremental.run([self.image_a, self.image_b])
+        # The change touches the right edge of its tile, so the outputs of the next tile change as well.
+        next_image_b = self.image_b.copy()
+        next_image_b[40:44, 44:48] = 0.0
+        output = self.incremental.run([self.image_a, next_image_b])
+        self.assertTrue(np.allclose(_blur([self.image_a, next_image_b]), output, atol=1e-6))
+
+    def test_bucketed_regions(self):
+        changed_mask = np.zeros((128, 192), dtype=np.bool_)
+        # A 48 x 80 region grows to 64 x 128. At the bottom right, it is moved back into the frame.
+        changed_mask[16:32, 16:80] = True
+        self.assertListEqual([(0, 0, 64, 128)], self.incremental.get_regions(changed_mask))
+        changed_mask[:] = False
+        changed_mask[112:128, 112:192] = True
+        self.assertListEqual([(96, 64, 128, 192)], self.incremental.get_regions(changed_mask))
+        # Buckets never exceed the frame, so a width of 160 becomes 192 rather than 256.
+        changed_mask[:] = False
+        changed_mask[16:32, 16:128] = True
+        self.assertListEqual([(0, 0, 64, 192)], self.incremental.get_regions(changed_mask))
+
+        # Regions that only overlap once they are grown are merged.
+        changed_mask[:] = False
+        changed_mask[0:16, 16:32] = True
+        changed_mask[0:16, 64:80] = True
+        self.assertListEqual([(0, 0, 32, 128)], self.incremental.get_regions(changed_mask))
+
+    def test_large_change(self):
+        self.incremental.run([self.image_a, self.image_b])
+        next_image_b = self.image_b.copy()
+        next_image_b[:100] = 0.0
+        self.incremental.run([self.image_a, next_image_b])
+        self.assertListEqual([(128, 192), (128, 192)], self.region_shapes)
+
+        # Other shapes and resets start over on the whole frame.
+        self.incremental.run([self.image_a[:64], self.image_b[:64]])
+        self.incremental.reset()
+        self.incremental.run([self.image_a[:64], self.image_b[:64]])
+        self.assertListEqual([(128, 192), (128, 192), (64, 192), (64, 192)], self.region_shapes)
+
+
+if __name__ == '__main__':
+    unittest.main()
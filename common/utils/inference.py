@@ -0,0 +1,134 @@
+import collections
+import numpy as np
+import tensorflow as tf
+
+
+class InferenceEngine:
+    def __init__(self, build_outputs, restore_weights, input_channels, shared_inputs=None, max_cached_shapes=4,
+                 num_warmup_runs=1, session=None):
+        """
+        Runs a network on inputs of a handful of resolutions with a single session. The subgraph of every resolution
+        (shape bucket) is built once with static shapes, and all of them share the same variables, so the weights are
+        only restored once. Switching back to a resolution that was seen before costs nothing.
+        Usage for PWCNet:
+            model = PWCNet()
+            engine = InferenceEngine(lambda inputs: model.get_forward(*inputs)[0],
+                                     lambda sess: model.restore_from(weights_path, sess), [3, 3])
+            engine.warm_up([(448, 1024), (512, 896)])  # Optional.
+            flows = engine.run([images_a, images_b])
+        Usage for ContextInterp:
+            t = tf.placeholder(shape=[], dtype=tf.float32)
+            engine = InferenceEngine(lambda inputs: model.get_forward(inputs[0], inputs[1], t)[0],
+                                     lambda sess: optimistic_restore(sess, checkpoint_file), [3, 3], shared_inputs=[t])
+            images = engine.run([images_a, images_b], shared_values=[0.5])
+        :param build_outputs: Function that takes a list of placeholders of shape [None, H, W, C] and returns a tensor
+                              or a list of tensors. It must reuse the variables between calls (i.e. get_forward with
+                              reuse_variables=tf.AUTO_REUSE).
+        :param restore_weights: Function that takes the session and restores the weights. It is called once, after the
+                                first subgraph is built.
+        :param input_channels: List of ints. Number of channels C of every image input.
+        :param shared_inputs: List of placeholders that don't depend on the resolution (i.e. the interpolation time t).
+                              Their values are given to run().
+        :param max_cached_shapes: Int. Number of resolutions whose compiled executors are kept alive. The least recently
+                                  used one is released when there are more. Its ops stay in the graph, since a Tf graph
+                                  can't shrink, so coming back to it only recompiles it.
+        :param num_warmup_runs: Int. Number of runs on zeros after a resolution is compiled, so that one-time costs
+                                (i.e. cuDNN autotuning and memory allocation) are not paid by the first real request.
+        :param session: Tf session or None. If None, a new session on the default graph is created.
+        """
+        assert max_cached_shapes >= 1
+        self.build_outputs = build_outputs
+        self.restore_weights = restore_weights
+        self.input_channels = input_channels
+        self.shared_inputs = shared_inputs if shared_inputs is not None else []
+        self.max_cached_shapes = max_cached_shapes
+        self.num_warmup_runs = num_warmup_runs
+        if session is None:
+            config = tf.ConfigProto()
+            config.gpu_options.allow_growth = True
+            session = tf.Session(config=config)
+        self.session = session
+        self.weights_restored = False
+
+        # Key is the (H, W) shape bucket and value is a tuple of (list of placeholders, outputs).
+        self.subgraphs = {}
+        # Key is the (H, W) shape bucket and value is a session callable. Ordered from least to most recently used.
+        self.callables = collections.OrderedDict()
+
+    def warm_up(self, shapes, batch_size=1):
+        """
+        Builds, compiles and warms up the subgraphs of the given resolutions ahead of the first requests.
+        :param shapes: List of tuples of (int (H), int (W)).
+        :param batch_size: Int. Batch size of the warm-up runs.
+        :return: Nothing.
+        """
+        for shape in shapes:
+            self._get_callable(tuple(shape), batch_size)
+
+    def run(self, inputs, shared_values=None):
+        """
+        :param inputs: List of np arrays of shape [batch_size, H, W, C]. They must all have the same H and W, and
+                       H and W must be valid for the network (see InputAdapter).
+        :param shared_values: List of values for the shared_inputs, or None if there are none.
+        :return: The values of the outputs of build_outputs.
+        """
+        assert len(inputs) == len(self.input_channels)
+        shape = tuple(inputs[0].shape[1:3])
+        for image in inputs:
+            assert tuple(image.shape[1:3]) == shape
+        shared_values = shared_values if shared_values is not None else []
+        assert len(shared_values) == len(self.shared_inputs)
+        run_fn = self._get_callable(shape, inputs[0].shape[0])
+        return run_fn(*(list(inputs) + list(shared_values)))
+
+    def _get_callable(self, shape, batch_size):
+        """
+        :param shape: Tuple of (int (H), int (W)).
+        :param batch_size: Int. Batch size of the warm-up runs if the callable needs to be created.
+        :return: Session callable that takes the image inputs followed by the shared inputs.
+        """
+        if shape in self.callables:
+            self.callables.move_to_end(shape)
+            return self.callables[shape]
+
+        placeholders, outputs = self._get_subgraph(shape)
+        run_fn = self.session.make_callable(outputs, feed_list=placeholders + self.shared_inputs)
+        warmup_values = [np.zeros([batch_size] + placeholder.shape.as_list()[1:], dtype=np.float32)
+                         for placeholder in placeholders]
+        warmup_values += [np.zeros([1 if dim is None else dim for dim in shared_input.shape.as_list()],
+                                   dtype=shared_input.dtype.as_numpy_dtype)
+                          for shared_input in self.shared_inputs]
+        for _ in range(self.num_warmup_runs):
+            run_fn(*warmup_values)
+
+        self.callables[shape] = run_fn
+        if len(self.callables) > self.max_cached_shapes:
+            # Dropping the last reference to a callable releases its executor in the session.
+            self.callables.popitem(last=False)
+        return run_fn
+
+    def _get_subgraph(self, shape):
+        """
+        :param shape: Tuple of (int (H), int (W)).
+        :return: Tuple of (list of placeholders, outputs).
+        """
+        if shape in self.subgraphs:
+            return self.subgraphs[shape]
+
+        height, width = shape
+        with self.session.graph.as_default():
+            variables_before = set(tf.global_variables())
+            placeholders = [tf.placeholder(shape=[None, height, width, num_channels], dtype=tf.float32)
+                            for num_channels in self.input_channels]
+            outputs = self.build_outputs(placeholders)
+
+            # Only the variables that this subgraph created are initialized, so restored weights are never overwritten.
+            new_variables = [var for var in tf.global_variables() if var not in variables_before]
+            if len(new_variables) > 0:
+                self.session.run(tf.variables_initializer(new_variables))
+            if not self.weights_restored:
+                self.restore_weights(self.session)
+                self.weights_restored = True
+
+        self.subgraphs[shape] = (placeholders, outputs)
+        return self.subgraphs[shape]
@@ -0,0 +1,48 @@
+import numpy as np
+import unittest
+import tensorflow as tf
+from common.utils.inference import InferenceEngine
+
+
+class TestInferenceEngine(unittest.TestCase):
+    def setUp(self):
+        config = tf.ConfigProto()
+        config.gpu_options.allow_growth = True
+        self.sess = tf.Session(config=config)
+        self.num_restores = 0
+
+    def _build_outputs(self, inputs):
+        with tf.variable_scope('inference_test', reuse=tf.AUTO_REUSE):
+            weight = tf.get_variable('weight', shape=[], initializer=tf.zeros_initializer())
+            return inputs[0] * weight + inputs[1] * self.offset
+
+    def _restore_weights(self, sess):
+        self.num_restores += 1
+        with tf.variable_scope('inference_test', reuse=True):
+            sess.run(tf.assign(tf.get_variable('weight'), 2.0))
+
+    def test_engine(self):
+        self.offset = tf.placeholder(shape=[], dtype=tf.float32)
+        engine = InferenceEngine(self._build_outputs, self._restore_weights, [3, 1], shared_inputs=[self.offset],
+                                 max_cached_shapes=1, session=self.sess)
+        engine.warm_up([(4, 8)])
+        self.assertEqual(1, self.num_restores)
+        num_variables = len(tf.global_variables())
+
+        for height, width in [(4, 8), (8, 4), (4, 8)]:
+            images_a = np.ones(shape=[2, height, width, 3], dtype=np.float32)
+            images_b = np.ones(shape=[2, height, width, 1], dtype=np.float32)
+            outputs = engine.run([images_a, images_b], shared_values=[0.5])
+            self.assertTupleEqual((2, height, width, 3), outputs.shape)
+            self.assertTrue(np.allclose(2.5, outputs))
+
+        # The variables are shared and restored once.
+        self.assertEqual(num_variables, len(tf.global_variables()))
+        self.assertEqual(1, self.num_restores)
+        # Every subgraph is built once, but only the most recently used one stays compiled.
+        self.assertListEqual([(4, 8), (8, 4)], sorted(engine.subgraphs.keys()))
+        self.assertListEqual([(4, 8)], list(engine.callables.keys()))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,114 @@
+import math
+import numpy as np
+
+
+class InputAdapter:
+    PAD = 'pad'
+    RESIZE = 'resize'
+
+    def __init__(self, size_multiple, mode=PAD):
+        """
+        Brings images of any resolution to a shape that a network accepts, and brings the outputs back.
+        Networks with pyramids need their input height and width to be multiples of some number, i.e.
+        PWCNet.get_size_multiple().
+        :param size_multiple: Int. The adapted height and width are multiples of this.
+        :param mode: Str. InputAdapter.PAD pads the bottom and right with the edge pixels up to the next multiple.
+                     InputAdapter.RESIZE resizes to the nearest multiple, which is cheaper for large padding amounts
+                     but blurs the outputs slightly.
+        """
+        assert size_multiple >= 1
+        assert mode in [InputAdapter.PAD, InputAdapter.RESIZE]
+        self.size_multiple = size_multiple
+        self.mode = mode
+
+    def get_adapted_shape(self, height, width):
+        """
+        :param height: Int.
+        :param width: Int.
+        :return: Tuple of (int (H), int (W)).
+        """
+        if self.mode == InputAdapter.PAD:
+            return self._round_up(height), self._round_up(width)
+        return self._round_nearest(height), self._round_nearest(width)
+
+    def adapt(self, image):
+        """
+        :param image: Np array of shape [H, W, C].
+        :return: Np array of shape [adapted H, adapted W, C].
+        """
+        height, width = image.shape[:2]
+        adapted_height, adapted_width = self.get_adapted_shape(height, width)
+        if (adapted_height, adapted_width) == (height, width):
+            return image
+        if self.mode == InputAdapter.PAD:
+            return np.pad(image, [[0, adapted_height - height], [0, adapted_width - width], [0, 0]], mode='edge')
+        return _resize(image, adapted_height, adapted_width)
+
+    def restore_image(self, image, original_shape):
+        """
+        Undoes adapt() on an output image.
+        :param image: Np array of shape [adapted H, adapted W, C].
+        :param original_shape: Tuple of (int (H), int (W), ...). The shape before adapt().
+        :return: Np array of shape [H, W, C].
+        """
+        height, width = original_shape[:2]
+        if image.shape[:2] == (height, width):
+            return image
+        if self.mode == InputAdapter.PAD:
+            return image[:height, :width]
+        return _resize(image, height, width)
+
+    def restore_flow(self, flow, original_shape):
+        """
+        Undoes adapt() on an output flow. When resizing, the flow vectors are rescaled along with the image.
+        :param flow: Np array of shape [adapted H, adapted W, 2].
+        :param original_shape: Tuple of (int (H), int (W), ...). The shape before adapt().
+        :return: Np array of shape [H, W, 2].
+        """
+        height, width = original_shape[:2]
+        adapted_height, adapted_width = flow.shape[:2]
+        restored = self.restore_image(flow, original_shape)
+        if self.mode == InputAdapter.RESIZE and (adapted_height, adapted_width) != (height, width):
+            scale = np.asarray([width / adapted_width, height / adapted_height], dtype=restored.dtype)
+            restored = restored * scale
+        return restored
+
+    def get_buckets(self, items, get_shape, batch_size):
+        """
+        Groups items with the same adapted shape into batches. A batch is yielded as soon as it is full, and the
+        partially filled batches are yielded at the end.
+        :param items: Iterable.
+        :param get_shape: Function that returns the (H, W, ...) shape of an item before adapt().
+        :param batch_size: Int. Maximum number of items in a batch.
+        :return: Generator of tuples of (adapted shape (tuple of (int (H), int (W))), list of items).
+        """
+        buckets = {}
+        for item in items:
+            adapted_shape = self.get_adapted_shape(*get_shape(item)[:2])
+            bucket = buckets.setdefault(adapted_shape, [])
+            bucket.append(item)
+            if len(bucket) >= batch_size:
+                yield adapted_shape, buckets.pop(adapted_shape)
+        for adapted_shape, bucket in buckets.items():
+            yield adapted_shape, bucket
+
+    def _round_up(self, size):
+        return -(-size // self.size_multiple) * self.size_multiple
+
+    def _round_nearest(self, size):
+        # Ties round up. Python's round() would send them to the even multiple.
+        return max(1, int(math.floor(size / self.size_multiple + 0.5))) * self.size_multiple
+
+
+def _resize(image, height, width):
+    """
+    :param image: Np array of shape [H, W, C].
+    :param height: Int.
+    :param width: Int.
+    :return: Np array of shape [height, width, C].
+    """
+    import cv2
+    interpolation = cv2.INTER_AREA if height * width < image.shape[0] * image.shape[1] else cv2.INTER_LINEAR
+    resized = cv2.resize(image, (width, height), interpolation=interpolation)
+    # OpenCV drops the channel dimension of single channel images.
+    return resized.reshape((height, width, image.shape[2]))
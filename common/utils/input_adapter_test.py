@@ -0,0 +1,55 @@
+import numpy as np
+import unittest
+from common.utils.input_adapter import InputAdapter
+
+
+class TestInputAdapter(unittest.TestCase):
+    def test_adapted_shapes(self):
+        pad_adapter = InputAdapter(64)
+        self.assertTupleEqual((448, 1024), pad_adapter.get_adapted_shape(436, 1024))
+        self.assertTupleEqual((512, 896), pad_adapter.get_adapted_shape(480, 854))
+        self.assertTupleEqual((64, 64), pad_adapter.get_adapted_shape(1, 64))
+
+        resize_adapter = InputAdapter(64, mode=InputAdapter.RESIZE)
+        self.assertTupleEqual((448, 1024), resize_adapter.get_adapted_shape(436, 1024))
+        self.assertTupleEqual((512, 832), resize_adapter.get_adapted_shape(480, 854))
+        self.assertTupleEqual((64, 64), resize_adapter.get_adapted_shape(1, 20))
+
+    def test_pad_round_trip(self):
+        adapter = InputAdapter(16)
+        image = np.random.rand(20, 30, 3).astype(np.float32)
+        adapted = adapter.adapt(image)
+        self.assertTupleEqual((32, 32, 3), adapted.shape)
+        self.assertTrue(np.allclose(image, adapted[:20, :30]))
+        # Edge padding.
+        self.assertTrue(np.allclose(image[-1, :, :], adapted[31, :30, :]))
+
+        flow = np.random.rand(32, 32, 2).astype(np.float32)
+        restored_flow = adapter.restore_flow(flow, image.shape)
+        self.assertTrue(np.allclose(flow[:20, :30], restored_flow))
+        self.assertTupleEqual((20, 30, 3), adapter.restore_image(adapted, image.shape).shape)
+
+    def test_resize_flow_scaling(self):
+        adapter = InputAdapter(16, mode=InputAdapter.RESIZE)
+        # A constant flow of (2, 1) at the adapted resolution of 32x64 is (1, 2) at 64x32.
+        flow = np.tile(np.asarray([2.0, 1.0], dtype=np.float32), [32, 64, 1])
+        restored_flow = adapter.restore_flow(flow, (64, 32, 3))
+        self.assertTupleEqual((64, 32, 2), restored_flow.shape)
+        self.assertTrue(np.allclose(1.0, restored_flow[..., 0]))
+        self.assertTrue(np.allclose(2.0, restored_flow[..., 1]))
+
+        image = np.random.rand(64, 32, 1).astype(np.float32)
+        self.assertTupleEqual((64, 32, 1), adapter.adapt(image).shape)
+        image = np.random.rand(60, 40, 1).astype(np.float32)
+        self.assertTupleEqual((64, 48, 1), adapter.adapt(image).shape)
+
+    def test_buckets(self):
+        adapter = InputAdapter(64)
+        shapes = [(436, 1024), (480, 854), (440, 1000), (480, 854), (436, 1024), (100, 100)]
+        buckets = list(adapter.get_buckets(enumerate(shapes), lambda item: item[1], batch_size=2))
+        self.assertListEqual([((448, 1024), [0, 2]), ((512, 896), [1, 3]), ((448, 1024), [4]), ((128, 128), [5])],
+                             [(shape, [i for i, _ in bucket]) for shape, bucket in buckets])
+
+
+if __name__ == '__main__':
+    unittest.main()
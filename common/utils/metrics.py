@@ -0,0 +1,85 @@
+import tensorflow as tf
+
+
+def get_flow_metrics(flow, gt_flow, outlier_threshold=3.0, outlier_relative_threshold=0.05):
+    """
+    Per-pixel optical flow metrics. Their means over a dataset are the average endpoint error (AEPE) and the percentage
+    of outliers (the KITTI Fl measure).
+    :param flow: Tensor of shape [batch_size, H, W, 2].
+    :param gt_flow: Tensor of shape [batch_size, H, W, 2].
+    :param outlier_threshold: Float. A pixel is an outlier if its endpoint error is above this many pixels...
+    :param outlier_relative_threshold: Float. ...and above this fraction of the ground truth flow magnitude.
+    :return: Dict of tensors of shape [batch_size, H, W]. Keys are 'aepe' and 'outlier_percentage'.
+    """
+    with tf.name_scope('flow_metrics'):
+        epe = tf.sqrt(tf.reduce_sum(tf.square(flow - gt_flow), axis=-1))
+        gt_magnitude = tf.sqrt(tf.reduce_sum(tf.square(gt_flow), axis=-1))
+        is_outlier = tf.logical_and(tf.greater(epe, outlier_threshold),
+                                    tf.greater(epe, outlier_relative_threshold * gt_magnitude))
+        return {
+            'aepe': epe,
+            'outlier_percentage': tf.cast(is_outlier, tf.float32) * 100.0
+        }
+
+
+def get_image_metrics(images, gt_images, max_val=1.0):
+    """
+    Per-image quality metrics.
+    :param images: Tensor of shape [batch_size, H, W, C]. H and W must be at least 11 for SSIM.
+    :param gt_images: Tensor of shape [batch_size, H, W, C].
+    :param max_val: Float. Dynamic range of the images. The images are clipped to [0, max_val].
+    :return: Dict of tensors of shape [batch_size]. Keys are 'psnr' and 'ssim'.
+    """
+    with tf.name_scope('image_metrics'):
+        images = tf.clip_by_value(images, 0.0, max_val)
+        return {
+            'psnr': tf.image.psnr(images, gt_images, max_val),
+            'ssim': tf.image.ssim(images, gt_images, max_val)
+        }
+
+
+class StreamingMetrics:
+    def __init__(self, metrics, name='validation_metrics'):
+        """
+        Averages metrics over many session.runs with in-graph accumulators, so that an epoch only needs to fetch the
+        final scalars.
+        Usage:
+            streaming_metrics.reset(sess)  # Once per epoch.
+            sess.run(streaming_metrics.update_op)  # Once per batch.
+            streaming_metrics.get_values(sess)
+        :param metrics: Dict. Key is the metric name and value is a tensor. Every element of every batch of a tensor
+                        counts equally towards its mean, so i.e. per-pixel errors are averaged over all pixels.
+        :param name: Str. Variable scope of the accumulators and tag prefix of the summary.
+        """
+        self.values = {}
+        update_ops = []
+        with tf.variable_scope(name) as scope:
+            for key in sorted(metrics.keys()):
+                # The summary takes the name of the key, so the accumulators' name scope must differ from it.
+                value, update_op = tf.metrics.mean(metrics[key], name=key + '_mean')
+                self.values[key] = value
+                update_ops.append(update_op)
+            self.update_op = tf.group(*update_ops, name='update_op')
+
+            # The accumulators are local variables, so they are not part of any checkpoint.
+            accumulators = tf.get_collection(tf.GraphKeys.LOCAL_VARIABLES, scope=scope.name + '/')
+            self.reset_op = tf.variables_initializer(accumulators, name='reset_op')
+
+            # Not added to the default summary collection so that it stays out of tf.summary.merge_all().
+            self.summary = tf.summary.merge([tf.summary.scalar(key, self.values[key], collections=[])
+                                             for key in sorted(self.values.keys())])
+
+    def reset(self, session):
+        """
+        Zeros the accumulators. Must be called before the first update.
+        :param session: Tensorflow session.
+        :return: Nothing.
+        """
+        session.run(self.reset_op)
+
+    def get_values(self, session):
+        """
+        :param session: Tensorflow session.
+        :return: Dict. Key is the metric name and value is its mean since the last reset.
+        """
+        return session.run(self.values)
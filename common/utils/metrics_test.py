@@ -0,0 +1,64 @@
+import numpy as np
+import unittest
+import tensorflow as tf
+from common.utils.metrics import get_flow_metrics, get_image_metrics, StreamingMetrics
+
+
+class TestMetrics(unittest.TestCase):
+    def setUp(self):
+        config = tf.ConfigProto()
+        config.gpu_options.allow_growth = True
+        self.sess = tf.Session(config=config)
+
+    def test_flow_metrics(self):
+        flow = tf.placeholder(shape=(None, 2, 2, 2), dtype=tf.float32)
+        gt_flow = tf.placeholder(shape=(None, 2, 2, 2), dtype=tf.float32)
+        metrics = get_flow_metrics(flow, gt_flow)
+
+        gt_flow_np = np.asarray([[[[0.0, 0.0], [100.0, 0.0]],
+                                  [[10.0, 0.0], [0.0, 0.0]]]], dtype=np.float32)
+        # Endpoint errors of 0, 4, 4 and 5.
+        flow_np = gt_flow_np + np.asarray([[[[0.0, 0.0], [0.0, 4.0]],
+                                            [[4.0, 0.0], [3.0, 4.0]]]], dtype=np.float32)
+        values = self.sess.run(metrics, feed_dict={flow: flow_np, gt_flow: gt_flow_np})
+        self.assertTrue(np.allclose(np.asarray([[[0.0, 4.0], [4.0, 5.0]]]), values['aepe']))
+        # The error of 4 on the flow of magnitude 100 is below 5% of it, so it isn't an outlier.
+        self.assertTrue(np.allclose(np.asarray([[[0.0, 0.0], [100.0, 100.0]]]), values['outlier_percentage']))
+
+    def test_image_metrics(self):
+        images = tf.placeholder(shape=(None, 16, 16, 3), dtype=tf.float32)
+        gt_images = tf.placeholder(shape=(None, 16, 16, 3), dtype=tf.float32)
+        metrics = get_image_metrics(images, gt_images)
+
+        gt_images_np = np.random.uniform(0.2, 0.8, size=(2, 16, 16, 3)).astype(np.float32)
+        images_np = np.copy(gt_images_np)
+        images_np[1] += 0.1
+        values = self.sess.run(metrics, feed_dict={images: images_np, gt_images: gt_images_np})
+        self.assertTupleEqual((2,), values['psnr'].shape)
+        self.assertTupleEqual((2,), values['ssim'].shape)
+        self.assertAlmostEqual(20.0, values['psnr'][1], places=3)
+        self.assertAlmostEqual(1.0, values['ssim'][0], places=5)
+        self.assertLess(values['ssim'][1], 1.0)
+
+    def test_streaming_metrics(self):
+        errors = tf.placeholder(shape=(None,), dtype=tf.float32)
+        streaming_metrics = StreamingMetrics({'error': errors, 'double_error': errors * 2.0}, name='streaming_test')
+        self.assertEqual(0, len([var for var in tf.global_variables() if var.name.startswith('streaming_test/')]))
+
+        for _ in range(2):
+            streaming_metrics.reset(self.sess)
+            # Batches of different sizes. Every element counts equally.
+            self.sess.run(streaming_metrics.update_op, feed_dict={errors: [1.0, 2.0, 3.0]})
+            self.sess.run(streaming_metrics.update_op, feed_dict={errors: [6.0]})
+            values = streaming_metrics.get_values(self.sess)
+            self.assertAlmostEqual(3.0, values['error'], places=5)
+            self.assertAlmostEqual(6.0, values['double_error'], places=5)
+
+        summary = tf.Summary()
+        summary.ParseFromString(self.sess.run(streaming_metrics.summary))
+        self.assertListEqual(['streaming_test/double_error', 'streaming_test/error'],
+                             [value.tag for value in summary.value])
+
+
+if __name__ == '__main__':
+    unittest.main()
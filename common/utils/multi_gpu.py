@@ -11,32 +11,40 @@ def get_available_gpus():
     return [x.name for x in local_device_protos if x.device_type == 'GPU']
 
 
-# Copied from https://github.com/simonmeister/UnFlow/blob/master/src/e2eflow/core/train.py.
+# Originally copied from https://github.com/simonmeister/UnFlow/blob/master/src/e2eflow/core/train.py.
 # Commit bac9bbaf49be44b9e1c1f004fce4fb04b247763d.
-def average_gradients(tower_grads_and_vars):
+def average_gradients(tower_grads_and_vars, devices=None, tree_reduce=False, tower_weights=None):
     """
     Calculate the average gradient for each shared variable across all towers.
     Note that this function provides a synchronization point across all towers.
+    The gradients are summed with add_n and then scaled, so no stacked copy of the tower gradients is ever created.
     :param tower_grads_and_vars: List of lists of (gradient, variable) tuples. The outer list is over individual
                                  gradients. The inner list is over the gradient calculation for each tower.
+    :param devices: List of str or None. If not None, the reduction for the ith variable is placed on
+                    devices[i % len(devices)] so that the reduction work and memory are spread across devices.
+                    Otherwise, the reduction is placed on the default device.
+    :param tree_reduce: Bool. Whether to sum the tower gradients pairwise in a binary tree, where each pairwise sum is
+                        placed on the device of its first operand. This avoids gathering every tower's gradient onto a
+                        single device when there are many towers.
+    :param tower_weights: List of scalar tensors or None. The weight of each tower, i.e. its number of examples. If
+                          not None, the average is weighted by these, so that every example counts the same when the
+                          towers have sub-batches of different sizes. Otherwise, every tower counts the same.
     :return: List of pairs of (gradient, variable) where the gradient has been averaged across all towers.
     """
     averaged_grads = []
-    for grad_and_vars in zip(*tower_grads_and_vars):
+    for i, grad_and_vars in enumerate(zip(*tower_grads_and_vars)):
         # Note that each grad_and_vars looks like the following:
         #   ((grad0_gpu0, var0_gpu0), ... , (grad0_gpuN, var0_gpuN))
-        grads = []
-        for g, _ in grad_and_vars:
-            if g is not None:
-                # Add 0 dimension to the gradients to represent the tower.
-                expanded_g = tf.expand_dims(g, 0)
-
-                # Append on a 'tower' dimension which we will average over below.
-                grads.append(expanded_g)
+        grads = [g for g, _ in grad_and_vars if g is not None]
+        weights = None
+        if tower_weights is not None:
+            weights = [w for (g, _), w in zip(grad_and_vars, tower_weights) if g is not None]
         if len(grads) != 0:
-            # Average over the 'tower' dimension.
-            grad = tf.concat(grads, axis=0)
-            grad = tf.reduce_mean(grad, axis=0)
+            if devices is None:
+                grad = _mean_gradients(grads, tree_reduce, weights)
+            else:
+                with tf.device(devices[i % len(devices)]):
+                    grad = _mean_gradients(grads, tree_reduce, weights)
 
             # Keep in mind that the Variables are redundant because they are shared
             # across towers. So .. we will just return the first tower's pointer to
@@ -47,6 +55,42 @@ def average_gradients(tower_grads_and_vars):
     return averaged_grads
 
 
+def _mean_gradients(grads, tree_reduce=False, weights=None):
+    """
+    :param grads: Non-empty list of gradient tensors of the same shape.
+    :param tree_reduce: Bool. Whether to sum pairwise in a binary tree, with each sum on the device of its first
+                        operand.
+    :param weights: List of scalar tensors or None. If not None, 1 weight per gradient for a weighted mean.
+    :return: Tensor.
+    """
+    if len(grads) == 1:
+        return grads[0]
+    scale = 1.0 / len(grads)
+    grads = [tf.convert_to_tensor(g) for g in grads]
+    if weights is not None:
+        # Each gradient is scaled by its share of the total weight on its own device, so the sum is the weighted mean.
+        total_weight = tf.add_n([tf.cast(w, tf.float32) for w in weights])
+        scaled_grads = []
+        for g, w in zip(grads, weights):
+            with tf.device(g.device):
+                scaled_grads.append(g * tf.cast(tf.cast(w, tf.float32) / total_weight, g.dtype))
+        grads = scaled_grads
+        scale = 1.0
+    if tree_reduce:
+        while len(grads) > 1:
+            reduced = []
+            for j in range(0, len(grads) - 1, 2):
+                with tf.device(grads[j].device):
+                    reduced.append(grads[j] + grads[j + 1])
+            if len(grads) % 2 == 1:
+                reduced.append(grads[-1])
+            grads = reduced
+        grad_sum = grads[0]
+    else:
+        grad_sum = tf.add_n(grads)
+    return grad_sum * scale
+
+
 def accumulate_list_into(items, items_list):
     """
     The primary use case of this function is to accumulate multiple lists of tensors into a list of a list of tensors
@@ -106,15 +150,20 @@ class AccumulatingTensorIO:
         self.tensors = []
         self.tensor_type = tensor_type
 
-    def accumulate(self):
+    def accumulate(self, weights=None):
         """
         Accumulates the tensors according to the type.
+        :param weights: List of scalar tensors or None. The weight of each accumulated list of tensors, i.e. the number
+                        of examples of each tower. If not None, AVERAGED_SCALAR types are a weighted average, in which
+                        the scalars of a list with weight 0 (i.e. the NaN loss of an empty batch) are ignored.
         :return: TensorIO.
         """
         tensors = []
         if len(self.tensors) > 0:
             assert isinstance(self.tensors[0], list)
-            if self.tensor_type == TensorIO.AVERAGED_SCALAR:
+            if self.tensor_type == TensorIO.AVERAGED_SCALAR and weights is not None:
+                tensors = [_weighted_mean(item, weights) for item in self.tensors]
+            elif self.tensor_type == TensorIO.AVERAGED_SCALAR:
                 tensors = [tf.reduce_mean(tf.stack(item)) for item in self.tensors]
             elif self.tensor_type == TensorIO.SUMMED_SCALAR:
                 tensors = [tf.reduce_sum(tf.stack(item)) for item in self.tensors]
@@ -132,8 +181,73 @@ class AccumulatingTensorIO:
         accumulate_list_into(to_accumulate, self.tensors)
 
 
+def _weighted_mean(scalars, weights):
+    """
+    :param scalars: List of scalar tensors.
+    :param weights: List of scalar tensors, 1 per scalar. Their sum must be positive.
+    :return: Scalar tensor. The weighted mean, ignoring the scalars with weight 0.
+    """
+    weights = [tf.cast(w, scalar.dtype) for scalar, w in zip(scalars, weights)]
+    weighted_sum = tf.add_n([tf.where(w > 0, scalar * w, tf.zeros_like(scalar)) for scalar, w in zip(scalars, weights)])
+    return weighted_sum / tf.add_n(weights)
+
+
+def create_apply_gradients_op(optimizer, grads_and_vars, global_step, accumulation_steps=1, all_reducer=None):
+    """
+    Creates the op that applies gradients to the variables.
+    If accumulation_steps > 1, each run of the returned op adds the gradients into non-trainable accumulator variables.
+    On every accumulation_steps-th run, the mean of the accumulated gradients is applied, global_step is incremented,
+    and the accumulators are reset to zero. Thus global_step always counts the number of parameter updates.
+    :param optimizer: Tensorflow optimizer.
+    :param grads_and_vars: List of (gradient, variable) tuples. Gradients that are None are ignored.
+    :param global_step: Tensor (variable). Incremented every time the gradients are applied.
+    :param accumulation_steps: Int. Number of micro-batches to accumulate gradients over before applying them.
+    :param all_reducer: RingAllReduce or None. If not None, the gradients are averaged across all worker processes
+                        right before they are applied.
+    :return: Tensorflow op.
+    """
+    assert accumulation_steps >= 1
+    if accumulation_steps == 1:
+        if all_reducer is not None:
+            grads_and_vars = all_reducer.get_all_reduced_gradients(grads_and_vars)
+        return optimizer.apply_gradients(grads_and_vars, global_step=global_step)
+
+    with tf.variable_scope('gradient_accumulation'):
+        grads_and_vars = [(tf.convert_to_tensor(g), v) for g, v in grads_and_vars if g is not None]
+        accumulators = [tf.Variable(tf.zeros(v.get_shape(), dtype=v.dtype.base_dtype), trainable=False,
+                                    name='accumulator_' + str(i)) for i, (_, v) in enumerate(grads_and_vars)]
+        counter = tf.Variable(initial_value=0, trainable=False, dtype=tf.int32, name='counter')
+
+        # apply_gradients would otherwise create the optimizer's slot variables (i.e. the Adam moments and beta powers)
+        # in the tf.cond branch below, where their initializers can't be run. Creating them here is a no-op for
+        # optimizers without slots, and apply_gradients reuses the existing slots.
+        optimizer._create_slots([v for _, v in grads_and_vars])
+
+        accumulate_ops = [tf.assign_add(accumulator, g) for accumulator, (g, _) in zip(accumulators, grads_and_vars)]
+        with tf.control_dependencies(accumulate_ops):
+            num_accumulated = tf.assign_add(counter, 1)
+
+        def _apply():
+            mean_grads_and_vars = [(accumulator.read_value() / float(accumulation_steps), v)
+                                   for accumulator, (_, v) in zip(accumulators, grads_and_vars)]
+            if all_reducer is not None:
+                mean_grads_and_vars = all_reducer.get_all_reduced_gradients(mean_grads_and_vars)
+            apply_op = optimizer.apply_gradients(mean_grads_and_vars, global_step=global_step)
+            with tf.control_dependencies([apply_op]):
+                reset_ops = [tf.assign(accumulator, tf.zeros_like(accumulator)) for accumulator in accumulators]
+                reset_ops.append(tf.assign(counter, 0))
+            with tf.control_dependencies(reset_ops):
+                return tf.constant(True)
+
+        def _skip():
+            return tf.constant(False)
+
+        applied = tf.cond(tf.greater_equal(num_accumulated, accumulation_steps), _apply, _skip)
+        return tf.group(applied, name='accumulate_or_apply_gradients')
+
+
 def _create_train_op_single_device(optimizer, build_network_outputs, batched_network_args, other_network_args,
-                                   available_devices=None, verbose=False):
+                                   available_devices=None, verbose=False, accumulation_steps=1, all_reducer=None):
     """
     See docstring for create_train_op.
     """
@@ -151,13 +265,15 @@ def _create_train_op_single_device(optimizer, build_network_outputs, batched_net
 
     with tf.variable_scope('train'):
         global_step = tf.Variable(initial_value=0, trainable=False, dtype=tf.int32, name='global_step')
-        train_op = optimizer.minimize(outputs['loss'].first(), global_step=global_step)
+        grads_and_vars = optimizer.compute_gradients(outputs['loss'].first())
+        train_op = create_apply_gradients_op(optimizer, grads_and_vars, global_step, accumulation_steps,
+                                             all_reducer)
 
     return train_op, global_step, outputs
 
 
 def create_train_op(optimizer, build_network_outputs, batched_network_args, other_network_args, available_devices=None,
-                    verbose=False):
+                    verbose=False, accumulation_steps=1, all_reducer=None, tower_network_args=None):
     """
     :param optimizer: Tensorflow optimizer. For example, tf.train.AdamOptimizer(3e-4).
     :param build_network_outputs: A callback to build the network's outputs. It is expected that variable sharing is
@@ -178,17 +294,36 @@ def create_train_op(optimizer, build_network_outputs, batched_network_args, othe
                               list, then the function simply returns build_network_outputs(). If this is None, that is
                               the equivalent of using the single default device.
     :param verbose: Bool. Whether to make print statements.
+    :param accumulation_steps: Int. Number of micro-batches (i.e. runs of train_op) to accumulate the tower-averaged
+                               gradients over before applying them. The effective batch size is the batch size of
+                               batched_network_args multiplied by this.
+    :param all_reducer: RingAllReduce or None. If not None, the gradients are also averaged across all worker
+                        processes (see common/utils/distributed.py) before they are applied. All workers must run
+                        train_op in lockstep.
+    :param tower_network_args: List of lists of Tensors, 1 list per device, i.e. from DataSet.get_next_tower_batches().
+                               If not None, these are fed to the towers in place of batched_network_args, which must
+                               then be empty. This avoids slicing one batch on the host, and the sub-batches don't
+                               have to be the same size. The gradients and AVERAGED_SCALAR outputs are then averaged
+                               weighted by the sub-batch sizes, so every example counts the same.
     :return: train_op: Tensorflow op.
-             global_step: Tensor (variable). Int variable incremented every time train_op is run.
+             global_step: Tensor (variable). Int variable incremented every time the gradients are applied. This is
+                          every run of train_op, or every accumulation_steps runs if accumulating gradients.
              output_dict: Dict. This can be treated exactly the same as the return value of build_network_outputs() for
                           one GPU. It is in the following format:
                              key: Str<variable name>
                              value: TensorIO
     """
+    if tower_network_args is not None:
+        assert len(batched_network_args) == 0
+        assert len(tower_network_args) == (1 if available_devices is None else len(available_devices))
+
     # Do single-device version of this function and bypass all the complex accumulating.
     if available_devices is None or len(available_devices) == 1:
+        if tower_network_args is not None:
+            batched_network_args = list(tower_network_args[0])
         return _create_train_op_single_device(optimizer, build_network_outputs, batched_network_args,
-                                              other_network_args, available_devices, verbose)
+                                              other_network_args, available_devices, verbose, accumulation_steps,
+                                             all_reducer)
 
     # Get the number of examples per GPU.
     with tf.name_scope('examples_per_gpu'):
@@ -201,6 +336,8 @@ def create_train_op(optimizer, build_network_outputs, batched_network_args, othe
     # Accumulation variables.
     accumulation_dict = {}
     tower_grads_and_vars = []
+    # Number of examples of each tower, if they can differ.
+    tower_batch_sizes = [] if tower_network_args is not None else None
 
     # Create the towers.
     for i, device in enumerate(available_devices):
@@ -209,7 +346,10 @@ def create_train_op(optimizer, build_network_outputs, batched_network_args, othe
 
         with tf.name_scope('batch_distribution'):
             sub_batched_network_args = []
-            if examples_per_gpu is not None:
+            if tower_network_args is not None:
+                sub_batched_network_args = list(tower_network_args[i])
+                tower_batch_sizes.append(tf.shape(sub_batched_network_args[0])[0])
+            elif examples_per_gpu is not None:
                 start = tf.cast(examples_per_gpu * i, dtype=tf.int32)
                 end = tf.cast(examples_per_gpu * (i + 1), dtype=tf.int32)
                 sub_batched_network_args = [arg[start:end, ...] for arg in batched_network_args]
@@ -234,13 +374,15 @@ def create_train_op(optimizer, build_network_outputs, batched_network_args, othe
     # Create the train op.
     with tf.variable_scope('train'):
         global_step = tf.Variable(initial_value=0, trainable=False, dtype=tf.int32, name='global_step')
-        averaged_grads_and_vars = average_gradients(tower_grads_and_vars)
-        train_op = optimizer.apply_gradients(averaged_grads_and_vars, global_step=global_step)
+        averaged_grads_and_vars = average_gradients(tower_grads_and_vars, devices=available_devices,
+                                                    tower_weights=tower_batch_sizes)
+        train_op = create_apply_gradients_op(optimizer, averaged_grads_and_vars, global_step, accumulation_steps,
+                                             all_reducer)
 
     # Sets the outputs to be the equivalent of a single-gpu output.
     with tf.name_scope('accumulate_outputs'):
         output_dict = {}
         for key, value in accumulation_dict.items():
-            output_dict[key] = value.accumulate()
+            output_dict[key] = value.accumulate(weights=tower_batch_sizes)
 
     return train_op, global_step, output_dict
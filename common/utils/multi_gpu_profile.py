@@ -0,0 +1,80 @@
+import time
+import tensorflow as tf
+from common.utils.multi_gpu import average_gradients
+
+
+def concat_average_gradients(tower_grads_and_vars):
+    """
+    Reference reduction that stacks every tower gradient along a new tower dimension before taking the mean.
+    This is what average_gradients used to do.
+    """
+    averaged_grads = []
+    for grad_and_vars in zip(*tower_grads_and_vars):
+        grads = [tf.expand_dims(g, 0) for g, _ in grad_and_vars if g is not None]
+        if len(grads) != 0:
+            grad = tf.reduce_mean(tf.concat(grads, axis=0), axis=0)
+            averaged_grads.append((grad, grad_and_vars[0][1]))
+    return averaged_grads
+
+
+def get_peak_bytes_per_device(run_metadata):
+    """
+    :param run_metadata: Tensorflow run metadata from a traced session.run.
+    :return: Dict. Key is the device name and value is the peak number of bytes allocated on it.
+    """
+    peak_bytes = {}
+    for dev_stats in run_metadata.step_stats.dev_stats:
+        device_peak = 0
+        for node_stats in dev_stats.node_stats:
+            for memory in node_stats.memory:
+                device_peak = max(device_peak, memory.peak_bytes)
+        peak_bytes[dev_stats.device] = max(peak_bytes.get(dev_stats.device, 0), device_peak)
+    return peak_bytes
+
+
+if __name__ == '__main__':
+    num_devices = 4
+    num_runs = 10
+    warmup_runs = 3
+    # Roughly the shapes of the largest PWC-Net estimator kernels.
+    variable_shapes = [[3, 3, 565, 128], [3, 3, 128, 128], [3, 3, 128, 96], [3, 3, 96, 64]] * 4
+
+    # Simulate multiple devices with CPUs.
+    config = tf.ConfigProto(device_count={'CPU': num_devices})
+    sess = tf.Session(config=config)
+    devices = ['/device:CPU:%d' % i for i in range(num_devices)]
+
+    # Create the tower gradients. Each tower produces its gradients on its own device.
+    variables = [tf.Variable(tf.zeros(shape), name='variable_%d' % i) for i, shape in enumerate(variable_shapes)]
+    tower_grads_and_vars = []
+    for device in devices:
+        with tf.device(device):
+            tower_grads_and_vars.append([(tf.random_normal(shape), variable)
+                                         for shape, variable in zip(variable_shapes, variables)])
+
+    reductions = {
+        'concat_reduce_mean': concat_average_gradients(tower_grads_and_vars),
+        'add_n': average_gradients(tower_grads_and_vars),
+        'add_n_alternating_devices': average_gradients(tower_grads_and_vars, devices=devices),
+        'tree_alternating_devices': average_gradients(tower_grads_and_vars, devices=devices, tree_reduce=True)
+    }
+    sess.run(tf.global_variables_initializer())
+
+    print('%-28s %14s %18s' % ('Reduction', 'Time (ms)', 'Peak memory (MB)'))
+    for name, averaged_grads_and_vars in reductions.items():
+        # The sums are fetched so that the reduction is not pruned away.
+        query = [tf.reduce_sum(grad) for grad, _ in averaged_grads_and_vars]
+        for i in range(warmup_runs):
+            sess.run(query)
+
+        run_metadata = tf.RunMetadata()
+        sess.run(query, options=tf.RunOptions(trace_level=tf.RunOptions.FULL_TRACE), run_metadata=run_metadata)
+        peak_bytes = get_peak_bytes_per_device(run_metadata)
+
+        total_time = 0.0
+        for i in range(num_runs):
+            start = time.time()
+            sess.run(query)
+            total_time += time.time() - start
+        print('%-28s %14.2f %18.2f' % (name, total_time / num_runs * 1000.0, max(peak_bytes.values()) / 1e6))
+    sess.close()
@@ -53,6 +53,38 @@ class TestMultiGPUUtils(unittest.TestCase):
                                                 [2, 2]]), average_grad_1))
         self.assertTrue(np.allclose(np.asarray([[2, 3, 4]]), average_grad_2))
 
+    def test_average_gradients_reduction_equivalence(self):
+        """
+        Tests that all reduction modes match a reference that stacks the tower gradients and takes their mean.
+        """
+        num_towers = 5
+        shapes = [(3, 4), (7,), (2, 2, 3)]
+        devices = self.get_devices_for_testing()
+        grad_tensors = [[tf.placeholder(shape=shape, dtype=tf.float32) for shape in shapes] for _ in range(num_towers)]
+        dummy_vars = [object() for _ in shapes]
+        tower_grads_and_vars = [list(zip(tower_grads, dummy_vars)) for tower_grads in grad_tensors]
+
+        feed_dict = {}
+        for tower_grads in grad_tensors:
+            for grad_tensor, shape in zip(tower_grads, shapes):
+                feed_dict[grad_tensor] = np.random.uniform(-10.0, 10.0, size=shape).astype(np.float32)
+        expected = [np.mean(np.stack([feed_dict[tower_grads[i]] for tower_grads in grad_tensors]), axis=0)
+                    for i in range(len(shapes))]
+
+        for tree_reduce in [False, True]:
+            for reduction_devices in [None, devices]:
+                averaged_grads_and_vars = average_gradients(tower_grads_and_vars, devices=reduction_devices,
+                                                            tree_reduce=tree_reduce)
+                self.assertEqual(len(shapes), len(averaged_grads_and_vars))
+                for i, (_, var) in enumerate(averaged_grads_and_vars):
+                    self.assertEqual(dummy_vars[i], var)
+                    if reduction_devices is not None:
+                        self.assertEqual(reduction_devices[i % len(reduction_devices)],
+                                         averaged_grads_and_vars[i][0].device)
+                averaged = self.sess.run([grad for grad, _ in averaged_grads_and_vars], feed_dict=feed_dict)
+                for i in range(len(shapes)):
+                    self.assertTrue(np.allclose(expected[i], averaged[i], atol=1e-5))
+
     def test_average_gradients_no_grads(self):
         grads_and_vars_gpu0 = []
         grads_and_vars_gpu1 = []
@@ -250,6 +282,189 @@ class TestMultiGPUUtils(unittest.TestCase):
         self.assertAlmostEqual(0.0, loss_per_example[0][0], places=5)
         self.assertAlmostEqual(0.0, loss_per_example[1][0], places=5)
 
+    def test_create_train_op_tower_network_args(self):
+        """
+        Tests that each tower gets its own sub-batch, and that the sub-batches can have different sizes.
+        """
+        devices = self.get_devices_for_testing()
+        tower_batch_sizes = []
+
+        def build_network_outputs(tensor_1, tensor_2, tensor_3):
+            with tf.variable_scope('tower_args_test_scope', reuse=tf.AUTO_REUSE):
+                variable = tf.get_variable('test_variable', shape=(), dtype=tf.float32,
+                                           initializer=tf.constant_initializer(1.0))
+                tower_batch_sizes.append(tensor_1.get_shape().as_list()[0])
+                loss_per_example = tf.expand_dims((tensor_1 + tensor_2) * tensor_3 * variable, axis=-1)
+                loss = tf.reduce_mean(loss_per_example)
+                return {'loss': TensorIO([loss]), 'variable': TensorIO([variable]),
+                        'loss_per_example': TensorIO([loss_per_example], TensorIO.BATCH)}
+
+        # Note this learning rate is set up such that the loss is 0.0 after 1 iteration.
+        optimizer = tf.train.GradientDescentOptimizer(1.0 / 6.0)
+        tower_network_args = [
+            [tf.constant([1.0, 2.0], dtype=tf.float32), tf.constant([2.0, 1.0], dtype=tf.float32)],
+            [tf.constant([3.0], dtype=tf.float32), tf.constant([0.0], dtype=tf.float32)]
+        ]
+        other_network_args = [tf.constant(2.0, dtype=tf.float32)]
+
+        train_op, global_step, output_dict = create_train_op(
+            optimizer, build_network_outputs, [], other_network_args, available_devices=devices,
+            tower_network_args=tower_network_args)
+        self.assertListEqual([2, 1], tower_batch_sizes)
+        self.sess.run(tf.global_variables_initializer())
+
+        loss = self.sess.run(output_dict['loss'].first())
+        self.assertEqual(6.0, loss)
+
+        self.sess.run(train_op)
+        step, loss, variable, loss_per_example = self.sess.run(
+            [global_step, output_dict['loss'].first(), output_dict['variable'].first(),
+             output_dict['loss_per_example'].first()])
+        self.assertAlmostEqual(0.0, loss, places=5)
+        self.assertAlmostEqual(0.0, variable, places=5)
+        self.assertEqual(1, step)
+        self.assertTupleEqual((3, 1), loss_per_example.shape)
+
+    def test_create_train_op_uneven_tower_batches(self):
+        """
+        Tests that towers with sub-batches of different sizes train the same as the full batch on one device, where
+        every example counts the same.
+        """
+        devices = self.get_devices_for_testing()
+
+        def build_network_outputs(tensor_1, tensor_2):
+            with tf.variable_scope('uneven_towers_test_scope', reuse=tf.AUTO_REUSE):
+                variable = tf.get_variable('test_variable', shape=(), dtype=tf.float32,
+                                           initializer=tf.constant_initializer(1.0))
+                loss = tf.reduce_mean((tensor_1 + tensor_2) * variable)
+                return {'loss': TensorIO([loss]), 'variable': TensorIO([variable])}
+
+        # The loss of the full batch is (2 + 4 + 12) / 3 = 6, but the mean of the tower losses is (3 + 12) / 2.
+        # Note this learning rate is set up such that the variable is 0.0 after 1 iteration.
+        optimizer = tf.train.GradientDescentOptimizer(1.0 / 6.0)
+        tower_network_args = [
+            [tf.constant([1.0, 2.0], dtype=tf.float32), tf.constant([1.0, 2.0], dtype=tf.float32)],
+            [tf.constant([6.0], dtype=tf.float32), tf.constant([6.0], dtype=tf.float32)]
+        ]
+        train_op, global_step, output_dict = create_train_op(
+            optimizer, build_network_outputs, [], [], available_devices=devices,
+            tower_network_args=tower_network_args)
+        self.sess.run(tf.global_variables_initializer())
+
+        loss = self.sess.run(output_dict['loss'].first())
+        self.assertAlmostEqual(6.0, loss, places=5)
+
+        self.sess.run(train_op)
+        step, loss, variable = self.sess.run(
+            [global_step, output_dict['loss'].first(), output_dict['variable'].first()])
+        self.assertAlmostEqual(0.0, loss, places=5)
+        self.assertAlmostEqual(0.0, variable, places=5)
+        self.assertEqual(1, step)
+
+    def test_average_gradients_tower_weights(self):
+        grad_tensor_gpu0 = tf.placeholder(shape=(2,), dtype=tf.float32)
+        grad_tensor_gpu1 = tf.placeholder(shape=(2,), dtype=tf.float32)
+        dummy_var = object()
+        for tree_reduce in [False, True]:
+            averaged_grads_and_vars = average_gradients([[(grad_tensor_gpu0, dummy_var)],
+                                                         [(grad_tensor_gpu1, dummy_var)]],
+                                                        tree_reduce=tree_reduce,
+                                                        tower_weights=[tf.constant(3), tf.constant(1)])
+            self.assertEqual(1, len(averaged_grads_and_vars))
+            self.assertEqual(dummy_var, averaged_grads_and_vars[0][1])
+            average_grad = self.sess.run(averaged_grads_and_vars[0][0],
+                                         feed_dict={grad_tensor_gpu0: [4, 0], grad_tensor_gpu1: [0, 4]})
+            self.assertTrue(np.allclose(np.asarray([3, 1]), average_grad))
+
+    def test_accumulating_tensor_io_weighted_average(self):
+        accumulating_tensor_io = AccumulatingTensorIO(TensorIO.AVERAGED_SCALAR)
+        accumulating_tensor_io.add([tf.constant(2.0)])
+        accumulating_tensor_io.add([tf.constant(6.0)])
+        # The scalar of an empty sub-batch is ignored.
+        accumulating_tensor_io.add([tf.constant(np.nan, dtype=tf.float32)])
+        accumulated_io = accumulating_tensor_io.accumulate(weights=[tf.constant(3), tf.constant(1), tf.constant(0)])
+        self.assertAlmostEqual(3.0, self.sess.run(accumulated_io.first()), places=5)
+
+    def test_create_train_op_accumulation_default_device(self):
+        self.create_train_op_accumulation_helper(None)
+
+    def test_create_train_op_accumulation_multiple_devices(self):
+        self.create_train_op_accumulation_helper(self.get_devices_for_testing())
+
+    def create_train_op_accumulation_helper(self, devices):
+        def build_network_outputs(tensor_1, tensor_2, tensor_3):
+            with tf.variable_scope('accumulation_test_scope', reuse=tf.AUTO_REUSE):
+                variable = tf.get_variable('test_variable', shape=(), dtype=tf.float32,
+                                           initializer=tf.constant_initializer(1.0))
+                loss = tf.reduce_mean((tensor_1 + tensor_2) * tensor_3 * variable)
+                return {'loss': TensorIO([loss]), 'variable': TensorIO([variable])}
+
+        # Note this learning rate is set up such that the loss is 0.0 after the gradients are applied once.
+        optimizer = tf.train.GradientDescentOptimizer(1.0 / 6.0)
+        batched_network_args = [tf.constant([1.0, 2.0], dtype=tf.float32), tf.constant([2.0, 1.0], dtype=tf.float32)]
+        other_network_args = [tf.constant(2.0, dtype=tf.float32)]
+
+        train_op, global_step, output_dict = create_train_op(
+            optimizer, build_network_outputs, batched_network_args, other_network_args, available_devices=devices,
+            accumulation_steps=3)
+        self.sess.run(tf.global_variables_initializer())
+
+        # The variable must not change until the gradients of all 3 micro-batches have been accumulated.
+        for i in range(2):
+            self.sess.run(train_op)
+            step, loss, variable = self.sess.run(
+                [global_step, output_dict['loss'].first(), output_dict['variable'].first()])
+            self.assertAlmostEqual(6.0, loss, places=5)
+            self.assertAlmostEqual(1.0, variable, places=5)
+            self.assertEqual(0, step)
+
+        # The mean gradient is the same as the gradient of a single micro-batch.
+        self.sess.run(train_op)
+        step, loss, variable = self.sess.run(
+            [global_step, output_dict['loss'].first(), output_dict['variable'].first()])
+        self.assertAlmostEqual(0.0, loss, places=5)
+        self.assertAlmostEqual(0.0, variable, places=5)
+        self.assertEqual(1, step)
+
+        # The accumulators must have been reset after the update.
+        for i in range(2):
+            self.sess.run(train_op)
+        self.assertEqual(1, self.sess.run(global_step))
+        self.sess.run(train_op)
+        self.assertEqual(2, self.sess.run(global_step))
+
+    def test_create_train_op_accumulation_adam(self):
+        def build_network_outputs(tensor):
+            with tf.variable_scope('adam_accumulation_test_scope', reuse=tf.AUTO_REUSE):
+                variable = tf.get_variable('test_variable', shape=(), dtype=tf.float32,
+                                           initializer=tf.constant_initializer(1.0))
+                return {'loss': TensorIO([tf.reduce_mean(tensor) * variable]), 'variable': TensorIO([variable])}
+
+        micro_batch = tf.placeholder(shape=[2], dtype=tf.float32)
+        optimizer = tf.train.AdamOptimizer(0.1)
+        train_op, global_step, output_dict = create_train_op(optimizer, build_network_outputs, [micro_batch], [],
+                                                             accumulation_steps=2)
+
+        # The Adam slots and beta powers must not be created in the tf.cond branch.
+        self.assertIsNotNone(optimizer.get_slot(output_dict['variable'].first(), 'm'))
+        for variable in tf.global_variables():
+            self.assertIsNone(variable.op._get_control_flow_context(), variable.name)
+
+        # A reference Adam update with the mean gradient of the micro-batches.
+        reference_variable = tf.Variable(1.0, dtype=tf.float32, name='reference_variable')
+        reference_op = tf.train.AdamOptimizer(0.1).apply_gradients([(tf.constant(2.0), reference_variable)])
+        self.sess.run(tf.global_variables_initializer())
+
+        for i in range(2):
+            self.sess.run(train_op, feed_dict={micro_batch: [0.0, 2.0]})
+            self.sess.run(train_op, feed_dict={micro_batch: [2.0, 4.0]})
+            self.sess.run(reference_op)
+            step, variable, reference = self.sess.run([global_step, output_dict['variable'].first(),
+                                                       reference_variable])
+            self.assertEqual(i + 1, step)
+            self.assertAlmostEqual(reference, variable, places=6)
+            self.assertNotAlmostEqual(1.0, variable, places=3)
+
     def test_create_train_op_multiple_devices_unshared_variable_failure(self):
         devices = self.get_devices_for_testing()
         variables = []
@@ -1,12 +1,22 @@
+import json
 import os
+import random
+import re
 import tensorflow as tf
 import time
+from collections import deque
 from tensorflow.python.client import timeline
 from tensorflow.python.profiler.model_analyzer import Profiler, option_builder
 
 
 PROFILE_CMDS = ['code', 'scope', 'graph']
 
+TRACE_LEVELS = {
+    'software': tf.RunOptions.SOFTWARE_TRACE,
+    'hardware': tf.RunOptions.HARDWARE_TRACE,
+    'full': tf.RunOptions.FULL_TRACE
+}
+
 
 def run_profiler(query, feed_dict, num_runs=10, warmup_runs=5, name='profile'):
     """
@@ -129,3 +139,133 @@ def save_timeline(run_metadata, directory, name='', detailed=True):
         chrome_trace = fetched_timeline.generate_chrome_trace_format()
         with open(os.path.join(directory, 'timeline.json'), 'w') as file:
             file.write(chrome_trace)
+
+
+class StepTracer:
+    def __init__(self, directory, sample_rate=0.001, trace_level='software', op_filter=None, top_k=20, max_to_keep=5,
+                 chrome_trace=False, seed=None):
+        """
+        Decides which training steps to trace, and summarizes the traced steps.
+        Usage:
+            run_options, run_metadata = tracer.get_run_options()
+            sess.run(query, options=run_options, run_metadata=run_metadata)
+            if run_metadata is not None:
+                tracer.save(run_metadata, global_step)
+        Every traced step writes <directory>/trace_step<global_step>.json, which has the top_k slowest ops of the step.
+        :param directory: Str. Directory to save the traces into.
+        :param sample_rate: Float. Probability of tracing any given step. 0 disables tracing.
+        :param trace_level: Str. One of the keys of TRACE_LEVELS. 'software' is much cheaper than 'full', which also
+                            records memory and copies.
+        :param op_filter: Str or None. Regex that op names must match to be kept in the traces, i.e. 'pwc_net/.*'.
+        :param top_k: Int. Number of ops in the JSON summary.
+        :param max_to_keep: Int. Number of most recent traced steps to keep the files of.
+        :param chrome_trace: Bool. Whether to also write a Chrome trace (timeline_step<global_step>.json).
+        :param seed: Int or None. Seed of the step sampling.
+        """
+        assert 0.0 <= sample_rate <= 1.0
+        assert trace_level in TRACE_LEVELS, 'trace_level must be one of ' + str(sorted(TRACE_LEVELS.keys()))
+        self.directory = directory
+        self.sample_rate = sample_rate
+        self.trace_level = trace_level
+        self.op_filter = None if op_filter is None else re.compile(op_filter)
+        self.top_k = top_k
+        self.max_to_keep = max_to_keep
+        self.chrome_trace = chrome_trace
+        self.random = random.Random(seed)
+        self.saved_files = deque()
+
+    def get_run_options(self):
+        """
+        Samples whether to trace the next session.run.
+        :return: run_options: Tensorflow RunOptions or None if the step isn't traced.
+                 run_metadata: Tensorflow RunMetadata or None if the step isn't traced.
+        """
+        if self.sample_rate == 0.0 or self.random.random() >= self.sample_rate:
+            return None, None
+        return tf.RunOptions(trace_level=TRACE_LEVELS[self.trace_level]), tf.RunMetadata()
+
+    def save(self, run_metadata, global_step, summary_writer=None):
+        """
+        Writes the files for a traced step and deletes the files of old steps.
+        :param run_metadata: Tensorflow RunMetadata of the traced step.
+        :param global_step: Int.
+        :param summary_writer: Tensorflow FileWriter or None. If not None, the run metadata is also added to it.
+        :return: Dict. The JSON summary.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        step_stats = self._filter_step_stats(run_metadata.step_stats)
+        summary = get_step_summary(step_stats, top_k=self.top_k)
+        summary['global_step'] = int(global_step)
+        summary['trace_level'] = self.trace_level
+
+        files = [os.path.join(self.directory, 'trace_step%d.json' % global_step)]
+        with open(files[0], 'w') as file:
+            json.dump(summary, file, indent=2)
+        if self.chrome_trace:
+            files.append(os.path.join(self.directory, 'timeline_step%d.json' % global_step))
+            fetched_timeline = timeline.Timeline(step_stats, graph=tf.get_default_graph())
+            with open(files[1], 'w') as file:
+                file.write(fetched_timeline.generate_chrome_trace_format())
+        if summary_writer is not None:
+            summary_writer.add_run_metadata(run_metadata, 'step%d' % global_step, global_step=global_step)
+
+        # Rotate the files of old steps.
+        self.saved_files.append(files)
+        while len(self.saved_files) > self.max_to_keep:
+            for old_file in self.saved_files.popleft():
+                if os.path.isfile(old_file):
+                    os.remove(old_file)
+        return summary
+
+    def _filter_step_stats(self, step_stats):
+        """
+        :param step_stats: Tensorflow StepStats.
+        :return: Tensorflow StepStats with only the ops that match op_filter.
+        """
+        if self.op_filter is None:
+            return step_stats
+        filtered = type(step_stats)()
+        for dev_stats in step_stats.dev_stats:
+            filtered_dev_stats = filtered.dev_stats.add(device=dev_stats.device)
+            filtered_dev_stats.node_stats.extend([node_stats for node_stats in dev_stats.node_stats
+                                                  if self.op_filter.match(node_stats.node_name)])
+        return filtered
+
+
+def get_step_summary(step_stats, top_k=20):
+    """
+    Summarizes the op times of a traced step. Ops that ran on more than 1 device or stream are summed up.
+    :param step_stats: Tensorflow StepStats, i.e. run_metadata.step_stats.
+    :param top_k: Int. Number of ops to list.
+    :return: Dict in the following format:
+                 'step_micros': Int. Time from the start of the first op to the end of the last op.
+                 'total_op_micros': Int. Sum of the time of every op.
+                 'top_ops': List of dicts with 'name', 'type', 'devices' and 'micros', slowest first.
+    """
+    op_micros = {}
+    op_types = {}
+    op_devices = {}
+    start_micros = None
+    end_micros = None
+    for dev_stats in step_stats.dev_stats:
+        for node_stats in dev_stats.node_stats:
+            # Device streams append the kernel name, i.e. 'pwc_net/conv:Conv2D'.
+            name = node_stats.node_name.split(':')[0]
+            op_micros[name] = op_micros.get(name, 0) + node_stats.all_end_rel_micros
+            op_devices.setdefault(name, set()).add(dev_stats.device)
+            # The timeline label is in the format 'name = OpType(inputs)'.
+            match = re.match(r'[^=]* = (\w+)\(', node_stats.timeline_label)
+            if match is not None:
+                op_types[name] = match.group(1)
+            op_start = node_stats.all_start_micros
+            op_end = op_start + node_stats.all_end_rel_micros
+            start_micros = op_start if start_micros is None else min(start_micros, op_start)
+            end_micros = op_end if end_micros is None else max(end_micros, op_end)
+
+    top_ops = sorted(op_micros.items(), key=lambda item: item[1], reverse=True)[:top_k]
+    return {
+        'step_micros': 0 if start_micros is None else int(end_micros - start_micros),
+        'total_op_micros': int(sum(op_micros.values())),
+        'top_ops': [{'name': name, 'type': op_types.get(name, ''), 'devices': sorted(op_devices[name]),
+                     'micros': int(micros)} for name, micros in top_ops]
+    }
@@ -0,0 +1,66 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+import tensorflow as tf
+from common.utils.profile import StepTracer, get_step_summary
+
+
+class TestStepTracer(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+        # Fake trace of 3 ops, where 'net/conv' ran on both the CPU and a GPU stream.
+        self.run_metadata = tf.RunMetadata()
+        cpu_stats = self.run_metadata.step_stats.dev_stats.add(device='/device:CPU:0')
+        cpu_stats.node_stats.add(node_name='net/conv', timeline_label='net/conv = Conv2D(a, b)',
+                                 all_start_micros=100, all_end_rel_micros=30)
+        cpu_stats.node_stats.add(node_name='net/add', timeline_label='net/add = Add(c, d)',
+                                 all_start_micros=130, all_end_rel_micros=5)
+        cpu_stats.node_stats.add(node_name='loss/mean', timeline_label='loss/mean = Mean(e, f)',
+                                 all_start_micros=135, all_end_rel_micros=10)
+        gpu_stats = self.run_metadata.step_stats.dev_stats.add(device='/device:GPU:0/stream:all')
+        gpu_stats.node_stats.add(node_name='net/conv:Conv2D', all_start_micros=110, all_end_rel_micros=15)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_step_summary(self):
+        summary = get_step_summary(self.run_metadata.step_stats, top_k=2)
+        self.assertEqual(45, summary['step_micros'])
+        self.assertEqual(60, summary['total_op_micros'])
+        self.assertEqual(2, len(summary['top_ops']))
+        self.assertEqual('net/conv', summary['top_ops'][0]['name'])
+        self.assertEqual('Conv2D', summary['top_ops'][0]['type'])
+        self.assertEqual(45, summary['top_ops'][0]['micros'])
+        self.assertListEqual(['/device:CPU:0', '/device:GPU:0/stream:all'], summary['top_ops'][0]['devices'])
+        self.assertEqual('loss/mean', summary['top_ops'][1]['name'])
+
+    def test_sampling(self):
+        tracer = StepTracer(self.directory, sample_rate=0.0)
+        self.assertTupleEqual((None, None), tracer.get_run_options())
+        tracer = StepTracer(self.directory, sample_rate=1.0, trace_level='full')
+        run_options, run_metadata = tracer.get_run_options()
+        self.assertEqual(tf.RunOptions.FULL_TRACE, run_options.trace_level)
+        self.assertIsInstance(run_metadata, tf.RunMetadata)
+
+        tracer = StepTracer(self.directory, sample_rate=0.25, seed=0)
+        num_traced = sum(tracer.get_run_options()[1] is not None for _ in range(4000))
+        self.assertTrue(800 < num_traced < 1200)
+
+    def test_save_filter_and_rotation(self):
+        tracer = StepTracer(self.directory, sample_rate=1.0, op_filter='net/.*', max_to_keep=2, chrome_trace=True)
+        for step in range(1, 4):
+            tracer.save(self.run_metadata, step)
+
+        self.assertListEqual(['timeline_step2.json', 'timeline_step3.json', 'trace_step2.json', 'trace_step3.json'],
+                             sorted(os.listdir(self.directory)))
+        with open(os.path.join(self.directory, 'trace_step3.json')) as file:
+            summary = json.load(file)
+        self.assertEqual(3, summary['global_step'])
+        self.assertListEqual(['net/conv', 'net/add'], [op['name'] for op in summary['top_ops']])
+
+
+if __name__ == '__main__':
+    unittest.main()
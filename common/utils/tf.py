@@ -1,11 +1,6 @@
-# To resolve some issues with MacOS and matplotlib:
-# https://stackoverflow.com/questions/2512225/matplotlib-plots-not-showing-up-in-mac-osx
-import platform
-if platform.system() == 'Darwin':
-    import matplotlib
-    matplotlib.use('TkAgg')
-from matplotlib import pyplot as plt
 import io
+import queue
+import threading
 import tensorflow as tf
 from tensorflow.python.ops import control_flow_ops
 from tensorflow.python.ops import math_ops
@@ -14,6 +9,11 @@ from tensorflow.python.framework import ops
 from tensorflow.python.training import optimizer
 
 
+# Data formats of image tensors. All models take and return NHWC tensors, and can optionally run in NCHW internally.
+NHWC = 'NHWC'
+NCHW = 'NCHW'
+
+
 def print_tensor_shape(x):
     print(x.get_shape().as_list())
 
@@ -24,6 +24,19 @@ def tf_coin_flip(heads_rate):
     return is_head
 
 
+def l2_regularizer(scale):
+    """
+    Same as tf.contrib.layers.l2_regularizer, without importing Tf contrib, which is slow to import.
+    :param scale: Float.
+    :return: Function that takes a weights tensor and returns scale * sum(weights ** 2) / 2.
+    """
+    def _l2_regularizer(weights):
+        with tf.name_scope('l2_regularizer', values=[weights]) as name:
+            scale_tensor = tf.convert_to_tensor(scale, dtype=weights.dtype.base_dtype, name='scale')
+            return tf.multiply(scale_tensor, tf.nn.l2_loss(weights), name=name)
+    return _l2_regularizer
+
+
 # https://github.com/tensorflow/tensorflow/issues/7712
 def pelu(x):
     """Parametric Exponential Linear Unit (https://arxiv.org/abs/1605.09332v1)."""
@@ -37,20 +50,91 @@ def pelu(x):
 
 
 # https://stackoverflow.com/questions/39975676/how-to-implement-prelu-activation-in-tensorflow
-def prelu(_x):
+def prelu(_x, data_format=NHWC):
     """
     :param _x: Tensor of shape [batch_size, H, W, C].
+    :param data_format: Str. NHWC or NCHW, in which case the shapes are [batch_size, C, H, W].
     :return: Prelu'd tensor of shape [batch_size, H, W, C].
     """
     with tf.variable_scope('activation', initializer=tf.constant_initializer(1.0)):
-        alphas = tf.get_variable('alpha', _x.get_shape()[-1],
+        alphas = tf.get_variable('alpha', _x.get_shape()[get_channel_axis(data_format)],
                                  initializer=tf.constant_initializer(0.0),
                                  dtype=tf.float32)
+        if data_format == NCHW:
+            # The variable has the same shape in both formats. Only its broadcasting differs.
+            alphas = tf.reshape(alphas, [-1, 1, 1])
         pos = tf.nn.relu(_x)
         neg = alphas * (_x - abs(_x)) * 0.5
         return pos + neg
 
 
+def get_channel_axis(data_format):
+    """
+    :param data_format: Str. NHWC or NCHW.
+    :return: Int.
+    """
+    assert data_format in [NHWC, NCHW]
+    return 1 if data_format == NCHW else 3
+
+
+def get_layers_data_format(data_format):
+    """
+    :param data_format: Str. NHWC or NCHW.
+    :return: Str. The equivalent data_format argument of tf.layers.
+    """
+    assert data_format in [NHWC, NCHW]
+    return 'channels_first' if data_format == NCHW else 'channels_last'
+
+
+def get_spatial_shape(tensor, data_format):
+    """
+    :param tensor: Tensor of rank 4.
+    :param data_format: Str. NHWC or NCHW.
+    :return: height, width: Scalar tensors.
+    """
+    shape = tf.shape(tensor)
+    if data_format == NCHW:
+        return shape[2], shape[3]
+    return shape[1], shape[2]
+
+
+def to_data_format(tensor, data_format):
+    """
+    :param tensor: Tensor of shape [batch_size, H, W, C].
+    :param data_format: Str. NHWC or NCHW.
+    :return: Tensor in the data_format.
+    """
+    if data_format == NCHW:
+        return tf.transpose(tensor, [0, 3, 1, 2])
+    return tensor
+
+
+def from_data_format(tensor, data_format):
+    """
+    :param tensor: Tensor in the data_format.
+    :param data_format: Str. NHWC or NCHW.
+    :return: Tensor of shape [batch_size, H, W, C].
+    """
+    if data_format == NCHW:
+        return tf.transpose(tensor, [0, 2, 3, 1])
+    return tensor
+
+
+def resize_bilinear(images, size, data_format=NHWC, name=None):
+    """
+    tf.image.resize_bilinear for both data formats. It only has an NHWC kernel, so NCHW images are transposed around it.
+    :param images: Tensor of rank 4 in the data_format.
+    :param size: Height and width to resize to.
+    :param data_format: Str. NHWC or NCHW.
+    :param name: Str or None.
+    :return: Tensor in the data_format.
+    """
+    if data_format == NCHW:
+        resized = tf.image.resize_bilinear(from_data_format(images, data_format), size)
+        return tf.identity(to_data_format(resized, data_format), name=name)
+    return tf.image.resize_bilinear(images, size, name=name)
+
+
 def sliding_window_slice(x, slice_locations):
     """
     :param x: The tensor to window slice.
@@ -117,6 +201,26 @@ def optimistic_restore(session, save_file):
     saver.restore(session, save_file)
 
 
+def strict_restore(session, save_file, var_list=None):
+    """
+    Unlike optimistic_restore, every variable must be in the checkpoint with the same shape, so that a checkpoint of a
+    different configuration (i.e. another ContextInterp preset) fails rather than leaving variables at their initial
+    values.
+    :param session: Tf session.
+    :param save_file: Str. Checkpoint path.
+    :param var_list: List of variables to restore, or None for all global variables.
+    :return: Nothing.
+    """
+    if var_list is None:
+        var_list = tf.global_variables()
+    saved_shapes = tf.train.NewCheckpointReader(save_file).get_variable_to_shape_map()
+    mismatched = [var.op.name for var in var_list if saved_shapes.get(var.op.name) != var.get_shape().as_list()]
+    assert len(mismatched) == 0, 'Variables missing from ' + save_file + ' or of another shape: ' + \
+        ', '.join(sorted(mismatched)) + '.'
+    saver = tf.train.Saver(var_list)
+    saver.restore(session, save_file)
+
+
 # Mostly copied from: https://gist.github.com/gyglim/1f8dfb1b5c82627ae3efcfbbadb9f514#file-tensorboard_logging-py-L41
 class Logger(object):
     """Logging in tensorboard without tensorflow ops."""
@@ -125,6 +229,11 @@ class Logger(object):
         """Creates a summary writer logging to log_dir."""
         self.writer = tf.summary.FileWriter(log_dir, graph)
 
+        # Images are encoded on a background thread so that logging them doesn't stall training.
+        self.image_queue = queue.Queue()
+        self.image_thread = threading.Thread(target=self._write_images, daemon=True)
+        self.image_thread.start()
+
     def log_scalar(self, tag, value, step):
         """Log a scalar variable.
         Parameter
@@ -141,27 +250,54 @@ class Logger(object):
         self.writer.flush()
 
     def log_images(self, tag, images, step):
-        """Logs a list of images."""
-
-        im_summaries = []
-        for nr, img in enumerate(images):
-            # Write the image to a string
-            s = io.BytesIO()
-            plt.imsave(s, img, format='png')
-
-            # Create an Image object
-            img_sum = tf.Summary.Image(encoded_image_string=s.getvalue(),
-                                       height=img.shape[0],
-                                       width=img.shape[1])
-            # Create a Summary value
-            im_summaries.append(tf.Summary.Value(tag='%s/%d' % (tag, nr),
-                                                 image=img_sum))
-
-        # Create and write Summary
-        summary = tf.Summary(value=im_summaries)
-        self.writer.add_summary(summary, step)
+        """Logs a list of images. They are encoded and written in the background, see flush()."""
+        self.image_queue.put((tag, images, step))
+
+    def flush(self):
+        """Waits until all logged images are written."""
+        self.image_queue.join()
         self.writer.flush()
 
+    def close(self):
+        """Writes the remaining logged images, then stops the background thread and closes the writer."""
+        self.image_queue.put(None)
+        self.image_thread.join()
+        self.writer.close()
+
+    def _write_images(self):
+        while True:
+            item = self.image_queue.get()
+            if item is None:
+                # Sent by close() after all the images that were logged before it.
+                self.image_queue.task_done()
+                return
+            tag, images, step = item
+            try:
+                # Only needs matplotlib's image writer, which doesn't pull in pyplot or a GUI backend.
+                import matplotlib.image
+                im_summaries = []
+                for nr, img in enumerate(images):
+                    # Write the image to a string
+                    s = io.BytesIO()
+                    matplotlib.image.imsave(s, img, format='png')
+
+                    # Create an Image object
+                    img_sum = tf.Summary.Image(encoded_image_string=s.getvalue(),
+                                               height=img.shape[0],
+                                               width=img.shape[1])
+                    # Create a Summary value
+                    im_summaries.append(tf.Summary.Value(tag='%s/%d' % (tag, nr),
+                                                         image=img_sum))
+
+                # Create and write Summary
+                summary = tf.Summary(value=im_summaries)
+                self.writer.add_summary(summary, step)
+            except Exception as e:
+                # Keep the thread alive so that flush() doesn't wait forever.
+                print('Failed to log images for', tag + ':', e)
+            finally:
+                self.image_queue.task_done()
+
     def add_run_metadata(self, run_metadata, global_step):
         self.writer.add_run_metadata(run_metadata, 'step%d' % global_step, global_step=global_step)
 
@@ -1,3 +1,7 @@
+import numpy as np
+import os
+import shutil
+import tempfile
 import unittest
 from common.utils.tf import *
 
@@ -53,6 +57,90 @@ class TestTfUtils(unittest.TestCase):
         sliced_list = self.sess.run(sliced).tolist()
         self.assertListEqual(sliced_list, expected)
 
+    def test_l2_regularizer(self):
+        weights = tf.constant([[1.0, 2.0], [-3.0, 0.5]])
+        loss = l2_regularizer(0.1)(weights)
+        # 0.1 * (1 + 4 + 9 + 0.25) / 2.
+        self.assertAlmostEqual(0.7125, self.sess.run(loss), places=6)
+
+    def test_data_format(self):
+        self.assertEqual(3, get_channel_axis(NHWC))
+        self.assertEqual(1, get_channel_axis(NCHW))
+        self.assertEqual('channels_first', get_layers_data_format(NCHW))
+
+        images = np.random.rand(2, 4, 6, 3).astype(np.float32)
+        images_nchw = to_data_format(tf.constant(images), NCHW)
+        height, width = get_spatial_shape(images_nchw, NCHW)
+        resized = resize_bilinear(tf.constant(images), [8, 12])
+        resized_nchw = resize_bilinear(images_nchw, [8, 12], data_format=NCHW)
+        results = self.sess.run([images_nchw, height, width, from_data_format(images_nchw, NCHW), resized,
+                                 from_data_format(resized_nchw, NCHW)])
+        self.assertTupleEqual((2, 3, 4, 6), results[0].shape)
+        self.assertListEqual([4, 6], results[1:3])
+        self.assertTrue(np.array_equal(images, results[3]))
+        self.assertTrue(np.allclose(results[4], results[5]))
+
+    def test_prelu_data_format(self):
+        features = np.random.rand(2, 4, 6, 3).astype(np.float32) - 0.5
+        with tf.variable_scope('prelu_nhwc'):
+            output = prelu(tf.constant(features))
+        with tf.variable_scope('prelu_nchw'):
+            output_nchw = prelu(to_data_format(tf.constant(features), NCHW), data_format=NCHW)
+        alphas = [var for var in tf.global_variables() if var.name.startswith('prelu_')]
+        self.assertEqual(2, len(alphas))
+        self.sess.run(tf.global_variables_initializer())
+        for alpha in alphas:
+            self.assertListEqual([3], alpha.get_shape().as_list())
+            self.sess.run(alpha.assign([0.1, 0.2, 0.3]))
+        results = self.sess.run([output, from_data_format(output_nchw, NCHW)])
+        self.assertTrue(np.allclose(results[0], results[1]))
+        self.assertFalse(np.allclose(results[0], np.maximum(features, 0.0)))
+
+    def test_strict_restore(self):
+        directory = tempfile.mkdtemp()
+        save_file = os.path.join(directory, 'model.ckpt')
+        graph = tf.Graph()
+        with graph.as_default(), tf.Session() as session:
+            tf.Variable([1.0, 2.0], name='a')
+            tf.Variable([3.0, 4.0], name='b')
+            session.run(tf.global_variables_initializer())
+            tf.train.Saver().save(session, save_file)
+
+        def _restore(shapes):
+            graph = tf.Graph()
+            with graph.as_default(), tf.Session() as session:
+                variables = [tf.Variable(np.zeros(shape, dtype=np.float32), name=name)
+                             for name, shape in sorted(shapes.items())]
+                session.run(tf.global_variables_initializer())
+                strict_restore(session, save_file)
+                return session.run(variables)
+
+        self.assertTrue(np.allclose([[1.0, 2.0], [3.0, 4.0]], _restore({'a': [2], 'b': [2]})))
+        # A subset of the checkpoint is fine, but missing variables and other shapes are not.
+        self.assertTrue(np.allclose([[1.0, 2.0]], _restore({'a': [2]})))
+        with self.assertRaises(AssertionError):
+            _restore({'a': [2], 'c': [2]})
+        with self.assertRaises(AssertionError):
+            _restore({'a': [3], 'b': [2]})
+        shutil.rmtree(directory)
+
+    def test_logger_close(self):
+        directory = tempfile.mkdtemp()
+        logger = Logger(directory, None)
+        images = np.random.rand(2, 4, 6, 3).astype(np.float32)
+        for step in range(3):
+            logger.log_images('images', images, step)
+        # Closing must write the images that are still queued, without a flush.
+        logger.close()
+        self.assertFalse(logger.image_thread.is_alive())
+
+        tags = []
+        for event_file in os.listdir(directory):
+            for event in tf.train.summary_iterator(os.path.join(directory, event_file)):
+                tags += [value.tag for value in event.summary.value if value.HasField('image')]
+        self.assertListEqual(['images/0', 'images/1'] * 3, tags)
+        shutil.rmtree(directory)
+
 
 if __name__ == '__main__':
     unittest.main()
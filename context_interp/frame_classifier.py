@@ -0,0 +1,139 @@
+import numpy as np
+
+
+# Classes of image pairs. Only MOTION pairs need ContextInterp. For STATIC pairs a blend is as good, and across a CUT
+# there is no motion to interpolate, so a frame is duplicated.
+STATIC = 'static'
+CUT = 'cut'
+MOTION = 'motion'
+
+
+class FrameClassifier:
+    def __init__(self, downsample_factor=8, static_threshold=0.02, cut_threshold=0.5, num_histogram_bins=32,
+                 max_static_flow=0.5):
+        """
+        Cheaply classifies image pairs ahead of interpolation, from downsampled images.
+        :param downsample_factor: Int. The images are averaged over blocks of this size before they are compared, which
+                                  also averages out the noise.
+        :param static_threshold: Float. A pair is static if no block differs by more than this on average (for images
+                                 between [0, 1]).
+        :param cut_threshold: Float between [0, 1]. A pair is a cut if the distance of its color histograms is above
+                              this.
+        :param num_histogram_bins: Int. Number of histogram bins per color channel.
+        :param max_static_flow: Float. If a coarse flow is available, a pair is only static if its motion is also below
+                                this many pixels everywhere. This catches slow motion of low contrast content. The
+                                coarse flow alone can't make a pair static, because it misses small moving objects.
+        """
+        self.downsample_factor = downsample_factor
+        self.static_threshold = static_threshold
+        self.cut_threshold = cut_threshold
+        self.num_histogram_bins = num_histogram_bins
+        self.max_static_flow = max_static_flow
+
+    def classify(self, image_a, image_b, get_coarse_flow=None):
+        """
+        :param image_a: Np array of shape [H, W, C]. Values between [0, 1].
+        :param image_b: Np array of shape [H, W, C]. Values between [0, 1].
+        :param get_coarse_flow: Function that returns the flow from a to b as an np array of shape [h, w, 2] in pixels
+                                of the images, at any resolution (i.e. the level 6 flow of PWCNet), or None. It is only
+                                called to confirm a pair that the images show as static.
+        :return: Str. STATIC, CUT or MOTION.
+        """
+        small_a = self._downsample(image_a)
+        small_b = self._downsample(image_b)
+        if self.get_histogram_distance(small_a, small_b) > self.cut_threshold:
+            return CUT
+        if self.get_block_difference(small_a, small_b) >= self.static_threshold:
+            return MOTION
+        if get_coarse_flow is not None:
+            coarse_flow = get_coarse_flow()
+            if np.max(np.sum(np.square(coarse_flow), axis=-1)) >= self.max_static_flow ** 2:
+                return MOTION
+        return STATIC
+
+    def get_block_difference(self, small_a, small_b):
+        """
+        :param small_a: Np array of shape [h, w, C]. Downsampled image a.
+        :param small_b: Np array of shape [h, w, C]. Downsampled image b.
+        :return: Float. Largest absolute difference between the blocks, averaged over the channels.
+        """
+        return float(np.max(np.mean(np.abs(small_a - small_b), axis=-1)))
+
+    def get_histogram_distance(self, small_a, small_b):
+        """
+        :param small_a: Np array of shape [h, w, C]. Downsampled image a.
+        :param small_b: Np array of shape [h, w, C]. Downsampled image b.
+        :return: Float between [0, 1]. Half the L1 distance of the normalized histograms, averaged over the channels.
+                 0 for the same colors, and 1 for colors that don't overlap at all.
+        """
+        num_channels = small_a.shape[-1]
+        distance = 0.0
+        for channel in range(num_channels):
+            histogram_a, _ = np.histogram(small_a[..., channel], bins=self.num_histogram_bins, range=(0.0, 1.0))
+            histogram_b, _ = np.histogram(small_b[..., channel], bins=self.num_histogram_bins, range=(0.0, 1.0))
+            histogram_a = histogram_a / max(np.sum(histogram_a), 1)
+            histogram_b = histogram_b / max(np.sum(histogram_b), 1)
+            distance += 0.5 * float(np.sum(np.abs(histogram_a - histogram_b)))
+        return distance / num_channels
+
+    def _downsample(self, image):
+        """
+        :param image: Np array of shape [H, W, C].
+        :return: Np array of shape [H / downsample_factor, W / downsample_factor, C]. The block means. Partial blocks
+                 at the bottom and right are left out.
+        """
+        height, width, num_channels = image.shape
+        factor = min(self.downsample_factor, height, width)
+        height, width = height // factor, width // factor
+        blocks = image[:height * factor, :width * factor].astype(np.float32)
+        return blocks.reshape(height, factor, width, factor, num_channels).mean(axis=(1, 3))
+
+
+def get_skipped_interpolation(image_a, image_b, pair_class, t=0.5):
+    """
+    :param image_a: Np array of shape [H, W, C].
+    :param image_b: Np array of shape [H, W, C].
+    :param pair_class: Str. STATIC or CUT.
+    :param t: Float. The interpolation point (i.e 0 for image_a, 1 for image_b).
+    :return: Np array of shape [H, W, C]. A blend of a STATIC pair, or the nearest frame of a CUT.
+    """
+    assert pair_class in [STATIC, CUT]
+    if pair_class == STATIC:
+        return (1.0 - t) * image_a + t * image_b
+    return image_a if t < 0.5 else image_b
+
+
+class ClassificationStatistics:
+    def __init__(self):
+        """
+        Counts how many pairs of a clip took every path, and how much inference time went into the interpolated ones.
+        """
+        self.counts = {STATIC: 0, CUT: 0, MOTION: 0}
+        self.inference_time = 0.0
+
+    def add(self, pair_class, inference_time=0.0):
+        """
+        :param pair_class: Str. STATIC, CUT or MOTION.
+        :param inference_time: Float. Seconds spent on interpolating the pair.
+        :return: Nothing.
+        """
+        self.counts[pair_class] += 1
+        self.inference_time += inference_time
+
+    def get_num_pairs(self):
+        return sum(self.counts.values())
+
+    def get_skipped_fraction(self):
+        """
+        :return: Float. Fraction of the pairs that didn't need interpolating.
+        """
+        return 1.0 - self.counts[MOTION] / max(self.get_num_pairs(), 1)
+
+    def get_saved_time(self):
+        """
+        :return: Float. Estimated seconds of inference that were skipped, from the average time of the interpolated
+                 pairs.
+        """
+        if self.counts[MOTION] == 0:
+            return 0.0
+        return self.inference_time / self.counts[MOTION] * (self.counts[STATIC] + self.counts[CUT])
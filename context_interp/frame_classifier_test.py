@@ -0,0 +1,69 @@
+import unittest
+import numpy as np
+from context_interp.frame_classifier import FrameClassifier, ClassificationStatistics, get_skipped_interpolation, \
+    STATIC, CUT, MOTION
+
+
+class TestFrameClassifier(unittest.TestCase):
+    def setUp(self):
+        self.classifier = FrameClassifier(downsample_factor=8, static_threshold=0.02, cut_threshold=0.5)
+        rng = np.random.RandomState(0)
+        # A smooth gradient background with a bright square on it.
+        self.image_a = np.tile(np.linspace(0.2, 0.6, 128, dtype=np.float32)[np.newaxis, :, np.newaxis], [96, 1, 3])
+        self.image_a[32:64, 32:64] = 1.0
+        self.noise = rng.normal(scale=0.01, size=self.image_a.shape).astype(np.float32)
+
+    def test_static(self):
+        # Sensor noise averages out over the blocks.
+        image_b = np.clip(self.image_a + self.noise, 0.0, 1.0)
+        self.assertEqual(STATIC, self.classifier.classify(self.image_a, image_b))
+
+    def test_motion(self):
+        image_b = np.roll(self.image_a, 8, axis=1)
+        self.assertEqual(MOTION, self.classifier.classify(self.image_a, image_b))
+
+        # A coarse flow without motion can't make the pair static, since it can miss small moving objects.
+        self.assertEqual(MOTION, self.classifier.classify(self.image_a, image_b,
+                                                          get_coarse_flow=lambda: np.full((2, 2, 2), 0.1)))
+
+        # Motion in the coarse flow overrules the images.
+        image_b = np.clip(self.image_a + self.noise, 0.0, 1.0)
+        self.assertEqual(MOTION, self.classifier.classify(self.image_a, image_b,
+                                                          get_coarse_flow=lambda: np.full((2, 2, 2), 4.0)))
+        self.assertEqual(STATIC, self.classifier.classify(self.image_a, image_b,
+                                                          get_coarse_flow=lambda: np.full((2, 2, 2), 0.1)))
+
+    def test_cut(self):
+        image_b = np.zeros_like(self.image_a)
+        image_b[..., 2] = 0.9
+        self.assertEqual(CUT, self.classifier.classify(self.image_a, image_b))
+
+        # The coarse flow isn't needed for a cut.
+        def _get_coarse_flow():
+            raise AssertionError('The coarse flow should not be computed.')
+        self.assertEqual(CUT, self.classifier.classify(self.image_a, image_b, get_coarse_flow=_get_coarse_flow))
+
+    def test_histogram_distance(self):
+        self.assertAlmostEqual(0.0, self.classifier.get_histogram_distance(self.image_a, self.image_a))
+        self.assertAlmostEqual(1.0, self.classifier.get_histogram_distance(np.zeros((4, 4, 3)), np.ones((4, 4, 3))))
+
+    def test_skipped_interpolation(self):
+        image_b = np.ones_like(self.image_a)
+        blended = get_skipped_interpolation(self.image_a, image_b, STATIC, t=0.25)
+        self.assertTrue(np.allclose(0.75 * self.image_a + 0.25, blended))
+        self.assertIs(self.image_a, get_skipped_interpolation(self.image_a, image_b, CUT, t=0.25))
+        self.assertIs(image_b, get_skipped_interpolation(self.image_a, image_b, CUT, t=0.75))
+
+    def test_statistics(self):
+        statistics = ClassificationStatistics()
+        statistics.add(MOTION, inference_time=2.0)
+        statistics.add(MOTION, inference_time=4.0)
+        statistics.add(STATIC)
+        statistics.add(CUT)
+        self.assertEqual(4, statistics.get_num_pairs())
+        self.assertAlmostEqual(0.5, statistics.get_skipped_fraction())
+        self.assertAlmostEqual(6.0, statistics.get_saved_time())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,192 @@
+import numpy as np
+import tensorflow as tf
+
+
+# Node names of the inputs and the output of a frozen ContextInterp graph.
+IMAGE_A = 'image_a'
+IMAGE_B = 'image_b'
+T = 't'
+INTERPOLATED = 'interpolated'
+# Graph transforms applied after freezing. The stop_gradients aren't built for inference, but PWCNet and the warps can
+# still have some. The batch norms are removed by fold_batch_norms beforehand, since the fold_batch_norms and
+# fold_old_batch_norms transforms only match a batch norm right after a Conv2D, while tf.layers.conv2d adds a BiasAdd.
+TRANSFORMS = ['remove_nodes(op=StopGradient)', 'fold_constants(ignore_errors=true)']
+# Ops of the inference-mode batch norms that fold_batch_norms removes.
+BATCH_NORM_OPS = ['FusedBatchNorm', 'FusedBatchNormV2', 'FusedBatchNormV3']
+
+
+def freeze_context_interp(model, restore_weights, height=None, width=None):
+    """
+    Builds an inference-only ContextInterp (see get_forward with training=False) in a new graph, restores its weights,
+    and freezes everything, including PWCNet and the VGG19 features, into a single GraphDef. Its inputs are the
+    placeholders IMAGE_A, IMAGE_B and T, and its output is INTERPOLATED. The batch norms of a GridNet with
+    use_batch_norm are folded away (see fold_batch_norms).
+    :param model: ContextInterp.
+    :param restore_weights: Function that takes the session and restores the weights of the model, after the variables
+                            are initialized. The output tensor can be fetched from the session's graph by the name
+                            INTERPOLATED + ':0'.
+    :param height: Int or None. Static input height, which lets more shapes be inferred. None for any height.
+    :param width: Int or None. Static input width, which lets more shapes be inferred. None for any width.
+    :return: Tf GraphDef.
+    """
+    graph = tf.Graph()
+    with graph.as_default():
+        image_a = tf.placeholder(shape=[None, height, width, 3], dtype=tf.float32, name=IMAGE_A)
+        image_b = tf.placeholder(shape=[None, height, width, 3], dtype=tf.float32, name=IMAGE_B)
+        t = tf.placeholder(shape=[], dtype=tf.float32, name=T)
+        interpolated, _, _, _, _ = model.get_forward(image_a, image_b, t, training=False)
+        tf.identity(interpolated, name=INTERPOLATED)
+
+        config = tf.ConfigProto()
+        config.gpu_options.allow_growth = True
+        with tf.Session(config=config) as session:
+            session.run(tf.global_variables_initializer())
+            restore_weights(session)
+            # Only the subgraph of the output is kept, so the training ops (i.e. the PWCNet assign ops) are dropped.
+            graph_def = tf.graph_util.convert_variables_to_constants(session, graph.as_graph_def(), [INTERPOLATED])
+    graph_def = fold_batch_norms(graph_def, [INTERPOLATED])
+
+    # Imported on first use, like the other optional Tf modules.
+    from tensorflow.tools.graph_transforms import TransformGraph
+    return TransformGraph(graph_def, [IMAGE_A, IMAGE_B, T], [INTERPOLATED], TRANSFORMS)
+
+
+def fold_batch_norms(graph_def, output_names):
+    """
+    Removes the inference-mode batch norms of a frozen graph. A batch norm that follows a Conv2D and its BiasAdd (as
+    tf.layers.conv2d builds them) is folded into their weights. The others become a Mul and an Add by constants.
+    :param graph_def: Tf GraphDef whose variables were converted to constants.
+    :param output_names: List of str. Names of the output nodes. The weights that aren't needed for them anymore are
+                         dropped.
+    :return: Tf GraphDef.
+    """
+    folded = tf.GraphDef()
+    folded.CopyFrom(graph_def)
+    nodes = {node.name: node for node in folded.node}
+    num_consumers = {}
+    for node in folded.node:
+        for input_name in node.input:
+            input_node_name = _get_node_name(input_name)
+            num_consumers[input_node_name] = num_consumers.get(input_node_name, 0) + 1
+    # Inputs that use any output but the first one (i.e. the batch statistics of a batch norm).
+    other_outputs = set(_get_node_name(input_name) for node in folded.node for input_name in node.input
+                        if ':' in input_name and not input_name.endswith(':0'))
+
+    def _add_const(name, value):
+        const = folded.node.add()
+        const.op = 'Const'
+        const.name = name
+        const.attr['dtype'].type = tf.float32.as_datatype_enum
+        const.attr['value'].tensor.CopyFrom(tf.make_tensor_proto(value.astype(np.float32)))
+        return name
+
+    def _replace(node, op, inputs):
+        node.op = op
+        node.ClearField('input')
+        node.input.extend(inputs)
+        node.ClearField('attr')
+        node.attr['T'].type = tf.float32.as_datatype_enum
+
+    for node in list(folded.node):
+        if node.op not in BATCH_NORM_OPS or node.attr['is_training'].b or node.name in other_outputs:
+            continue
+        scale, offset, mean, variance = [_get_const_value(nodes, input_name) for input_name in node.input[1:5]]
+        if scale is None or offset is None or mean is None or variance is None:
+            continue
+        multiplier = scale / np.sqrt(variance + node.attr['epsilon'].f)
+        bias = offset - mean * multiplier
+
+        bias_add = nodes.get(_get_node_name(node.input[0]))
+        conv = None
+        if bias_add is not None and bias_add.op == 'BiasAdd' and num_consumers[bias_add.name] == 1:
+            conv = nodes.get(_get_node_name(bias_add.input[0]))
+        if conv is not None and conv.op == 'Conv2D' and num_consumers[conv.name] == 1:
+            conv_filter = _get_const_value(nodes, conv.input[1])
+            conv_bias = _get_const_value(nodes, bias_add.input[1])
+            if conv_filter is not None and conv_bias is not None:
+                # The filter is [kernel H, kernel W, input channels, output channels] in either data format.
+                conv.input[1] = _add_const(conv.name + '/folded_filter', conv_filter * multiplier)
+                bias_add.input[1] = _add_const(bias_add.name + '/folded_bias', conv_bias * multiplier + bias)
+                _replace(node, 'Identity', [bias_add.name])
+                continue
+
+        # The batch norm's name is kept for the Add, so that its consumers don't change.
+        shape = [-1, 1, 1] if node.attr['data_format'].s == b'NCHW' else [-1]
+        mul = folded.node.add()
+        mul.name = node.name + '/mul'
+        _replace(mul, 'Mul', [node.input[0], _add_const(node.name + '/multiplier', multiplier.reshape(shape))])
+        _replace(node, 'Add', [mul.name, _add_const(node.name + '/bias', bias.reshape(shape))])
+    return tf.graph_util.extract_sub_graph(folded, output_names)
+
+
+def _get_node_name(input_name):
+    """
+    :param input_name: Str. An input of a NodeDef, i.e. 'name', 'name:1' or '^name'.
+    :return: Str. The name of the node.
+    """
+    return input_name.lstrip('^').split(':')[0]
+
+
+def _get_const_value(nodes, input_name):
+    """
+    :param nodes: Dict. Key is the node name and value is the NodeDef.
+    :param input_name: Str. An input of a NodeDef.
+    :return: Np array, or None if the input isn't a constant (possibly behind Identity ops).
+    """
+    node = nodes.get(_get_node_name(input_name))
+    while node is not None and node.op == 'Identity':
+        node = nodes.get(_get_node_name(node.input[0]))
+    if node is None or node.op != 'Const':
+        return None
+    return tf.make_ndarray(node.attr['value'].tensor)
+
+
+def write_frozen_graph(graph_def, file_path):
+    """
+    :param graph_def: Tf GraphDef.
+    :param file_path: Str. Path of the .pb file.
+    :return: Nothing.
+    """
+    with tf.gfile.GFile(file_path, 'wb') as file:
+        file.write(graph_def.SerializeToString())
+
+
+class FrozenContextInterp:
+    def __init__(self, file_path, session_config=None):
+        """
+        Loads a GraphDef that was written by write_frozen_graph into its own graph and session.
+        Usage:
+            model = FrozenContextInterp('context_interp.pb')
+            interpolated = model.run(images_a, images_b, t=0.5)
+        :param file_path: Str. Path of the .pb file.
+        :param session_config: Tf ConfigProto or None.
+        """
+        graph_def = tf.GraphDef()
+        with tf.gfile.GFile(file_path, 'rb') as file:
+            graph_def.ParseFromString(file.read())
+
+        self.graph = tf.Graph()
+        with self.graph.as_default():
+            tf.import_graph_def(graph_def, name='')
+        if session_config is None:
+            session_config = tf.ConfigProto()
+            session_config.gpu_options.allow_growth = True
+        self.session = tf.Session(graph=self.graph, config=session_config)
+        self.image_a = self.graph.get_tensor_by_name(IMAGE_A + ':0')
+        self.image_b = self.graph.get_tensor_by_name(IMAGE_B + ':0')
+        self.t = self.graph.get_tensor_by_name(T + ':0')
+        self.interpolated = self.graph.get_tensor_by_name(INTERPOLATED + ':0')
+        self.run_fn = self.session.make_callable(self.interpolated, feed_list=[self.image_a, self.image_b, self.t])
+
+    def run(self, images_a, images_b, t=0.5):
+        """
+        :param images_a: Np array of shape [batch_size, H, W, 3]. H and W must be valid for the exported model (see
+                         ContextInterp.get_size_multiple and InputAdapter).
+        :param images_b: Np array of shape [batch_size, H, W, 3].
+        :param t: Float. The interpolation point (i.e 0 for image_a, 1 for image_b).
+        :return: Np array of shape [batch_size, H, W, 3].
+        """
+        return self.run_fn(images_a, images_b, t)
+
+    def close(self):
+        self.session.close()
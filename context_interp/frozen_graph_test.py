@@ -0,0 +1,107 @@
+import os
+import numpy as np
+import tensorflow as tf
+import unittest
+from common.utils.data import silently_remove_file
+from context_interp.frozen_graph import freeze_context_interp, write_frozen_graph, fold_batch_norms, \
+    FrozenContextInterp, INTERPOLATED, IMAGE_A, IMAGE_B, T, BATCH_NORM_OPS
+from context_interp.model import ContextInterp
+
+
+class TestFrozenGraph(unittest.TestCase):
+    def setUp(self):
+        self.file_path = os.path.join('context_interp', 'test_frozen_context_interp.pb')
+
+    def test_freeze(self):
+        self._test_freeze(ContextInterp())
+
+    def test_freeze_batch_norm(self):
+        graph_def = self._test_freeze(ContextInterp(name='batch_norm_context_interp', use_batch_norm=True))
+        op_types = set(node.op for node in graph_def.node)
+        for op_type in BATCH_NORM_OPS:
+            self.assertNotIn(op_type, op_types)
+
+    def test_fold_batch_norms(self):
+        graph = tf.Graph()
+        with graph.as_default():
+            inputs = tf.placeholder(shape=[None, 16, 16, 3], dtype=tf.float32)
+            # One batch norm follows a convolution and is folded into it. The other one can only become a Mul and an
+            # Add.
+            conv_output = tf.layers.conv2d(inputs, 8, [3, 3], padding='SAME')
+            conv_output = tf.layers.batch_normalization(conv_output)
+            inputs_output = tf.layers.batch_normalization(inputs)
+            tf.concat([conv_output, inputs_output], axis=-1, name='output')
+
+            with tf.Session() as session:
+                session.run(tf.global_variables_initializer())
+                # Batch statistics and parameters that aren't the identity.
+                for var in tf.global_variables():
+                    session.run(var.assign(np.random.uniform(0.5, 1.5, size=var.shape.as_list())))
+                image = np.random.rand(2, 16, 16, 3).astype(np.float32)
+                expected = session.run('output:0', feed_dict={inputs: image})
+                graph_def = tf.graph_util.convert_variables_to_constants(session, graph.as_graph_def(), ['output'])
+
+        op_types = [node.op for node in graph_def.node]
+        self.assertEqual(2, sum(op_types.count(op_type) for op_type in BATCH_NORM_OPS))
+        folded_graph_def = fold_batch_norms(graph_def, ['output'])
+        folded_op_types = [node.op for node in folded_graph_def.node]
+        for op_type in BATCH_NORM_OPS:
+            self.assertNotIn(op_type, folded_op_types)
+        self.assertEqual(1, folded_op_types.count('Mul'))
+        self.assertEqual(1, folded_op_types.count('Conv2D'))
+        # The folded filter and bias, the multiplier and bias of the other batch norm, and the concat axis. The original
+        # weights aren't kept along with the folded ones.
+        self.assertEqual(5, folded_op_types.count('Const'))
+
+        folded_graph = tf.Graph()
+        with folded_graph.as_default():
+            tf.import_graph_def(folded_graph_def, name='')
+            with tf.Session() as session:
+                output = session.run('output:0', feed_dict={folded_graph.get_tensor_by_name(inputs.name): image})
+        self.assertTrue(np.allclose(expected, output, atol=1e-5))
+
+    def _test_freeze(self, model):
+        """
+        :param model: ContextInterp.
+        :return: Tf GraphDef. The frozen model, after checking that it gives the same outputs as the model.
+        """
+        height = 128
+        width = 64
+        batch_size = 2
+        image_a = np.random.rand(batch_size, height, width, 3).astype(np.float32)
+        image_b = np.roll(image_a, 2, axis=2)
+        expected = []
+
+        def _restore_weights(session):
+            # Random weights, with batch statistics that aren't the identity. The output before freezing is kept for
+            # comparison.
+            for var in tf.global_variables():
+                if 'batch_normalization' in var.name:
+                    session.run(var.assign(np.random.uniform(0.5, 1.5, size=var.shape.as_list())))
+            graph = session.graph
+            feed_dict = {graph.get_tensor_by_name(IMAGE_A + ':0'): image_a,
+                         graph.get_tensor_by_name(IMAGE_B + ':0'): image_b,
+                         graph.get_tensor_by_name(T + ':0'): 0.5}
+            expected.append(session.run(graph.get_tensor_by_name(INTERPOLATED + ':0'), feed_dict=feed_dict))
+
+        graph_def = freeze_context_interp(model, _restore_weights, height=height, width=width)
+        op_types = set(node.op for node in graph_def.node)
+        for op_type in ['Variable', 'VariableV2', 'Assign', 'StopGradient', 'RandomUniform']:
+            self.assertNotIn(op_type, op_types)
+
+        write_frozen_graph(graph_def, self.file_path)
+        frozen_model = FrozenContextInterp(self.file_path)
+        interpolated = frozen_model.run(image_a, image_b, t=0.5)
+        frozen_model.close()
+        self.assertTupleEqual((batch_size, height, width, 3), interpolated.shape)
+        # Random weights and batch statistics can scale the outputs up, so the tolerance is relative to them.
+        tolerance = 1e-4 * max(1.0, float(np.max(np.abs(expected[0]))))
+        self.assertTrue(np.allclose(expected[0], interpolated, atol=tolerance))
+        return graph_def
+
+    def tearDown(self):
+        silently_remove_file(self.file_path)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,13 +1,14 @@
 import tensorflow as tf
 from common.models import ConvNetwork
-from common.utils.tf import tf_coin_flip, leaky_relu
+from common.utils.tf import tf_coin_flip, leaky_relu, get_channel_axis, get_spatial_shape, resize_bilinear, NHWC
 
 
 class LateralConnection(ConvNetwork):
     def __init__(self, name, layer_specs,
                  activation_fn=leaky_relu,
                  total_dropout_rate=0.0,
-                 regularizer=None):
+                 regularizer=None,
+                 data_format=NHWC):
         """
         :param name: Str. For variable scoping.
         :param layer_specs: Array of shape [num_layers, 2]. Constrained version of parent class' layer_specs.
@@ -15,6 +16,7 @@ class LateralConnection(ConvNetwork):
         :param activation_fn: Tensorflow activation function. This will not be applied on the last convolutional layer.
         :param total_dropout_rate: A value of 1.0 will always zero-out the output of this block, and 0.0 will keep it.
         :param regularizer: Tf regularizer such as tf.contrib.layers.l2_regularizer.
+        :param data_format: Str. NHWC or NCHW. See parent class.
         """
         full_layer_specs = []
         for i, layer_spec in enumerate(layer_specs):
@@ -23,7 +25,7 @@ class LateralConnection(ConvNetwork):
 
         super().__init__(name=name, layer_specs=full_layer_specs,
                          activation_fn=activation_fn, last_activation_fn=None,
-                         regularizer=regularizer, padding='SAME')
+                         regularizer=regularizer, padding='SAME', data_format=data_format)
 
         self.total_dropout_rate = total_dropout_rate
 
@@ -44,7 +46,8 @@ class LateralConnection(ConvNetwork):
             previous_output, layer_outputs, _ = self._get_conv_tower(previous_output)
 
             # Add skip connection only if channels are the same size.
-            if features.get_shape().as_list()[-1] == previous_output.get_shape().as_list()[-1]:
+            channel_axis = get_channel_axis(self.data_format)
+            if features.get_shape().as_list()[channel_axis] == previous_output.get_shape().as_list()[channel_axis]:
                 final_output = features + previous_output
             else:
                 final_output = previous_output
@@ -62,13 +65,15 @@ class LateralConnection(ConvNetwork):
 class DownSamplingConnection(ConvNetwork):
     def __init__(self, name, layer_specs,
                  activation_fn=leaky_relu,
-                 regularizer=None):
+                 regularizer=None,
+                 data_format=NHWC):
         """
         :param name: Str. For variable scoping.
         :param layer_specs: Array of shape [num_layers, 2]. Constrained version of parent class' layer_specs.
                             The second dimension consists of [num_output_features, dilation].
         :param activation_fn: Tensorflow activation function. This will not be applied on the last convolutional layer.
         :param regularizer: Tf regularizer such as tf.contrib.layers.l2_regularizer.
+        :param data_format: Str. NHWC or NCHW. See parent class.
         """
 
         full_layer_specs = []
@@ -79,7 +84,7 @@ class DownSamplingConnection(ConvNetwork):
 
         super().__init__(name=name, layer_specs=full_layer_specs,
                          activation_fn=activation_fn, last_activation_fn=None,
-                         regularizer=regularizer, padding='SAME')
+                         regularizer=regularizer, padding='SAME', data_format=data_format)
 
     def get_forward(self, features, reuse_variables=tf.AUTO_REUSE):
         """
@@ -99,13 +104,15 @@ class DownSamplingConnection(ConvNetwork):
 class UpSamplingConnection(ConvNetwork):
     def __init__(self, name, layer_specs,
                  activation_fn=leaky_relu,
-                 regularizer=None):
+                 regularizer=None,
+                 data_format=NHWC):
         """
         :param name: Str. For variable scoping.
         :param layer_specs: Array of shape [num_layers, 2]. Constrained version of parent class' layer_specs.
                             The second dimension consists of [num_output_features, dilation].
         :param activation_fn: Tensorflow activation function. This will not be applied on the last convolutional layer.
         :param regularizer: Tf regularizer such as tf.contrib.layers.l2_regularizer.
+        :param data_format: Str. NHWC or NCHW. See parent class.
         """
         full_layer_specs = []
         for i, layer_spec in enumerate(layer_specs):
@@ -114,7 +121,7 @@ class UpSamplingConnection(ConvNetwork):
 
         super().__init__(name=name, layer_specs=full_layer_specs,
                          activation_fn=activation_fn, last_activation_fn=None,
-                         regularizer=regularizer, padding='SAME')
+                         regularizer=regularizer, padding='SAME', data_format=data_format)
 
     def get_forward(self, features, reuse_variables=tf.AUTO_REUSE):
         """
@@ -125,9 +132,8 @@ class UpSamplingConnection(ConvNetwork):
         with tf.variable_scope(self.name, reuse=reuse_variables):
 
             # Up-sample feature images.
-            new_height = 2 * tf.shape(features)[1]
-            new_width = 2 * tf.shape(features)[2]
-            previous_output = tf.image.resize_bilinear(features, (new_height, new_width))
+            height, width = get_spatial_shape(features, self.data_format)
+            previous_output = resize_bilinear(features, (2 * height, 2 * width), data_format=self.data_format)
 
             # Pass through resolution preserving convolutions.
             if self.activation_fn is not None:
@@ -1,17 +1,17 @@
 import tensorflow as tf
-from common.utils.tf import prelu
+from common.utils.tf import prelu, get_channel_axis, to_data_format, from_data_format, NHWC
 from context_interp.gridnet.connections.connections import UpSamplingConnection, DownSamplingConnection, \
     LateralConnection
 
 
 # Packaged activation functions.
-def batch_norm_with_prelu(x):
-    x = tf.layers.batch_normalization(x)
-    return prelu(x)
+def batch_norm_with_prelu(x, data_format=NHWC):
+    x = tf.layers.batch_normalization(x, axis=get_channel_axis(data_format))
+    return prelu(x, data_format=data_format)
 
 
-def batch_norm_with_relu(x):
-    x = tf.layers.batch_normalization(x)
+def batch_norm_with_relu(x, data_format=NHWC):
+    x = tf.layers.batch_normalization(x, axis=get_channel_axis(data_format))
     return tf.nn.relu(x)
 
 
@@ -27,7 +27,8 @@ class GridNet:
                  num_downsampling_convs=2,
                  use_batch_norm=False,
                  connection_dropout_rate=0.0,
-                 regularizer=None):
+                 regularizer=None,
+                 data_format=NHWC):
         """
         See https://arxiv.org/pdf/1707.07958.pdf, and modifications made in https://arxiv.org/pdf/1803.10967.pdf.
         :param channel_sizes: List of channel sizes for rows. Height of the GridNet = len(channel_sizes).
@@ -40,6 +41,9 @@ class GridNet:
         :param use_batch_norm: Whether to use batch normalization.
         :param connection_dropout_rate: E.g if 0.5, drops out each connection (not individual neurons) with 50% chance.
         :param regularizer: Tf regularizer such as tf.contrib.layers.l2_regularizer.
+        :param data_format: Str. NHWC or NCHW. Layout that the grid runs in. The input and final output are NHWC either
+                            way, and saved weights are the same for both. tf.image.resize_bilinear only has an NHWC
+                            kernel, so in NCHW every up-sampling connection transposes its features there and back.
 
         Example for height = 3, width = 4:
 
@@ -80,6 +84,7 @@ class GridNet:
         self.use_batch_norm = use_batch_norm
         self.connection_dropout_rate = connection_dropout_rate
         self.regularizer = regularizer
+        self.data_format = data_format
 
         if num_output_channels == _default:
             num_output_channels = self.channel_sizes[0]
@@ -87,9 +92,9 @@ class GridNet:
 
         # More settings
         if self.use_batch_norm:
-            self.activation_fn = batch_norm_with_prelu
+            self.activation_fn = lambda x: batch_norm_with_prelu(x, data_format=data_format)
         else:
-            self.activation_fn = prelu
+            self.activation_fn = lambda x: prelu(x, data_format=data_format)
 
         # Construct specs for connections.
         # Entry specs[i][j] is the spec for the jth convolution for any connection in the ith row.
@@ -120,7 +125,8 @@ class GridNet:
         :param training: A Bool. Whether the graph is to be constructed for training (dropout will be applied).
         :param reuse_variables: tf reuse option. i.e. tf.AUTO_REUSE.
         :return: final_output: A Tensor. Will take on the same shape as param features.
-                 node_outputs: A 2D list of Tensors. Represents the output at each grid node.
+                 node_outputs: A 2D list of Tensors. Represents the output at each grid node. This and the other
+                               intermediate tensors are in the data_format of the GridNet.
                  lateral_inputs: A 2D list of Tensors. Represents the lateral stream input at each grid node.
                  vertical_inputs: A 2D list of Tensors. Represents the vertical stream input at each grid node.
         """
@@ -130,6 +136,8 @@ class GridNet:
             lateral_inputs = [[tf.constant(0.0) for x in range(self.width)] for y in range(self.height)]
             vertical_inputs = [[tf.constant(0.0) for x in range(self.width)] for y in range(self.height)]
 
+            features = to_data_format(features, self.data_format)
+
             # First lateral connection.
             node_outputs[0][0] = self._process_rightwards(features, 0, 0, training=training,
                                                           reuse_variables=reuse_variables)
@@ -172,6 +180,7 @@ class GridNet:
             previous_output = node_outputs[0][self.width-1]
             final_output = self._process_rightwards(previous_output, 0, self.width, training=training,
                                                     reuse_variables=reuse_variables)
+            final_output = from_data_format(final_output, self.data_format)
             return final_output, node_outputs, lateral_inputs, vertical_inputs
 
     # Private helper functions.
@@ -186,7 +195,8 @@ class GridNet:
             self.output_spec if is_output else self.lateral_specs[i],
             activation_fn=self.activation_fn,
             total_dropout_rate=total_dropout_rate,
-            regularizer=self.regularizer
+            regularizer=self.regularizer,
+            data_format=self.data_format
         ).get_forward(input, training=training, reuse_variables=reuse_variables)
 
     def _process_upwards(self, input, i, j, reuse_variables=tf.AUTO_REUSE):
@@ -194,7 +204,8 @@ class GridNet:
             'up_%d_%d' % (i, j),
             self.upsample_specs[i],
             activation_fn=self.activation_fn,
-            regularizer=self.regularizer
+            regularizer=self.regularizer,
+            data_format=self.data_format
         ).get_forward(input, reuse_variables=reuse_variables)
 
     def _process_downwards(self, input, i, j, reuse_variables=tf.AUTO_REUSE):
@@ -202,5 +213,6 @@ class GridNet:
             'down_%d_%d' % (i, j),
             self.downsample_specs[i],
             activation_fn=self.activation_fn,
-            regularizer=self.regularizer
+            regularizer=self.regularizer,
+            data_format=self.data_format
         ).get_forward(input, reuse_variables=reuse_variables)
\ No newline at end of file
@@ -269,6 +269,31 @@ class TestGridNet(unittest.TestCase):
             print(var.name)
         self.assertEqual(trainable_vars_after, len(tf.trainable_variables()))
 
+    def test_nchw(self):
+        if not tf.test.is_gpu_available():
+            self.skipTest('NCHW convolutions are not supported on this CPU.')
+        num_channels = [3, 4, 8]
+        gridnet = GridNet(num_channels, 4, name='nhwc_gridnet', use_batch_norm=True)
+        nchw_gridnet = GridNet(num_channels, 4, name='nchw_gridnet', use_batch_norm=True, data_format='NCHW')
+
+        input_features_tensor = tf.placeholder(shape=[None, 32, 60, 3], dtype=tf.float32)
+        output, _, _, _ = gridnet.get_forward(input_features_tensor)
+        output_nchw, _, _, _ = nchw_gridnet.get_forward(input_features_tensor)
+
+        # The variables have the same shapes, so they can be copied over.
+        self.sess.run(tf.global_variables_initializer())
+        variables = tf.global_variables(scope='nhwc_gridnet/')
+        variables_nchw = tf.global_variables(scope='nchw_gridnet/')
+        self.assertEqual(len(variables), len(variables_nchw))
+        for variable, variable_nchw in zip(variables, variables_nchw):
+            self.assertEqual(variable.name.replace('nhwc_gridnet', 'nchw_gridnet'), variable_nchw.name)
+            self.sess.run(variable_nchw.assign(variable))
+
+        features = np.random.rand(2, 32, 60, 3).astype(np.float32)
+        results = self.sess.run([output, output_nchw], feed_dict={input_features_tensor: features})
+        self.assertTupleEqual((2, 32, 60, 3), results[1].shape)
+        self.assertTrue(np.allclose(results[0], results[1], atol=1e-4))
+
 
 if __name__ == '__main__':
     unittest.main()
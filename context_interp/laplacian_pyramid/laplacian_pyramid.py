@@ -18,6 +18,12 @@ class LaplacianPyramid:
         self.num_levels = num_levels
         self.filter_side_len = filter_side_len
 
+    def get_size_multiple(self):
+        """
+        :return: Int. The input height and width must be multiples of this.
+        """
+        return 2 ** (self.num_levels - 1)
+
     def get_forward(self, images):
         """
         :param images: A Tensor. Images of shape [batch_size, H, W, C].
@@ -1,33 +1,92 @@
 import tensorflow as tf
+from math import gcd
 from common.forward_warp.forward_warp import forward_warp
+from pwcnet.warp.warp import backward_warp
 from context_interp.vgg19_features.vgg19_features import Vgg19Features
 from context_interp.gridnet.model import GridNet
 from context_interp.laplacian_pyramid.laplacian_pyramid import LaplacianPyramid
+from common.utils.tf import NHWC, resize_bilinear
 from pwcnet.model import PWCNet
 
 
+# Speed/quality presets, from the fastest to the most accurate. Keys:
+#     'flow_scale': Float. PWCNet runs on the input pair resized by this factor, and the flows are upsampled back.
+#     'num_context_channels': Int. Number of VGG19 conv1_2 channels that are warped along with the images.
+#     'gridnet_channel_sizes': List of ints. Channels of the GridNet rows.
+#     'gridnet_width': Int. Number of GridNet columns.
+# The balanced preset has the same variables as the quality preset and can use its checkpoints, while the fast preset
+# needs to be trained on its own (see mains/train_context_interp.py -p). The frames per second and PSNR of every preset
+# on a validation split are reported by mains/evaluate_context_interp.py.
+FAST = 'fast'
+BALANCED = 'balanced'
+QUALITY = 'quality'
+PRESETS = {
+    FAST: {
+        'flow_scale': 0.5,
+        'num_context_channels': 32,
+        'gridnet_channel_sizes': [16, 32, 48],
+        'gridnet_width': 4
+    },
+    BALANCED: {
+        'flow_scale': 0.5,
+        'num_context_channels': 64,
+        'gridnet_channel_sizes': [32, 64, 96],
+        'gridnet_width': 6
+    },
+    QUALITY: {
+        'flow_scale': 1.0,
+        'num_context_channels': 64,
+        'gridnet_channel_sizes': [32, 64, 96],
+        'gridnet_width': 6
+    }
+}
+
+# How the images and contexts are brought to the interpolation point before the GridNet.
+# SPLAT forward-warps them with t * flow_a_b and (1 - t) * flow_b_a. BACKWARD_WARP approximates the flows from the
+# interpolation point instead, and gathers with backward_warp. This avoids the scatters of forward_warp, which are slow
+# on CPU and non-deterministic on GPU. Both have the same variables. mains/evaluate_context_interp.py -w compares them.
+SPLAT = 'splat'
+BACKWARD_WARP = 'backward_warp'
+
+
 class ContextInterp:
-    def __init__(self, name='context_interp'):
+    def __init__(self, name='context_interp', data_format=NHWC, preset=QUALITY, warp_mode=SPLAT, use_batch_norm=False):
         """
         :param name: Str. For Tf variable scoping.
+        :param data_format: Str. NHWC or NCHW. Layout that PWCNet and the GridNet run in. See PWCNet.
+        :param preset: Str. One of the keys of PRESETS.
+        :param warp_mode: Str. SPLAT or BACKWARD_WARP.
+        :param use_batch_norm: Bool. Whether the GridNet has batch norms. They add variables, so checkpoints only work
+                               with the same value. A frozen graph has them folded away (see frozen_graph.py).
         """
+        assert preset in PRESETS, 'Unknown preset ' + str(preset) + '.'
+        assert warp_mode in [SPLAT, BACKWARD_WARP], 'Unknown warp mode ' + str(warp_mode) + '.'
+        preset_values = PRESETS[preset]
         self.name = name
         self.enclosing_scope = None
-        self.gridnet = GridNet([32, 64, 96], 6, num_output_channels=3)
+        self.preset = preset
+        self.warp_mode = warp_mode
+        self.flow_scale = preset_values['flow_scale']
+        self.num_context_channels = preset_values['num_context_channels']
+        self.gridnet = GridNet(preset_values['gridnet_channel_sizes'], preset_values['gridnet_width'],
+                               num_output_channels=3, use_batch_norm=use_batch_norm, data_format=data_format)
         self.laplacian_pyramid = LaplacianPyramid(5)
-        self.pwcnet = PWCNet()
+        self.pwcnet = PWCNet(data_format=data_format)
         self.feature_extractor = Vgg19Features()
         self.feature_extractor.load_pretrained_weights()
 
-    def get_forward(self, image_a, image_b, t, reuse_variables=tf.AUTO_REUSE):
+    def get_forward(self, image_a, image_b, t, reuse_variables=tf.AUTO_REUSE, training=True):
         """
         :param image_a: Tensor of shape [batch_size, H, W, 3].
         :param image_b: Tensor of shape [batch_size, H, W, 3].
         :param t: Float. Specifies the interpolation point (i.e 0 for image_a, 1 for image_b).
+        :param reuse_variables: tf reuse option. i.e. tf.AUTO_REUSE.
+        :param training: Bool. If False, the graph is for inference only. The GridNet connection dropout and the
+                         stop_gradients are left out. The variables are the same either way.
         :return: interpolated: The interpolated image. Tensor of shape [batch_size, H, W, 3].
-                 warped_a_b: Image and features from a forward-flowed towards b, before synthesis.
+                 warped_a_b: Image and features from a warped towards b, before synthesis.
                              The first 3 channels are the image.
-                 warped_b_a: Image and features from b forward-flowed towards a, before synthesis.
+                 warped_b_a: Image and features from b warped towards a, before synthesis.
                              The first 3 channels are the image.
                  flow_a_b: Flow from a to b (centered at a).
                  flow_b_a: Flow from b to a (centered at b).
@@ -36,32 +95,74 @@ class ContextInterp:
         with tf.variable_scope(self.name, reuse=reuse_variables):
             batch_size = tf.shape(image_a)[0]
             from_frames = tf.concat([image_a, image_b], axis=0)
-            to_frames = tf.concat([image_b, image_a], axis=0)
-            all_contexts = self.feature_extractor.get_context_features(from_frames)
+            all_contexts = self.feature_extractor.get_context_features(from_frames,
+                                                                       num_channels=self.num_context_channels)
 
             # TODO: Add instance normalization. Described in 3.3 of https://arxiv.org/pdf/1803.10967.pdf.
 
             # Get a->b and b->a flows from PWCNet.
-            # TODO: Migrate to pwcnet.get_bidirectional.
-            all_flows, _ = self.pwcnet.get_forward(from_frames, to_frames, reuse_variables=reuse_variables)
-            flow_a_b = all_flows[:batch_size]
-            flow_b_a = all_flows[batch_size:]
+            flow_a_b, flow_b_a = self._get_flows(image_a, image_b, reuse_variables)
 
             features_a = tf.concat([image_a, all_contexts[:batch_size]], axis=-1)
             features_b = tf.concat([image_b, all_contexts[batch_size:]], axis=-1)
             all_features = tf.concat([features_a, features_b], axis=0)
-            all_warp_flows = tf.concat([t * flow_a_b, (1.0 - t) * flow_b_a], axis=0)
 
             # Warp images and their contexts from a->b and from b->a.
-            all_warped = forward_warp(all_features, all_warp_flows)
-            warped_a_b = tf.stop_gradient(all_warped[:batch_size])
-            warped_b_a = tf.stop_gradient(all_warped[batch_size:])
+            if self.warp_mode == BACKWARD_WARP:
+                # Flows from the interpolation point to a and to b, assuming that the motion is linear and that the
+                # flows are locally smooth. See eq. 4 of https://arxiv.org/pdf/1712.00080.pdf.
+                flow_t_a = -(1.0 - t) * t * flow_a_b + t * t * flow_b_a
+                flow_t_b = (1.0 - t) * (1.0 - t) * flow_a_b - t * (1.0 - t) * flow_b_a
+                all_warped = backward_warp(all_features, tf.concat([flow_t_a, flow_t_b], axis=0))
+            else:
+                all_warp_flows = tf.concat([t * flow_a_b, (1.0 - t) * flow_b_a], axis=0)
+                all_warped = forward_warp(all_features, all_warp_flows)
+            warped_a_b = all_warped[:batch_size]
+            warped_b_a = all_warped[batch_size:]
+            if training:
+                warped_a_b = tf.stop_gradient(warped_a_b)
+                warped_b_a = tf.stop_gradient(warped_b_a)
 
             # Feed into GridNet for final synthesis.
             warped_combined = tf.concat([warped_a_b, warped_b_a], axis=-1)
-            synthesized, _, _, _ = self.gridnet.get_forward(warped_combined, training=True)
+            synthesized, _, _, _ = self.gridnet.get_forward(warped_combined, training=training)
             return synthesized, warped_a_b, warped_b_a, flow_a_b, flow_b_a
 
+    def _get_flows(self, image_a, image_b, reuse_variables):
+        """
+        :param image_a: Tensor of shape [batch_size, H, W, 3].
+        :param image_b: Tensor of shape [batch_size, H, W, 3].
+        :param reuse_variables: See get_forward.
+        :return: flow_a_b: Tensor of shape [batch_size, H, W, 2].
+                 flow_b_a: Tensor of shape [batch_size, H, W, 2].
+        """
+        if self.flow_scale == 1.0:
+            flow_a_b, flow_b_a, _, _ = self.pwcnet.get_bidirectional(image_a, image_b, reuse_variables=reuse_variables)
+            return flow_a_b, flow_b_a
+
+        with tf.name_scope('scaled_flow'):
+            batch_size = tf.shape(image_a)[0]
+            size = tf.shape(image_a)[1:3]
+            scaled_size = tf.cast(tf.cast(size, tf.float32) * self.flow_scale, tf.int32)
+            # Area resizing averages the pixels rather than skipping them, so there's no aliasing.
+            scaled_images = tf.image.resize_area(tf.concat([image_a, image_b], axis=0), scaled_size)
+            scaled_flow_a_b, scaled_flow_b_a, _, _ = self.pwcnet.get_bidirectional(
+                scaled_images[:batch_size], scaled_images[batch_size:], reuse_variables=reuse_variables)
+
+            # The flow vectors are in pixels of the scaled images, so their magnitudes grow along with the resolution.
+            magnitude_scale = tf.cast(size[::-1], tf.float32) / tf.cast(scaled_size[::-1], tf.float32)
+            all_flows = resize_bilinear(tf.concat([scaled_flow_a_b, scaled_flow_b_a], axis=0), size) * magnitude_scale
+            return all_flows[:batch_size], all_flows[batch_size:]
+
+    def get_size_multiple(self):
+        """
+        :return: Int. The input height and width must be multiples of this for both PWCNet and the Laplacian pyramid.
+        """
+        # PWCNet needs the scaled input to be a multiple of its own size multiple.
+        pwcnet_multiple = int(round(self.pwcnet.get_size_multiple() / self.flow_scale))
+        pyramid_multiple = self.laplacian_pyramid.get_size_multiple()
+        return pwcnet_multiple * pyramid_multiple // gcd(pwcnet_multiple, pyramid_multiple)
+
     def load_pwcnet_weights(self, pwcnet_weights_path, sess):
         """
         Loads pre-trained PWCNet weights.
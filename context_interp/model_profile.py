@@ -1,9 +1,10 @@
 import os
+import sys
 import time
 import numpy as np
 import tensorflow as tf
 from common.utils.tf import AdamaxOptimizer
-from context_interp.model import ContextInterp
+from context_interp.model import ContextInterp, QUALITY, SPLAT
 
 if __name__ == '__main__':
     config = tf.ConfigProto()
@@ -18,7 +19,11 @@ if __name__ == '__main__':
 
     # Create the graph.
     print('Creating the graph...')
-    model = ContextInterp('context_interp_profile')
+    # The preset and the warp mode can be given as the arguments, i.e. fast backward_warp.
+    preset = sys.argv[1] if len(sys.argv) > 1 else QUALITY
+    warp_mode = sys.argv[2] if len(sys.argv) > 2 else SPLAT
+    print('Preset:', preset, 'Warp mode:', warp_mode)
+    model = ContextInterp('context_interp_profile', preset=preset, warp_mode=warp_mode)
     image_a_placeholder = tf.placeholder(shape=[None, height, width, im_channels], dtype=tf.float32)
     image_b_placeholder = tf.placeholder(shape=[None, height, width, im_channels], dtype=tf.float32)
     gt_placeholder = tf.placeholder(shape=[None, height, width, im_channels], dtype=tf.float32)
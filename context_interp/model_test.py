@@ -1,7 +1,7 @@
 import numpy as np
 import tensorflow as tf
 import unittest
-from context_interp.model import ContextInterp
+from context_interp.model import ContextInterp, BALANCED, FAST, BACKWARD_WARP
 
 
 class TestContextInterp(unittest.TestCase):
@@ -88,6 +88,78 @@ class TestContextInterp(unittest.TestCase):
         model.get_forward(image_a_placeholder, image_b_placeholder, 0.5)
         self.assertEqual(trainable_vars_after, len(tf.trainable_variables()))
 
+    def test_presets(self):
+        height = 256
+        width = 128
+        im_channels = 3
+        batch_size = 2
+
+        # The balanced preset shares the variables of the quality preset, and only runs PWCNet on half the resolution.
+        quality_model = ContextInterp(name='preset_context_interp')
+        balanced_model = ContextInterp(name='preset_context_interp', preset=BALANCED)
+        fast_model = ContextInterp(name='fast_context_interp', preset=FAST)
+        self.assertEqual(128, balanced_model.get_size_multiple())
+        self.assertEqual(128, fast_model.get_size_multiple())
+
+        image_a_placeholder = tf.placeholder(shape=[None, height, width, im_channels], dtype=tf.float32)
+        image_b_placeholder = tf.placeholder(shape=[None, height, width, im_channels], dtype=tf.float32)
+        small_a_placeholder = tf.placeholder(shape=[None, height // 2, width // 2, im_channels], dtype=tf.float32)
+        small_b_placeholder = tf.placeholder(shape=[None, height // 2, width // 2, im_channels], dtype=tf.float32)
+        _, _, _, quality_flow_tensor, _ = quality_model.get_forward(small_a_placeholder, small_b_placeholder, 0.5)
+        trainable_vars_before = len(tf.trainable_variables())
+        _, _, _, balanced_flow_tensor, _ = balanced_model.get_forward(image_a_placeholder, image_b_placeholder, 0.5)
+        self.assertEqual(trainable_vars_before, len(tf.trainable_variables()))
+        fast_tensors = fast_model.get_forward(image_a_placeholder, image_b_placeholder, 0.5)
+        # The quality flow at half the resolution, brought to the full resolution.
+        upsampled_flow_tensor = tf.image.resize_bilinear(quality_flow_tensor, [height, width]) * 2.0
+
+        image_a = np.random.rand(batch_size, height, width, im_channels).astype(np.float32)
+        image_b = np.roll(image_a, 4, axis=2)
+        small_a = image_a.reshape(batch_size, height // 2, 2, width // 2, 2, im_channels).mean(axis=(2, 4))
+        small_b = image_b.reshape(batch_size, height // 2, 2, width // 2, 2, im_channels).mean(axis=(2, 4))
+
+        self.sess.run(tf.global_variables_initializer())
+        query = [balanced_flow_tensor, upsampled_flow_tensor] + list(fast_tensors)
+        outputs = self.sess.run(query, feed_dict={image_a_placeholder: image_a, image_b_placeholder: image_b,
+                                                  small_a_placeholder: small_a, small_b_placeholder: small_b})
+        balanced_flow, upsampled_flow, interpolated, warped_a_b, warped_b_a, flow_a_b, flow_b_a = outputs
+        self.assertTrue(np.allclose(upsampled_flow, balanced_flow, atol=1e-4))
+
+        self.assertTupleEqual((batch_size, height, width, im_channels), interpolated.shape)
+        self.assertTupleEqual((batch_size, height, width, im_channels + 32), warped_a_b.shape)
+        self.assertTupleEqual((batch_size, height, width, im_channels + 32), warped_b_a.shape)
+        self.assertTupleEqual((batch_size, height, width, 2), flow_a_b.shape)
+        self.assertTupleEqual((batch_size, height, width, 2), flow_b_a.shape)
+
+    def test_backward_warp(self):
+        height = 128
+        width = 64
+        im_channels = 3
+        batch_size = 2
+
+        model = ContextInterp(name='backward_warp_context_interp', warp_mode=BACKWARD_WARP)
+        image_a_placeholder = tf.placeholder(shape=[None, height, width, im_channels], dtype=tf.float32)
+        image_b_placeholder = tf.placeholder(shape=[None, height, width, im_channels], dtype=tf.float32)
+        t_placeholder = tf.placeholder(shape=[], dtype=tf.float32)
+        output_tensors = model.get_forward(image_a_placeholder, image_b_placeholder, t_placeholder)
+        interpolated_tensor, warped_a_b_tensor, warped_b_a_tensor, _, _ = output_tensors
+        image_a = np.random.rand(batch_size, height, width, im_channels).astype(np.float32)
+        image_b = np.roll(image_a, 3, axis=2)
+        self.sess.run(tf.global_variables_initializer())
+
+        # At t = 0 the flow from the interpolation point to a is 0, so a is not moved.
+        interpolated, warped_a_b, warped_b_a = self.sess.run(
+            [interpolated_tensor, warped_a_b_tensor, warped_b_a_tensor],
+            feed_dict={image_a_placeholder: image_a, image_b_placeholder: image_b, t_placeholder: 0.0})
+        self.assertTupleEqual((batch_size, height, width, im_channels), interpolated.shape)
+        self.assertTrue(np.allclose(image_a, warped_a_b[..., :3], atol=1e-5))
+        self.assertTupleEqual(warped_a_b.shape, warped_b_a.shape)
+
+        # Likewise for b at t = 1.
+        warped_b_a = self.sess.run(warped_b_a_tensor, feed_dict={image_a_placeholder: image_a,
+                                                                 image_b_placeholder: image_b, t_placeholder: 1.0})
+        self.assertTrue(np.allclose(image_b, warped_b_a[..., :3], atol=1e-5))
+
 
 if __name__ == '__main__':
     unittest.main()
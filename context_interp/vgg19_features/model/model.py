@@ -42,12 +42,14 @@ class Vgg19:
         self.var_dict = {}
         self.dropout = dropout
 
-    def build_up_to_conv1_2(self, rgb, trainable=True, reuse_variables=tf.AUTO_REUSE):
+    def build_up_to_conv1_2(self, rgb, trainable=True, reuse_variables=tf.AUTO_REUSE, num_out_channels=64):
         """
         Build VGG19 partially, up to the conv1_2 layer.
         :param rgb: rgb image [batch, height, width, 3] values scaled [0, 1].
         :param trainable: Whether the model is trainable.
         :param reuse_variables: tf reuse option. i.e. tf.AUTO_REUSE.
+        :param num_out_channels: Int. Only the first num_out_channels filters of conv1_2 are convolved. The variables
+                                 still hold all 64 filters.
         """
         with tf.variable_scope(self.name, reuse=reuse_variables):
             self.var_dict = {}
@@ -63,7 +65,8 @@ class Vgg19:
             ])
             layers = types.SimpleNamespace()
             layers.conv1_1 = self.conv_layer(bgr, 3, 64, "conv1_1", trainable)
-            layers.conv1_2 = self.conv_layer(layers.conv1_1, 64, 64, "conv1_2", trainable)
+            layers.conv1_2 = self.conv_layer(layers.conv1_1, 64, 64, "conv1_2", trainable,
+                                             num_out_channels=num_out_channels)
             return layers.conv1_2, layers
 
     def build_up_to_conv4_4(self, rgb, trainable=True, reuse_variables=tf.AUTO_REUSE):
@@ -134,9 +137,12 @@ class Vgg19:
     def max_pool(self, bottom, name):
         return tf.nn.max_pool(bottom, ksize=[1, 2, 2, 1], strides=[1, 2, 2, 1], padding='SAME', name=name)
 
-    def conv_layer(self, bottom, in_channels, out_channels, name, trainable):
+    def conv_layer(self, bottom, in_channels, out_channels, name, trainable, num_out_channels=None):
         with tf.variable_scope(name):
             filt, conv_biases = self.get_conv_var(3, in_channels, out_channels, name, trainable)
+            if num_out_channels is not None and num_out_channels < out_channels:
+                filt = filt[..., :num_out_channels]
+                conv_biases = conv_biases[:num_out_channels]
 
             conv = tf.nn.conv2d(bottom, filt, [1, 1, 1, 1], padding='SAME')
             bias = tf.nn.bias_add(conv, conv_biases)
@@ -9,12 +9,13 @@ class Vgg19Features:
         vgg19_data = Vgg19.load_params_dict(load_small=True)
         self.vgg19 = Vgg19(data_dict=vgg19_data)
 
-    def get_context_features(self, images):
+    def get_context_features(self, images, num_channels=64):
         """
         :param images: A Tensor. Of shape [batch, H, W, num_features].
-        :return: A Tensor. Of shape [batch, H, W, 64].
+        :param num_channels: Int. Number of conv1_2 channels to compute, at most 64.
+        :return: A Tensor. Of shape [batch, H, W, num_channels].
         """
-        image_features, _ = self.vgg19.build_up_to_conv1_2(images, trainable=False)
+        image_features, _ = self.vgg19.build_up_to_conv1_2(images, trainable=False, num_out_channels=num_channels)
         return image_features
 
     def get_perceptual_features(self, images):
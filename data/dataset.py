@@ -3,10 +3,22 @@ import tensorflow as tf
 
 # Dataset interface.
 class DataSet:
-    def __init__(self, directory, batch_size, training_augmentations=True):
+    def __init__(self, directory, batch_size, training_augmentations=True, num_shards=1, shard_index=0):
+        """
+        :param directory: Str.
+        :param batch_size: Int.
+        :param training_augmentations: Whether to do live augmentations while training.
+        :param num_shards: Int. Number of disjoint subsets to split the training files into, i.e. 1 per worker process.
+        :param shard_index: Int. Which subset of the training files this dataset reads, between [0, num_shards).
+        """
+        assert 0 <= shard_index < num_shards
         self.directory = directory
         self.batch_size = batch_size
         self.training_augmentations = training_augmentations
+        self.num_shards = num_shards
+        self.shard_index = shard_index
+        self.num_towers = 1
+        self.validation_placeholder = None  # Bool placeholder that switches the towers to the validation data.
         self.verbose = False
 
     def set_verbose(self, verbose):
@@ -16,6 +28,23 @@ class DataSet:
         """
         self.verbose = verbose
 
+    def set_num_towers(self, num_towers):
+        """
+        Splits every batch between num_towers separate input pipelines, i.e. 1 per GPU tower, so that each tower reads
+        its own sub-batch instead of slicing it out of one batch on the host. Must be called before load().
+        :param num_towers: Int. Must divide batch_size, so that every tower reads its training files at the same rate.
+        :return: Nothing.
+        """
+        assert 1 <= num_towers <= self.batch_size, 'Every tower must get at least 1 example per batch.'
+        assert self.batch_size % num_towers == 0, 'The batch size must be a multiple of the number of towers.'
+        self.num_towers = num_towers
+
+    def get_tower_batch_sizes(self):
+        """
+        :return: List of int. The batch size of each tower's input pipeline. They sum up to batch_size.
+        """
+        return [self.batch_size // self.num_towers] * self.num_towers
+
     def get_train_file_names(self):
         """
         :return: List of string.
@@ -44,6 +73,13 @@ class DataSet:
         """
         raise NotImplementedError('get_next_batch() is not implemented.')
 
+    def get_next_tower_batches(self):
+        """
+        Gets the tensors for the next sub-batch of every tower. Concatenated together, these are get_next_batch().
+        :return: List of tuples of tensors. 1 tuple per tower.
+        """
+        raise NotImplementedError('get_next_tower_batches() is not implemented.')
+
     def get_train_feed_dict(self):
         """
         Gets the feed_dict for the training dataset.
@@ -70,3 +106,33 @@ class DataSet:
         """
         assert isinstance(session, tf.Session)
         raise NotImplementedError('init_validation_data() is not implemented.')
+
+    def _create_tower_batches(self, get_train_tower_batches, get_validation_batch):
+        """
+        Switches the towers between their own training pipelines and one validation pipeline, whose batches are
+        sliced between the towers. Every tower thus runs out of validation data on the same run, and no validation
+        example is dropped. A last validation batch with fewer examples than towers leaves some towers empty.
+        Validation batches are read when validation_placeholder is fed True.
+        :param get_train_tower_batches: Function that returns a list of tuples of tensors, the next training
+                                        sub-batch of every tower.
+        :param get_validation_batch: Function that returns a tuple of tensors, the next validation batch.
+        :return: List of tuples of tensors. 1 tuple per tower.
+        """
+        def _get_validation_tower_batches():
+            validation_batch = get_validation_batch()
+            batch_size = tf.shape(validation_batch[0])[0]
+            tower_batches = []
+            for i in range(self.num_towers):
+                start = batch_size * i // self.num_towers
+                end = batch_size * (i + 1) // self.num_towers
+                tower_batches.append(tuple(tensor[start:end] for tensor in validation_batch))
+            return tower_batches
+
+        self.validation_placeholder = tf.placeholder_with_default(False, shape=[])
+        # The iterators are only read in the branch that is taken. The batches are prefetched on the host and copied to
+        # the towers when they are used. tf.contrib.data.prefetch_to_device could prefetch the training batches onto
+        # each tower's device instead, but the datasets don't know the tower devices, GPU-prefetched datasets need
+        # initializable rather than one-shot iterators, and the sliced validation batches would still come from the
+        # host.
+        return tf.cond(self.validation_placeholder, _get_validation_tower_batches,
+                       lambda: [tuple(tower_batch) for tower_batch in get_train_tower_batches()])
@@ -17,7 +17,8 @@ class FlowDataSet(DataSet):
     TRAIN_FILENAME = 'flowdataset_train.tfrecords'
     VALID_FILENAME = 'flowdataset_valid.tfrecords'
 
-    def __init__(self, directory, batch_size=1, crop_size=None, training_augmentations=True, augmentation_config=None):
+    def __init__(self, directory, batch_size=1, crop_size=None, training_augmentations=True, augmentation_config=None,
+                 num_shards=1, shard_index=0):
         """
         :param directory: Str. Directory of the dataset file structure and tf records.
         :param batch_size: Int.
@@ -25,18 +26,19 @@ class FlowDataSet(DataSet):
                           If None, then no cropping will be performed.
         :param training_augmentations: Whether to do live augmentations while training.
         :param augmentation_config: Configurations for data augmentation. If None, the default will be used.
+        :param num_shards: Int. Number of disjoint subsets to split the training files into, i.e. 1 per worker process.
+        :param shard_index: Int. Which subset of the training files this dataset reads, between [0, num_shards).
         """
-        super().__init__(directory, batch_size, training_augmentations=training_augmentations)
+        super().__init__(directory, batch_size, training_augmentations=training_augmentations, num_shards=num_shards,
+                         shard_index=shard_index)
 
         # Initialized during load().
-        self.train_dataset = None  # Tensorflow DataSet object.
-        self.valid_dataset = None  # Tensorflow DataSet object.
-        self.handle_placeholder = None  # Handle placeholder for switching between datasets.
+        self.handle_placeholder = None  # Handle placeholder for switching between datasets, with a single tower.
         self.train_handle = None  # Handle to feed for the training dataset.
         self.validation_handle = None  # Handle to feed for the validation dataset.
-        self.iterator = None  # Iterator for getting the next batch.
-        self.train_iterator = None  # Iterator for getting just the train data.
+        self.train_iterators = []  # Iterators for getting just the train data. 1 per tower (see set_num_towers).
         self.validation_iterator = None  # Iterator for getting just the validation data.
+        self.tower_batches = []  # Data iterator batches. Tuples of (images_a, images_b, flows).
         self.next_images_a = None  # Data iterator batch.
         self.next_images_b = None  # Data iterator batch.
         self.next_flows = None  # Data iterator batch.
@@ -73,22 +75,37 @@ class FlowDataSet(DataSet):
         """
         Overridden.
         """
+        tower_batch_sizes = self.get_tower_batch_sizes()
+        num_towers = len(tower_batch_sizes)
         with tf.name_scope('dataset_ops'):
-            self.train_dataset = self._load_dataset(self._get_train_file_name_pattern(), True,
-                                                    do_augmentations=self.training_augmentations)
-            self.valid_dataset = self._load_dataset(self._get_valid_file_name_pattern(), False,
-                                                    do_augmentations=False)
-
-            self.handle_placeholder = tf.placeholder(tf.string, shape=[])
-            self.iterator = tf.data.Iterator.from_string_handle(
-                self.handle_placeholder, self.train_dataset.output_types, self.train_dataset.output_shapes)
-            self.next_images_a, self.next_images_b, self.next_flows = self.iterator.get_next()
-
-            self.train_iterator = self.train_dataset.make_one_shot_iterator()
-            self.validation_iterator = self.valid_dataset.make_initializable_iterator()
-
-        self.train_handle = session.run(self.train_iterator.string_handle())
-        self.validation_handle = session.run(self.validation_iterator.string_handle())
+            for i, tower_batch_size in enumerate(tower_batch_sizes):
+                # Each tower reads a disjoint subset of the training files.
+                train_dataset = self._load_dataset(self._get_train_file_name_pattern(), True, tower_batch_size,
+                                                   do_augmentations=self.training_augmentations,
+                                                   num_shards=self.num_shards * num_towers,
+                                                   shard_index=self.shard_index * num_towers + i)
+                self.train_iterators.append(train_dataset.make_one_shot_iterator())
+            valid_dataset = self._load_dataset(self._get_valid_file_name_pattern(), False, self.batch_size,
+                                               do_augmentations=False)
+            self.validation_iterator = valid_dataset.make_initializable_iterator()
+
+            if num_towers == 1:
+                self.handle_placeholder = tf.placeholder(tf.string, shape=[])
+                iterator = tf.data.Iterator.from_string_handle(
+                    self.handle_placeholder, train_dataset.output_types, train_dataset.output_shapes)
+                self.tower_batches = [iterator.get_next()]
+                self.next_images_a, self.next_images_b, self.next_flows = self.tower_batches[0]
+            else:
+                # The validation batches are sliced between the towers (see DataSet._create_tower_batches).
+                self.tower_batches = self._create_tower_batches(
+                    lambda: [iterator.get_next() for iterator in self.train_iterators],
+                    self.validation_iterator.get_next)
+                self.next_images_a, self.next_images_b, self.next_flows = [
+                    tf.concat(tensors, axis=0) for tensors in zip(*self.tower_batches)]
+
+        if num_towers == 1:
+            self.train_handle = session.run(self.train_iterators[0].string_handle())
+            self.validation_handle = session.run(self.validation_iterator.string_handle())
 
     def get_next_batch(self):
         """
@@ -96,17 +113,27 @@ class FlowDataSet(DataSet):
         """
         return self.next_images_a, self.next_images_b, self.next_flows
 
+    def get_next_tower_batches(self):
+        """
+        Overridden.
+        """
+        return self.tower_batches
+
     def get_train_feed_dict(self):
         """
         Overridden.
         """
-        return {self.handle_placeholder: self.train_handle}
+        if self.handle_placeholder is not None:
+            return {self.handle_placeholder: self.train_handle}
+        return {self.validation_placeholder: False}
 
     def get_validation_feed_dict(self):
         """
         Overridden.
         """
-        return {self.handle_placeholder: self.validation_handle}
+        if self.handle_placeholder is not None:
+            return {self.handle_placeholder: self.validation_handle}
+        return {self.validation_placeholder: True}
 
     def init_validation_data(self, session):
         """
@@ -126,11 +153,14 @@ class FlowDataSet(DataSet):
         """
         return os.path.join(self.directory, '*' + self.VALID_FILENAME)
 
-    def _load_dataset(self, filename_pattern, repeat, do_augmentations=False):
+    def _load_dataset(self, filename_pattern, repeat, batch_size, do_augmentations=False, num_shards=1, shard_index=0):
         """
         :param filename_pattern: Str. Pattern for globbing file names.
         :param repeat: Bool. Whether to repeat the dataset indefinitely.
+        :param batch_size: Int.
         :param do_augmentations: Bool. Whether to do image augmentations.
+        :param num_shards: Int. Number of disjoint subsets to split the files into.
+        :param shard_index: Int. Which subset of the files to read.
         :return: Tensorflow dataset object.
         """
         def _parse_function(example_proto):
@@ -169,11 +199,18 @@ class FlowDataSet(DataSet):
 
             return image_a, image_b, flow
 
-        files = tf.data.Dataset.list_files(filename_pattern, shuffle=True)
-        dataset = tf.data.TFRecordDataset(files, compression_type='GZIP', num_parallel_reads=min(4, self.batch_size))
+        if num_shards > 1:
+            # The files must be split in a deterministic order so that the shards are disjoint across workers.
+            num_files = len(glob.glob(filename_pattern))
+            assert num_files >= num_shards, 'There must be at least 1 tf record file per shard.'
+            files = tf.data.Dataset.list_files(filename_pattern, shuffle=False).shard(num_shards, shard_index)
+            files = files.shuffle(num_files)
+        else:
+            files = tf.data.Dataset.list_files(filename_pattern, shuffle=True)
+        dataset = tf.data.TFRecordDataset(files, compression_type='GZIP', num_parallel_reads=min(4, batch_size))
         if repeat:
             dataset = dataset.repeat()
         dataset = dataset.map(_parse_function, num_parallel_calls=multiprocessing.cpu_count())
-        dataset = dataset.batch(self.batch_size)
+        dataset = dataset.batch(batch_size)
         dataset = dataset.prefetch(2)
         return dataset
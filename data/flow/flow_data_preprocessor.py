@@ -1,28 +1,34 @@
 import multiprocessing
 import os.path
 import random
-import numpy as np
 from joblib import Parallel, delayed
 from common.utils.data import *
 from common.utils.img import read_image
-from common.utils.flow import read_flow_file
+from common.utils.flow_io import read_flow_files
 from data.flow.flow_data import FlowDataSet
+from data.flow.flow_statistics import compute_dataset_statistics, get_stratified_split, MANIFEST_FILENAME
 
 
 class FlowDataPreprocessor:
-    def __init__(self, directory, validation_size=1, max_flow=1000.0, shard_size=1, verbose=False):
+    def __init__(self, directory, validation_size=1, max_flow=1000.0, shard_size=1, stratified_validation=False,
+                 num_processes=multiprocessing.cpu_count(), verbose=False):
         """
         :param directory: Str. Directory of the dataset file structure and tf records.
         :param validation_size: Int. Number of validation examples.
         :param data_source: Source of the data.
         :param max_flow: Float. Maximum flow magnitude of the flow image. Any examples with flow magnitude greater than
             this will be ignored.
+        :param stratified_validation: Bool. Whether the validation examples are spread over the range of mean flow
+            magnitudes (see get_stratified_split) instead of being picked at random.
+        :param num_processes: Int. Number of processes computing the flow statistics.
         :param verbose: Bool.
         """
         self.directory = directory
         self.validation_size = validation_size
         self.max_flow = max_flow
         self.shard_size = shard_size
+        self.stratified_validation = stratified_validation
+        self.num_processes = num_processes
         self.verbose = verbose
 
     def get_data_paths(self):
@@ -31,6 +37,14 @@ class FlowDataPreprocessor:
         """
         raise NotImplementedError('get_data_paths() is not implemented.')
 
+    def get_statistics(self, flow_paths):
+        """
+        :param flow_paths: List of flow_path strings.
+        :return: List of dicts in the format of compute_flow_statistics. They are cached in the dataset manifest.
+        """
+        return compute_dataset_statistics(flow_paths, manifest_path=os.path.join(self.directory, MANIFEST_FILENAME),
+                                          num_processes=self.num_processes, verbose=self.verbose)
+
     def preprocess_raw(self):
         image_a_paths, image_b_paths, flow_paths = self.get_data_paths()
         self._convert_to_tf_record(image_a_paths, image_b_paths, flow_paths, self.shard_size)
@@ -45,10 +59,27 @@ class FlowDataPreprocessor:
         assert len(image_a_paths) == len(flow_paths)
         assert len(image_b_paths) == len(flow_paths)
 
+        # Examples are filtered and split with the statistics pre-pass, before any image is read.
+        statistics = self.get_statistics(flow_paths)
+        indices = [i for i in range(len(flow_paths)) if statistics[i]['max_magnitude'] <= self.max_flow]
+        if self.verbose:
+            print('Ignoring', len(flow_paths) - len(indices), 'examples with a flow magnitude greater than',
+                  self.max_flow)
+        if self.stratified_validation:
+            train_indices, valid_indices = get_stratified_split([statistics[i] for i in indices], self.validation_size)
+            train_indices = [indices[i] for i in train_indices]
+            valid_indices = [indices[i] for i in valid_indices]
+        else:
+            random.shuffle(indices)
+            valid_start_idx = max(len(indices) - self.validation_size, 0)
+            train_indices, valid_indices = indices[:valid_start_idx], indices[valid_start_idx:]
+
         # Shuffle in unison.
-        zipped = list(zip(image_a_paths, image_b_paths, flow_paths))
-        random.shuffle(zipped)
-        image_a_paths, image_b_paths, flow_paths = zip(*zipped)
+        random.shuffle(train_indices)
+        ordered_indices = train_indices + valid_indices
+        image_a_paths = [image_a_paths[i] for i in ordered_indices]
+        image_b_paths = [image_b_paths[i] for i in ordered_indices]
+        flow_paths = [flow_paths[i] for i in ordered_indices]
 
         def _write(filename, iter_range):
             if self.verbose:
@@ -58,17 +89,15 @@ class FlowDataPreprocessor:
 
             Parallel(n_jobs=multiprocessing.cpu_count(), backend="threading")(
                 delayed(_write_shard)(shard_id, shard_range, image_a_paths, image_b_paths,
-                                      flow_paths, filename, self.directory, self.verbose, self.max_flow)
+                                      flow_paths, filename, self.directory, self.verbose)
                 for shard_id, shard_range in enumerate(sharded_iter_ranges)
             )
 
-        valid_start_idx = len(image_a_paths) - self.validation_size
-        _write(FlowDataSet.TRAIN_FILENAME, range(0, valid_start_idx))
-        _write(FlowDataSet.VALID_FILENAME, range(valid_start_idx, len(image_a_paths)))
+        _write(FlowDataSet.TRAIN_FILENAME, range(0, len(train_indices)))
+        _write(FlowDataSet.VALID_FILENAME, range(len(train_indices), len(ordered_indices)))
 
 
-def _write_shard(shard_id, shard_range, image_a_paths, image_b_paths, flow_paths, filename, directory, verbose,
-                 max_flow):
+def _write_shard(shard_id, shard_range, image_a_paths, image_b_paths, flow_paths, filename, directory, verbose):
     """
     :param shard_id: Index of the shard.
     :param shard_range: Iteration range of the shard.
@@ -77,8 +106,6 @@ def _write_shard(shard_id, shard_range, image_a_paths, image_b_paths, flow_paths
     :param filename: Base name of the output shard.
     :param directory: Output directory.
     :param verbose: Whether to print to console.
-    :param max_flow: Float. Maximum flow magnitude of the flow image. Any examples with flow magnitude greater than this
-        will be ignored.
     :return: Nothing.
     """
     if verbose and len(shard_range) > 0:
@@ -88,13 +115,9 @@ def _write_shard(shard_id, shard_range, image_a_paths, image_b_paths, flow_paths
     options = tf.python_io.TFRecordOptions(tf.python_io.TFRecordCompressionType.GZIP)
     writer = tf.python_io.TFRecordWriter(record_name, options=options)
     num_examples_written = 0
-    for i in shard_range:
-        # Read from file.
-        flow = read_flow_file(flow_paths[i])
-        if np.amax(np.linalg.norm(flow, axis=-1)) > max_flow:
-            if verbose:
-                print(flow_paths[i], 'has a flow magnitude greater than', max_flow)
-            continue
+    # A reader thread per shard overlaps reading the flows with decoding the images.
+    flows = read_flow_files([flow_paths[i] for i in shard_range], num_threads=1, prefetch=2)
+    for i, flow in zip(shard_range, flows):
         # Read and decode images as bytes to save memory.
         image_a = read_image(image_a_paths[i], as_float=False)
         image_b = read_image(image_b_paths[i], as_float=False)
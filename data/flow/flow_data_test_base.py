@@ -4,6 +4,7 @@ import unittest
 import numpy as np
 import tensorflow as tf
 from common.utils.data import silently_remove_file
+from data.flow.flow_statistics import MANIFEST_FILENAME
 
 
 class TestFlowDataSet:
@@ -33,6 +34,20 @@ class TestFlowDataSet:
             self.assertListEqual(image_a_paths, self.expected_image_a_paths)
             self.assertListEqual(image_b_paths, self.expected_image_b_paths)
 
+        def test_statistics(self):
+            _, _, flow_paths = self.data_set_preprocessor.get_data_paths()
+            statistics = self.data_set_preprocessor.get_statistics(flow_paths)
+            self.assertEqual(len(flow_paths), len(statistics))
+            for sample in statistics:
+                self.assertListEqual(self.resolution, [sample['height'], sample['width']])
+                self.assertGreaterEqual(sample['max_magnitude'], sample['mean_magnitude'])
+                self.assertEqual(self.resolution[0] * self.resolution[1], sum(sample['histogram']))
+            manifest_path = os.path.join(self.data_set_preprocessor.directory, MANIFEST_FILENAME)
+            self.assertTrue(os.path.isfile(manifest_path))
+
+            # The second time, the statistics come from the manifest.
+            self.assertListEqual(statistics, self.data_set_preprocessor.get_statistics(flow_paths))
+
         def test_data_read_write(self):
             self.data_set_preprocessor.preprocess_raw()
             output_paths = self.data_set.get_train_file_names() + self.data_set.get_validation_file_names()
@@ -79,7 +94,51 @@ class TestFlowDataSet:
                 end_of_dataset = True
             self.assertTrue(end_of_dataset)
 
+        def test_data_read_towers(self):
+            self.data_set_preprocessor.preprocess_raw()
+            self.data_set.set_num_towers(2)
+            self.assertListEqual([1, 1], self.data_set.get_tower_batch_sizes())
+            self.data_set.load(self.sess)
+
+            tower_batches = self.data_set.get_next_tower_batches()
+            self.assertEqual(2, len(tower_batches))
+            query = [tensor for tower_batch in tower_batches for tensor in tower_batch]
+            query += list(self.data_set.get_next_batch())
+            results = self.sess.run(query, feed_dict=self.data_set.get_train_feed_dict())
+            tower_0_images_a, _, _, tower_1_images_a, _, _, images_a, images_b, flows = results
+            self.assertTupleEqual(tower_0_images_a.shape, (1, self.resolution[0], self.resolution[1], 3))
+            self.assertTupleEqual(tower_1_images_a.shape, (1, self.resolution[0], self.resolution[1], 3))
+            self.assertTupleEqual(images_a.shape, (2, self.resolution[0], self.resolution[1], 3))
+            self.assertTupleEqual(images_b.shape, (2, self.resolution[0], self.resolution[1], 3))
+            self.assertTupleEqual(flows.shape, (2, self.resolution[0], self.resolution[1], 2))
+
+            # The full batch is the concatenation of the tower batches from the same run.
+            self.assertTrue(np.allclose(tower_0_images_a, images_a[0:1]))
+            self.assertTrue(np.allclose(tower_1_images_a, images_a[1:2]))
+            # The towers read disjoint files.
+            self.assertFalse(np.allclose(tower_0_images_a, tower_1_images_a))
+
+            # The only validation example is read, even though it leaves the second tower empty.
+            self.data_set.init_validation_data(self.sess)
+            results = self.sess.run(query, feed_dict=self.data_set.get_validation_feed_dict())
+            tower_0_images_a, _, _, tower_1_images_a, _, _, images_a, images_b, flows = results
+            self.assertTupleEqual(tower_0_images_a.shape, (0, self.resolution[0], self.resolution[1], 3))
+            self.assertTupleEqual(tower_1_images_a.shape, (1, self.resolution[0], self.resolution[1], 3))
+            self.assertTupleEqual(images_a.shape, (1, self.resolution[0], self.resolution[1], 3))
+            self.assertTupleEqual(flows.shape, (1, self.resolution[0], self.resolution[1], 2))
+            end_of_dataset = False
+            try:
+                self.sess.run(query, feed_dict=self.data_set.get_validation_feed_dict())
+            except tf.errors.OutOfRangeError:
+                end_of_dataset = True
+            self.assertTrue(end_of_dataset)
+
+            # Training continues after validation.
+            images_a = self.sess.run(self.data_set.get_next_batch()[0], feed_dict=self.data_set.get_train_feed_dict())
+            self.assertTupleEqual(images_a.shape, (2, self.resolution[0], self.resolution[1], 3))
+
         def tearDown(self):
             output_paths = self.data_set.get_train_file_names() + self.data_set.get_validation_file_names()
             for output_path in output_paths:
                 silently_remove_file(output_path)
+            silently_remove_file(os.path.join(self.data_set_preprocessor.directory, MANIFEST_FILENAME))
@@ -0,0 +1,182 @@
+import json
+import multiprocessing
+import os
+import random
+import numpy as np
+from common.utils.flow_io import map_flow_file
+
+
+MANIFEST_FILENAME = 'flowdataset_manifest.json'
+# Boundaries of the flow magnitude histogram bins, in pixels. Bin i counts the magnitudes in
+# [HISTOGRAM_BIN_EDGES[i - 1], HISTOGRAM_BIN_EDGES[i]), so there is one more bin than there are edges.
+HISTOGRAM_BIN_EDGES = [1.0, 2.0, 4.0, 8.0, 16.0, 32.0, 64.0, 128.0, 256.0, 512.0, 1024.0]
+# Number of flow rows that are processed at once, which bounds the size of the scratch buffer.
+ROWS_PER_BLOCK = 64
+
+
+def compute_flow_statistics(flow_path):
+    """
+    Computes the statistics of one flow file. The flow is memory-mapped and processed in blocks of rows, and only
+    squared magnitudes are compared, so the full-size magnitude array of np.linalg.norm is never allocated.
+    :param flow_path: Str.
+    :return: Dict with keys:
+             'height': Int. Also the height of the images.
+             'width': Int. Also the width of the images.
+             'max_magnitude': Float. Maximum flow magnitude in pixels.
+             'mean_magnitude': Float. Mean flow magnitude in pixels.
+             'histogram': List of ints. Number of pixels in every bin of HISTOGRAM_BIN_EDGES.
+    """
+    flow = map_flow_file(flow_path)
+    if flow is None:
+        raise Exception('Invalid flow file ' + flow_path + '.')
+    height, width = flow.shape[:2]
+    squared_edges = np.square(np.asarray(HISTOGRAM_BIN_EDGES, dtype=np.float32))
+    histogram = np.zeros(len(HISTOGRAM_BIN_EDGES) + 1, dtype=np.int64)
+    max_squared_magnitude = 0.0
+    magnitude_sum = 0.0
+
+    squared_magnitudes = np.empty((min(ROWS_PER_BLOCK, height), width), dtype=np.float32)
+    for start in range(0, height, ROWS_PER_BLOCK):
+        block = flow[start:start + ROWS_PER_BLOCK]
+        block_squared_magnitudes = squared_magnitudes[:block.shape[0]]
+        # u^2 + v^2, written straight into the scratch buffer.
+        np.einsum('ijk,ijk->ij', block, block, out=block_squared_magnitudes)
+        max_squared_magnitude = max(max_squared_magnitude, float(np.max(block_squared_magnitudes)))
+        bins = np.searchsorted(squared_edges, block_squared_magnitudes.ravel(), side='right')
+        histogram += np.bincount(bins, minlength=len(histogram))
+        # The square root is only needed for the mean, and it is taken in place.
+        np.sqrt(block_squared_magnitudes, out=block_squared_magnitudes)
+        magnitude_sum += float(np.sum(block_squared_magnitudes, dtype=np.float64))
+
+    return {
+        'height': int(height),
+        'width': int(width),
+        'max_magnitude': float(np.sqrt(max_squared_magnitude)),
+        'mean_magnitude': magnitude_sum / max(height * width, 1),
+        'histogram': histogram.tolist()
+    }
+
+
+def compute_dataset_statistics(flow_paths, manifest_path=None, num_processes=multiprocessing.cpu_count(),
+                               verbose=False):
+    """
+    Computes the statistics of many flow files with a pool of processes. The results are cached in a manifest, so that
+    only new or modified files are processed again.
+    :param flow_paths: List of str.
+    :param manifest_path: Str or None. Path of the json manifest. Paths in it are relative to its directory.
+    :param num_processes: Int.
+    :param verbose: Bool.
+    :return: List of dicts in the format of compute_flow_statistics, in the same order as flow_paths.
+    """
+    manifest = _read_manifest(manifest_path)
+    manifest_directory = os.path.dirname(manifest_path) if manifest_path is not None else ''
+
+    def _get_key(flow_path):
+        return os.path.relpath(flow_path, manifest_directory) if manifest_path is not None else flow_path
+
+    def _get_file_info(flow_path):
+        stat = os.stat(flow_path)
+        return {'size': stat.st_size, 'mtime': stat.st_mtime}
+
+    samples = manifest['samples']
+    file_infos = [_get_file_info(flow_path) for flow_path in flow_paths]
+    stale_paths = [flow_path for flow_path, file_info in zip(flow_paths, file_infos)
+                   if _get_key(flow_path) not in samples or samples[_get_key(flow_path)]['file'] != file_info]
+    if verbose:
+        print('Computing the statistics of', len(stale_paths), 'of', len(flow_paths), 'flows...')
+
+    if len(stale_paths) > 0:
+        pool = multiprocessing.Pool(num_processes)
+        chunk_size = max(1, min(16, len(stale_paths) // (4 * num_processes)))
+        for flow_path, statistics in zip(stale_paths, pool.imap(compute_flow_statistics, stale_paths, chunk_size)):
+            samples[_get_key(flow_path)] = {'file': _get_file_info(flow_path), 'statistics': statistics}
+        pool.close()
+        pool.join()
+        if manifest_path is not None:
+            _write_manifest(manifest_path, manifest)
+
+    return [samples[_get_key(flow_path)]['statistics'] for flow_path in flow_paths]
+
+
+def get_stratified_split(statistics, validation_size, key='mean_magnitude', seed=None):
+    """
+    Splits the samples so that the validation set covers the whole range of a statistic. The samples are sorted by the
+    statistic and divided into validation_size strata of (nearly) equal size, and one random sample of every stratum
+    goes to validation.
+    :param statistics: List of dicts in the format of compute_flow_statistics.
+    :param validation_size: Int.
+    :param key: Str. Statistic to stratify by.
+    :param seed: Int or None.
+    :return: train_indices: List of ints.
+             validation_indices: List of ints.
+    """
+    validation_size = min(validation_size, len(statistics))
+    if validation_size <= 0:
+        return list(range(len(statistics))), []
+    rng = random.Random(seed)
+    sorted_indices = sorted(range(len(statistics)), key=lambda i: statistics[i][key])
+    strata = np.array_split(np.asarray(sorted_indices, dtype=np.int64), validation_size)
+    validation_indices = sorted(int(rng.choice(stratum)) for stratum in strata)
+    validation_set = set(validation_indices)
+    train_indices = [i for i in range(len(statistics)) if i not in validation_set]
+    return train_indices, validation_indices
+
+
+def summarize_statistics(statistics):
+    """
+    :param statistics: List of dicts in the format of compute_flow_statistics.
+    :return: Dict with keys:
+             'num_samples': Int.
+             'sizes': Dict. Key is a (height, width) tuple and value is the number of samples of that size.
+             'max_magnitude_percentiles': Dict. Key is a percentile (int) and value is the max magnitude at it.
+             'mean_magnitude': Float. Mean flow magnitude over all pixels.
+             'histogram': List of ints. Number of pixels in every bin of HISTOGRAM_BIN_EDGES over all samples.
+    """
+    sizes = {}
+    histogram = np.zeros(len(HISTOGRAM_BIN_EDGES) + 1, dtype=np.int64)
+    magnitude_sum = 0.0
+    num_pixels = 0
+    for sample in statistics:
+        size = (sample['height'], sample['width'])
+        sizes[size] = sizes.get(size, 0) + 1
+        histogram += np.asarray(sample['histogram'], dtype=np.int64)
+        magnitude_sum += sample['mean_magnitude'] * sample['height'] * sample['width']
+        num_pixels += sample['height'] * sample['width']
+    max_magnitudes = [sample['max_magnitude'] for sample in statistics]
+    percentiles = [50, 90, 99, 100]
+    return {
+        'num_samples': len(statistics),
+        'sizes': sizes,
+        'max_magnitude_percentiles': dict(zip(percentiles, np.percentile(max_magnitudes, percentiles).tolist()))
+        if len(max_magnitudes) > 0 else {},
+        'mean_magnitude': magnitude_sum / max(num_pixels, 1),
+        'histogram': histogram.tolist()
+    }
+
+
+def _read_manifest(manifest_path):
+    """
+    :param manifest_path: Str or None.
+    :return: Dict. The manifest, or an empty one if it doesn't exist or was made with other histogram bins.
+    """
+    empty_manifest = {'histogram_bin_edges': HISTOGRAM_BIN_EDGES, 'samples': {}}
+    if manifest_path is None or not os.path.isfile(manifest_path):
+        return empty_manifest
+    with open(manifest_path, 'r') as file:
+        manifest = json.load(file)
+    if manifest.get('histogram_bin_edges') != HISTOGRAM_BIN_EDGES:
+        return empty_manifest
+    return manifest
+
+
+def _write_manifest(manifest_path, manifest):
+    """
+    Writes to a temporary file first, so that an interrupted write never leaves a corrupt manifest behind.
+    :param manifest_path: Str.
+    :param manifest: Dict.
+    :return: Nothing.
+    """
+    temp_path = manifest_path + '.tmp'
+    with open(temp_path, 'w') as file:
+        json.dump(manifest, file, indent=1, sort_keys=True)
+    os.replace(temp_path, manifest_path)
@@ -0,0 +1,82 @@
+import os
+import unittest
+import numpy as np
+from common.utils.data import silently_remove_file
+from common.utils.flow import write_flow_file
+from data.flow import flow_statistics
+from data.flow.flow_statistics import compute_flow_statistics, compute_dataset_statistics, get_stratified_split, \
+    summarize_statistics, HISTOGRAM_BIN_EDGES
+
+
+class TestFlowStatistics(unittest.TestCase):
+    def setUp(self):
+        self.directory = os.path.join('data', 'flow', 'test_data_flow_statistics')
+        os.makedirs(self.directory, exist_ok=True)
+        self.manifest_path = os.path.join(self.directory, 'manifest.json')
+        self.flow_paths = []
+        for i in range(4):
+            flow = np.zeros((100, 30, 2), dtype=np.float32)
+            flow[..., 0] = 3.0 * i
+            flow[..., 1] = 4.0 * i
+            # The largest magnitude is in the last row block.
+            flow[99, 29] = [0.0, 10.0 * i + 1.0]
+            flow_path = os.path.join(self.directory, 'flow_%d.flo' % i)
+            write_flow_file(flow_path, flow)
+            self.flow_paths.append(flow_path)
+
+    def test_flow_statistics(self):
+        original_rows_per_block = flow_statistics.ROWS_PER_BLOCK
+        flow_statistics.ROWS_PER_BLOCK = 16
+        try:
+            statistics = compute_flow_statistics(self.flow_paths[2])
+        finally:
+            flow_statistics.ROWS_PER_BLOCK = original_rows_per_block
+        self.assertEqual(100, statistics['height'])
+        self.assertEqual(30, statistics['width'])
+        self.assertAlmostEqual(21.0, statistics['max_magnitude'], places=5)
+        self.assertAlmostEqual((2999 * 10.0 + 21.0) / 3000, statistics['mean_magnitude'], places=5)
+        # 2999 pixels of magnitude 10 are in [8, 16) and 1 pixel of magnitude 21 is in [16, 32).
+        expected_histogram = [0] * (len(HISTOGRAM_BIN_EDGES) + 1)
+        expected_histogram[HISTOGRAM_BIN_EDGES.index(16.0)] = 2999
+        expected_histogram[HISTOGRAM_BIN_EDGES.index(32.0)] = 1
+        self.assertListEqual(expected_histogram, statistics['histogram'])
+
+    def test_dataset_statistics(self):
+        statistics = compute_dataset_statistics(self.flow_paths, manifest_path=self.manifest_path, num_processes=2)
+        self.assertListEqual([compute_flow_statistics(flow_path) for flow_path in self.flow_paths], statistics)
+        self.assertTrue(os.path.isfile(self.manifest_path))
+
+        # Only the modified file is computed again.
+        write_flow_file(self.flow_paths[0], np.ones((10, 20, 2), dtype=np.float32))
+        os.utime(self.flow_paths[0], (0, 0))
+        statistics = compute_dataset_statistics(self.flow_paths, manifest_path=self.manifest_path, num_processes=2)
+        self.assertListEqual([10, 20], [statistics[0]['height'], statistics[0]['width']])
+        self.assertEqual(100, statistics[1]['height'])
+
+        summary = summarize_statistics(statistics)
+        self.assertEqual(4, summary['num_samples'])
+        self.assertDictEqual({(10, 20): 1, (100, 30): 3}, summary['sizes'])
+        self.assertAlmostEqual(31.0, summary['max_magnitude_percentiles'][100], places=5)
+        self.assertEqual(10 * 20 + 3 * 100 * 30, sum(summary['histogram']))
+
+    def test_stratified_split(self):
+        statistics = [{'mean_magnitude': float(magnitude)} for magnitude in [5, 0, 9, 3, 7, 1, 8, 2, 6, 4]]
+        train_indices, validation_indices = get_stratified_split(statistics, 2, seed=0)
+        self.assertEqual(2, len(validation_indices))
+        self.assertListEqual(list(range(10)), sorted(train_indices + validation_indices))
+        # One validation sample from the lower half of the magnitudes and one from the upper half.
+        magnitudes = sorted(statistics[i]['mean_magnitude'] for i in validation_indices)
+        self.assertLess(magnitudes[0], 5.0)
+        self.assertGreaterEqual(magnitudes[1], 5.0)
+
+        self.assertTupleEqual(([0, 1], []), get_stratified_split(statistics[:2], 0))
+
+    def tearDown(self):
+        for flow_path in self.flow_paths:
+            silently_remove_file(flow_path)
+        silently_remove_file(self.manifest_path)
+        os.rmdir(self.directory)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,12 +1,14 @@
 import glob
+import multiprocessing
 import os.path
 from data.flow.flow_data_preprocessor import FlowDataPreprocessor
 
 
 class FlyingChairsFlowDataPreprocessor(FlowDataPreprocessor):
-    def __init__(self, directory, validation_size=1, max_flow=1000.0, shard_size=1, verbose=False):
+    def __init__(self, directory, validation_size=1, max_flow=1000.0, shard_size=1, stratified_validation=False,
+                 num_processes=multiprocessing.cpu_count(), verbose=False):
         super().__init__(directory, validation_size=validation_size, max_flow=max_flow, shard_size=shard_size,
-                         verbose=verbose)
+                         stratified_validation=stratified_validation, num_processes=num_processes, verbose=verbose)
 
     def get_data_paths(self):
         """
@@ -16,7 +16,8 @@ class InterpDataSet(DataSet):
     TRAIN_TF_RECORD_NAME = 'interp_dataset_train.tfrecords'
     VALIDATION_TF_RECORD_NAME = 'interp_dataset_validation.tfrecords'
 
-    def __init__(self, tf_record_directory, inbetween_locations, batch_size=1, training_augmentations=True):
+    def __init__(self, tf_record_directory, inbetween_locations, batch_size=1, training_augmentations=True,
+                 num_shards=1, shard_index=0):
         """
         :param inbetween_locations: A list of lists. Each element specifies where inbetweens will be placed,
                                     and each configuration will appear with uniform probability.
@@ -25,11 +26,16 @@ class InterpDataSet(DataSet):
                                     where the middle (inbetween) frame is 2 frames away from the first and last frames.
                                     The number of 1s must be the same for each list in this argument.
         :param training_augmentations: Whether to do live augmentations while training.
+        :param num_shards: Int. Number of disjoint subsets to split the training files into, i.e. 1 per worker process.
+        :param shard_index: Int. Which subset of the training files this dataset reads, between [0, num_shards).
         """
-        super().__init__(tf_record_directory, batch_size, training_augmentations=training_augmentations)
+        super().__init__(tf_record_directory, batch_size, training_augmentations=training_augmentations,
+                         num_shards=num_shards, shard_index=shard_index)
 
         # Initialized during load().
-        self.handle_placeholder = None  # Handle placeholder for switching between datasets.
+        self.handle_placeholder = None  # Handle placeholder for switching between datasets, with a single tower.
+        self.train_tower_data = []  # InterpDataSetReaders for the training data. 1 per tower (see set_num_towers).
+        self.tower_batches = []  # Data iterator batches. Tuples of (sequences, sequence_timing).
         self.next_sequences = None  # Data iterator batch.
         self.next_sequence_timing = None  # Data iterator batch.
 
@@ -39,7 +45,8 @@ class InterpDataSet(DataSet):
         self.validation_tf_record_name = 'interp_dataset_validation.tfrecords'
         self.train_data = InterpDataSetReader(self.tf_record_directory, inbetween_locations,
                                               self.train_tf_record_name, batch_size=batch_size,
-                                              do_augment=self.training_augmentations)
+                                              do_augment=self.training_augmentations,
+                                              num_shards=self.num_shards, shard_index=self.shard_index)
         self.validation_data = InterpDataSetReader(self.tf_record_directory, inbetween_locations,
                                                    self.validation_tf_record_name, batch_size=batch_size)
 
@@ -68,28 +75,62 @@ class InterpDataSet(DataSet):
         """
         Overriden.
         """
+        tower_batch_sizes = self.get_tower_batch_sizes()
+        num_towers = len(tower_batch_sizes)
+        if num_towers == 1:
+            self.train_tower_data = [self.train_data]
+        else:
+            # Each tower reads a disjoint subset of the training files.
+            self.train_tower_data = [
+                InterpDataSetReader(self.tf_record_directory, self.inbetween_locations, self.train_tf_record_name,
+                                    batch_size=tower_batch_size, do_augment=self.training_augmentations,
+                                    num_shards=self.num_shards * num_towers,
+                                    shard_index=self.shard_index * num_towers + i)
+                for i, tower_batch_size in enumerate(tower_batch_sizes)]
+
         with tf.name_scope('interp_data'):
-            self.train_data.load(session, repeat=True, shuffle=True)
+            for train_data in self.train_tower_data:
+                train_data.load(session, repeat=True, shuffle=True)
             self.validation_data.load(session, repeat=False, shuffle=False, initializable=True)
-            self.handle_placeholder = tf.placeholder(tf.string, shape=[])
-            self.iterator = tf.data.Iterator.from_string_handle(
-                self.handle_placeholder, self.train_data.get_output_types(), self.train_data.get_output_shapes())
-            self.next_sequences, self.next_sequence_timing = self.iterator.get_next()
+
+            if num_towers == 1:
+                self.handle_placeholder = tf.placeholder(tf.string, shape=[])
+                self.iterator = tf.data.Iterator.from_string_handle(
+                    self.handle_placeholder, self.train_data.get_output_types(), self.train_data.get_output_shapes())
+                self.tower_batches = [self.iterator.get_next()]
+                self.next_sequences, self.next_sequence_timing = self.tower_batches[0]
+            else:
+                # The validation batches are sliced between the towers (see DataSet._create_tower_batches).
+                self.tower_batches = self._create_tower_batches(
+                    lambda: [train_data.iterator.get_next() for train_data in self.train_tower_data],
+                    self.validation_data.iterator.get_next)
+                self.next_sequences, self.next_sequence_timing = [
+                    tf.concat(tensors, axis=0) for tensors in zip(*self.tower_batches)]
 
     def get_next_batch(self):
         return self.next_sequences, self.next_sequence_timing
 
+    def get_next_tower_batches(self):
+        """
+        Overridden.
+        """
+        return self.tower_batches
+
     def get_train_feed_dict(self):
         """
         Overridden.
         """
-        return {self.handle_placeholder: self.train_data.get_feed_dict_value()}
+        if self.handle_placeholder is not None:
+            return {self.handle_placeholder: self.train_data.get_feed_dict_value()}
+        return {self.validation_placeholder: False}
 
     def get_validation_feed_dict(self):
         """
         Overriden.
         """
-        return {self.handle_placeholder: self.validation_data.get_feed_dict_value()}
+        if self.handle_placeholder is not None:
+            return {self.handle_placeholder: self.validation_data.get_feed_dict_value()}
+        return {self.validation_placeholder: True}
 
     def init_validation_data(self, session):
         """
@@ -100,7 +141,7 @@ class InterpDataSet(DataSet):
 
 class InterpDataSetReader:
     def __init__(self, directory, inbetween_locations, tf_record_name, batch_size=1, do_augment=False,
-                 crop_size=(256, 256)):
+                 crop_size=(256, 256), num_shards=1, shard_index=0):
         """
         :param inbetween_locations: A list of lists. Each element specifies where inbetweens will be placed,
                                     and each configuration will appear with uniform probability.
@@ -113,6 +154,8 @@ class InterpDataSetReader:
                            If None, then no cropping will be performed.
         :param do_augment: Whether to augment the data when it's read in.
                            If False, the image crop will always be taken in the center.
+        :param num_shards: Int. Number of disjoint subsets to split the tf record files into.
+        :param shard_index: Int. Which subset of the tf record files to read, between [0, num_shards).
         """
 
         # Initialized during load().
@@ -126,6 +169,8 @@ class InterpDataSetReader:
         self.directory = directory
         self.tf_record_name = tf_record_name
         self.inbetween_locations = inbetween_locations
+        self.num_shards = num_shards
+        self.shard_index = shard_index
 
         # Check for number of ones, as the number of elements per-sequence must be the same.
         num_ones = (np.asarray(self.inbetween_locations[0]) == 1).sum()
@@ -216,7 +261,16 @@ class InterpDataSetReader:
 
         # Shuffle filenames.
         # Ideas taken from: https://github.com/tensorflow/tensorflow/issues/14857
-        dataset = tf.data.Dataset.list_files(self._get_tf_record_pattern(), shuffle=shuffle)
+        if self.num_shards > 1:
+            # The files must be split in a deterministic order so that the shards are disjoint across workers.
+            num_files = len(self.get_tf_record_names())
+            assert num_files >= self.num_shards, 'There must be at least 1 tf record file per shard.'
+            dataset = tf.data.Dataset.list_files(self._get_tf_record_pattern(), shuffle=False)
+            dataset = dataset.shard(self.num_shards, self.shard_index)
+            if shuffle:
+                dataset = dataset.shuffle(num_files)
+        else:
+            dataset = tf.data.Dataset.list_files(self._get_tf_record_pattern(), shuffle=shuffle)
         dataset = tf.data.TFRecordDataset(dataset)
 
         # Parse sequences.
@@ -0,0 +1,71 @@
+import argparse
+import multiprocessing
+from data.flow.flow_statistics import summarize_statistics, HISTOGRAM_BIN_EDGES
+from data.flow.sintel.sintel_preprocessor import SintelFlowDataPreprocessor
+from data.flow.flyingchairs.flyingchairs_preprocessor import FlyingChairsFlowDataPreprocessor
+from data.flow.flyingthings.flyingthings_preprocessor import FlyingThingsFlowDataPreprocessor
+
+
+def main():
+    """
+    Computes the flow statistics of a raw dataset (see mains/create_flow_dataset.py for the supported directory
+    structures) and prints a summary. The statistics are cached in the dataset manifest, so mains/create_flow_dataset.py
+    can filter and split the examples without reading the flows again.
+    """
+    parser = argparse.ArgumentParser()
+    add_args(parser)
+    args = parser.parse_args()
+
+    preprocessor_constructors = {
+        'sintel': SintelFlowDataPreprocessor,
+        'flyingchairs': FlyingChairsFlowDataPreprocessor,
+        'flyingthings': FlyingThingsFlowDataPreprocessor
+    }
+    preprocessor = preprocessor_constructors[args.data_source](args.directory, num_processes=args.num_processes,
+                                                               verbose=True)
+    _, _, flow_paths = preprocessor.get_data_paths()
+    statistics = preprocessor.get_statistics(flow_paths)
+    num_filtered = len([sample for sample in statistics if sample['max_magnitude'] > args.max_flow])
+    print_summary(summarize_statistics(statistics), args.max_flow, num_filtered)
+
+
+def print_summary(summary, max_flow, num_filtered):
+    """
+    :param summary: Dict in the format of summarize_statistics.
+    :param max_flow: Float. Maximum flow magnitude used for filtering.
+    :param num_filtered: Int. Number of examples with a flow magnitude above max_flow.
+    :return: Nothing.
+    """
+    print('Examples:', summary['num_samples'])
+    print('')
+    print('%-20s %10s' % ('Size (H x W)', 'Examples'))
+    for (height, width), count in sorted(summary['sizes'].items()):
+        print('%-20s %10d' % ('%d x %d' % (height, width), count))
+    print('')
+    print('Mean flow magnitude: %.2f' % summary['mean_magnitude'])
+    for percentile, magnitude in sorted(summary['max_magnitude_percentiles'].items()):
+        print('Max flow magnitude, percentile %d: %.2f' % (percentile, magnitude))
+    print('')
+    print('%-20s %14s %10s' % ('Magnitude', 'Pixels', 'Fraction'))
+    lower_edges = [0.0] + HISTOGRAM_BIN_EDGES
+    upper_edges = HISTOGRAM_BIN_EDGES + [float('inf')]
+    num_pixels = max(sum(summary['histogram']), 1)
+    for lower, upper, count in zip(lower_edges, upper_edges, summary['histogram']):
+        print('%-20s %14d %10.6f' % ('[%g, %g)' % (lower, upper), count, count / num_pixels))
+    print('')
+    print('Examples with a flow magnitude above %g (ignored by create_flow_dataset): %d' % (max_flow, num_filtered))
+
+
+def add_args(parser):
+    parser.add_argument('-d', '--directory', type=str,
+                        help='Directory of the raw dataset.')
+    parser.add_argument('-src', '--data_source', type=str, default='sintel',
+                        help='Data source can be sintel, flyingchairs, or flyingthings.')
+    parser.add_argument('-m', '--max_flow', type=float, default=1000.0,
+                        help='Maximum flow magnitude used for filtering.')
+    parser.add_argument('-p', '--num_processes', type=int, default=multiprocessing.cpu_count(),
+                        help='Number of processes computing the flow statistics.')
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,5 @@
 import argparse
+import multiprocessing
 from data.flow.sintel.sintel_preprocessor import SintelFlowDataPreprocessor
 from data.flow.flyingchairs.flyingchairs_preprocessor import FlyingChairsFlowDataPreprocessor
 from data.flow.flyingthings.flyingthings_preprocessor import FlyingThingsFlowDataPreprocessor
@@ -66,7 +67,9 @@ def main():
         preprocessor_constructor = FlyingThingsFlowDataPreprocessor
 
     preprocessor = preprocessor_constructor(args.directory, validation_size=args.num_validation,
-                                            shard_size=args.shard_size, verbose=True)
+                                            max_flow=args.max_flow, shard_size=args.shard_size,
+                                            stratified_validation=args.stratified_validation,
+                                            num_processes=args.num_processes, verbose=True)
     preprocessor.preprocess_raw()
 
 
@@ -79,6 +82,12 @@ def add_args(parser):
                         help='Maximum number of data examples in a shard.')
     parser.add_argument('-src', '--data_source', type=str, default='sintel',
                         help='Data source can be sintel, flyingchairs, or flyingthings.')
+    parser.add_argument('-m', '--max_flow', type=float, default=1000.0,
+                        help='Data examples with a larger flow magnitude are ignored.')
+    parser.add_argument('-sv', '--stratified_validation', action='store_true',
+                        help='Spread the validation examples over the range of mean flow magnitudes.')
+    parser.add_argument('-p', '--num_processes', type=int, default=multiprocessing.cpu_count(),
+                        help='Number of processes computing the flow statistics.')
 
 
 if __name__ == "__main__":
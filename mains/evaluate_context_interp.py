@@ -0,0 +1,165 @@
+import argparse
+import time
+import numpy as np
+import tensorflow as tf
+from common.utils.inference import InferenceEngine
+from common.utils.input_adapter import InputAdapter
+from common.utils.tf import strict_restore
+from context_interp.model import ContextInterp, PRESETS, QUALITY, SPLAT, BACKWARD_WARP
+from data.interp.interp_data import InterpDataSet, InterpDataSetReader
+
+
+def main():
+    """
+    Evaluates trained ContextInterp checkpoints on the validation split of an InterpDataSet, and prints the PSNR of the
+    middle frames against the throughput of every speed/quality preset and warp mode.
+    """
+    parser = argparse.ArgumentParser()
+    add_args(parser)
+    args = parser.parse_args()
+
+    presets = args.presets.split(',')
+    checkpoint_directories = args.checkpoint_directories.split(',')
+    if len(checkpoint_directories) == 1:
+        checkpoint_directories = checkpoint_directories * len(presets)
+    assert len(checkpoint_directories) == len(presets), 'There must be one checkpoint directory, or one per preset.'
+
+    print('Reading the validation data...')
+    crop_size = tuple(int(size) for size in args.crop_size.split(','))
+    triplets = read_triplets(args.directory, args.batch_size, crop_size, args.max_batches)
+
+    # The warp modes have the same variables, so they use the same checkpoints.
+    configs = [(preset, checkpoint_directory, warp_mode)
+               for preset, checkpoint_directory in zip(presets, checkpoint_directories)
+               for warp_mode in args.warp_modes.split(',')]
+    psnrs = []
+    inference_times = []
+    num_frames = sum(len(triplet_batch) for triplet_batch in triplets)
+    for preset, checkpoint_directory, warp_mode in configs:
+        print('Evaluating the', preset, 'preset with', warp_mode, '...')
+        psnr, inference_time = evaluate_preset(preset, checkpoint_directory, triplets, args.num_runs,
+                                               warp_mode=warp_mode)
+        psnrs.append(psnr)
+        inference_times.append(inference_time)
+    print('')
+    print_config_table([(preset, warp_mode) for preset, _, warp_mode in configs], psnrs, inference_times,
+                       num_frames * args.num_runs)
+
+
+def read_triplets(directory, batch_size, crop_size, max_batches=None):
+    """
+    :param directory: Str. Directory of the InterpDataSet tf records.
+    :param batch_size: Int.
+    :param crop_size: Tuple of (int (H), int (W)). The validation examples are center cropped to this.
+    :param max_batches: Int or None. If not None, at most this many batches are read.
+    :return: List of float32 np arrays of shape [batch_size, 3, H, W, 3]. The frames are ordered as in
+             (image_a, middle frame, image_b).
+    """
+    graph = tf.Graph()
+    with graph.as_default():
+        session = tf.Session()
+        reader = InterpDataSetReader(directory, [[1]], InterpDataSet.VALIDATION_TF_RECORD_NAME, batch_size=batch_size,
+                                     crop_size=crop_size)
+        reader.load(session, max_num_elements=max_batches * batch_size if max_batches is not None else None)
+        next_sequences, _ = reader.iterator.get_next()
+        triplets = []
+        while True:
+            try:
+                triplets.append(session.run(next_sequences))
+            except tf.errors.OutOfRangeError:
+                break
+        session.close()
+    return triplets
+
+
+def evaluate_preset(preset, checkpoint_directory, triplets, num_runs=1, warp_mode=SPLAT):
+    """
+    Every preset is built in its own graph, since the presets can have variables of different shapes under the same
+    names. The checkpoint must have all of the variables of the preset.
+    :param preset: Str. One of the keys of PRESETS.
+    :param checkpoint_directory: Str. Directory of the checkpoints of a ContextInterp trained with the preset.
+    :param triplets: List of np arrays in the format of read_triplets.
+    :param num_runs: Int. Number of times every batch is timed.
+    :param warp_mode: Str. See ContextInterp.
+    :return: psnr: Float. PSNR over all middle frames, in dB.
+             inference_time: Float. Seconds spent in inference over all runs, excluding the one-time cost of a new
+                             resolution.
+    """
+    graph = tf.Graph()
+    with graph.as_default():
+        config_proto = tf.ConfigProto()
+        config_proto.gpu_options.allow_growth = True
+        session = tf.Session(config=config_proto)
+        model = ContextInterp(preset=preset, warp_mode=warp_mode)
+        t = tf.placeholder(shape=[], dtype=tf.float32)
+        checkpoint_file = tf.train.latest_checkpoint(checkpoint_directory)
+        assert checkpoint_file is not None, 'No checkpoint in ' + checkpoint_directory + '.'
+        engine = InferenceEngine(lambda inputs: model.get_forward(inputs[0], inputs[1], t, training=False)[0],
+                                 lambda sess: strict_restore(sess, checkpoint_file), [3, 3], shared_inputs=[t],
+                                 session=session)
+    input_adapter = InputAdapter(model.get_size_multiple())
+
+    squared_error_sum = 0.0
+    num_values = 0
+    inference_time = 0.0
+    for triplet_batch in triplets:
+        images_a = np.stack([input_adapter.adapt(triplet[0]) for triplet in triplet_batch])
+        images_b = np.stack([input_adapter.adapt(triplet[2]) for triplet in triplet_batch])
+        engine.warm_up([images_a.shape[1:3]], batch_size=len(triplet_batch))
+        for _ in range(num_runs):
+            start = time.time()
+            interpolated = engine.run([images_a, images_b], shared_values=[0.5])
+            inference_time += time.time() - start
+
+        for triplet, image in zip(triplet_batch, interpolated):
+            image = np.clip(input_adapter.restore_image(image, triplet[1].shape), 0.0, 1.0)
+            squared_error_sum += float(np.sum(np.square(image - triplet[1]), dtype=np.float64))
+            num_values += image.size
+    session.close()
+
+    mean_squared_error = squared_error_sum / max(num_values, 1)
+    psnr = 10.0 * np.log10(1.0 / max(mean_squared_error, 1e-10))
+    return psnr, inference_time
+
+
+def print_config_table(configs, psnrs, inference_times, num_frames):
+    """
+    Prints the accuracy against the throughput of every configuration.
+    :param configs: List of (preset (str), warp mode (str)) tuples.
+    :param psnrs: List of floats, one per configuration.
+    :param inference_times: List of floats. Seconds spent in inference, one per configuration.
+    :param num_frames: Int. Number of interpolated frames that every configuration was timed on.
+    :return: Nothing.
+    """
+    print('%-12s %-14s %10s %12s %10s' % ('Preset', 'Warp mode', 'PSNR (dB)', 'Latency (ms)', 'fps'))
+    for (preset, warp_mode), psnr, inference_time in zip(configs, psnrs, inference_times):
+        print('%-12s %-14s %10.2f %12.2f %10.2f' % (
+            preset, warp_mode, psnr, 1000.0 * inference_time / max(num_frames, 1),
+            num_frames / max(inference_time, 1e-9)))
+
+
+def add_args(parser):
+    parser.add_argument('-d', '--directory', type=str,
+                        help='Directory of the InterpDataSet tf records.')
+    parser.add_argument('-c', '--checkpoint_directories', type=str,
+                        help='Comma separated checkpoint directories, one per preset. A single directory is used for '
+                             'all presets, which works for presets with the same variables (i.e. balanced and '
+                             'quality).')
+    parser.add_argument('-p', '--presets', type=str, default=QUALITY,
+                        help='Comma separated presets to compare, i.e. fast,balanced,quality. Can be ' +
+                             ', '.join(sorted(PRESETS.keys())) + '.')
+    parser.add_argument('-w', '--warp_modes', type=str, default=SPLAT,
+                        help='Comma separated warp modes to compare for every preset, i.e. ' + SPLAT + ',' +
+                             BACKWARD_WARP + '.')
+    parser.add_argument('-b', '--batch_size', type=int, default=4,
+                        help='Size of the batch.')
+    parser.add_argument('-s', '--crop_size', type=str, default='256,256',
+                        help='Height and width that the validation examples are center cropped to.')
+    parser.add_argument('-m', '--max_batches', type=int, default=None,
+                        help='If given, at most this many batches of the validation split are evaluated.')
+    parser.add_argument('-r', '--num_runs', type=int, default=1,
+                        help='Number of times every batch is timed.')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,265 @@
+import argparse
+import glob
+import multiprocessing
+import os
+import time
+import numpy as np
+import tensorflow as tf
+from multiprocessing.pool import ThreadPool
+from common.utils.flow import write_flow_file
+from common.utils.flow_io import load_flow_file
+from common.utils.img import read_image
+from common.utils.inference import InferenceEngine
+from common.utils.input_adapter import InputAdapter
+from data.flow.flow_data import FlowDataSet
+from data.flow.sintel.sintel_preprocessor import SintelFlowDataPreprocessor
+from data.flow.flyingchairs.flyingchairs_preprocessor import FlyingChairsFlowDataPreprocessor
+from data.flow.flyingthings.flyingthings_preprocessor import FlyingThingsFlowDataPreprocessor
+from pwcnet.model import PWCNet
+from pwcnet.model_config import load_model_config
+
+
+def main():
+    """
+    Evaluates trained PWC-Net weights on a flow dataset and reports the average endpoint error (AEPE) of every sequence
+    along with the throughput.
+    The data can be either a directory of FlowDataSet tf records (see mains/create_flow_dataset.py), or a raw Sintel,
+    FlyingChairs or FlyingThings directory.
+    With several exit levels, a table of their AEPE against their latency is printed as well.
+    """
+    parser = argparse.ArgumentParser()
+    add_args(parser)
+    args = parser.parse_args()
+
+    print('Creating network...')
+    model = PWCNet(config=load_model_config(args.model_config) if args.model_config is not None else None)
+    # One configuration per (exit level, context network) pair. The context network is left out at levels whose
+    # features don't fit it (see supports_exit_context_network).
+    exit_levels = [int(exit_level) for exit_level in args.exit_levels.split(',')]
+    configs = [(exit_level, not args.no_exit_context_network and model.supports_exit_context_network(exit_level))
+               for exit_level in exit_levels]
+    # The engines share one session, and therefore the model variables, so the weights are only held once. Every exit
+    # level builds all of the variables, so they are restored once, by the first engine that builds a subgraph.
+    config_proto = tf.ConfigProto()
+    config_proto.gpu_options.allow_growth = True
+    session = tf.Session(config=config_proto)
+    restored = []
+
+    def _restore_weights(sess):
+        if len(restored) == 0:
+            model.restore_from(args.weights, sess)
+            restored.append(True)
+
+    engines = [InferenceEngine(_get_build_outputs(model, exit_level, exit_context_network), _restore_weights, [3, 3],
+                               max_cached_shapes=args.max_cached_shapes, session=session)
+               for exit_level, exit_context_network in configs]
+    input_adapter = InputAdapter(model.get_size_multiple(), mode=args.adapt_mode)
+
+    print('Evaluating...')
+    examples = read_examples(args.directory, args.data_source, args.split, args.num_readers)
+    config_errors = [{} for _ in configs]
+    inference_times = [0.0 for _ in configs]
+    num_frames = 0
+    start_time = time.time()
+    # Examples whose adapted resolutions are the same are batched together.
+    for _, batch in input_adapter.get_buckets(examples, lambda example: example[2].shape, args.batch_size):
+        for i, engine in enumerate(engines):
+            # Only the first configuration writes its flows.
+            output_directory = args.output_directory if i == 0 else None
+            inference_times[i] += evaluate_batch(engine, batch, input_adapter, config_errors[i], output_directory)
+        num_frames += len(batch)
+    total_time = time.time() - start_time
+
+    print_results(config_errors[0], num_frames, inference_times[0], total_time)
+    if len(configs) > 1:
+        print('')
+        print_exit_level_table(configs, config_errors, inference_times, num_frames)
+    session.close()
+
+
+def _get_build_outputs(model, exit_level, exit_context_network):
+    """
+    :param model: PWCNet.
+    :param exit_level: Int. See PWCNet.get_forward.
+    :param exit_context_network: Bool. See PWCNet.get_forward.
+    :return: Function that builds the final flow from the input image tensors, for an InferenceEngine.
+    """
+    def _build_outputs(inputs):
+        final_flow, _ = model.get_forward(inputs[0], inputs[1], exit_level=exit_level,
+                                          exit_context_network=exit_context_network)
+        return final_flow
+    return _build_outputs
+
+
+def read_examples(directory, data_source, split='valid', num_readers=multiprocessing.cpu_count()):
+    """
+    Reads the examples with a pool of threads, in order.
+    :param directory: Str.
+    :param data_source: Str. One of 'flowdataset', 'sintel', 'flyingchairs' or 'flyingthings'.
+    :param split: Str. For 'flowdataset', which tf records to read. One of 'train', 'valid' or 'all'.
+    :param num_readers: Int. Number of reader threads.
+    :return: Generator of tuples of (name (str), sequence (str), image_a, image_b, flow). The images are float32 np
+             arrays of shape [H, W, 3] and the flow is a float32 np array of shape [H, W, 2].
+    """
+    pool = ThreadPool(num_readers)
+    if data_source == 'flowdataset':
+        file_names = []
+        if split in ['train', 'all']:
+            file_names += glob.glob(os.path.join(directory, '*' + FlowDataSet.TRAIN_FILENAME))
+        if split in ['valid', 'all']:
+            file_names += glob.glob(os.path.join(directory, '*' + FlowDataSet.VALID_FILENAME))
+        for record_examples in pool.imap(_read_tf_record, sorted(file_names)):
+            for example in record_examples:
+                yield example
+    else:
+        preprocessor_constructors = {
+            'sintel': SintelFlowDataPreprocessor,
+            'flyingchairs': FlyingChairsFlowDataPreprocessor,
+            'flyingthings': FlyingThingsFlowDataPreprocessor
+        }
+        preprocessor = preprocessor_constructors[data_source](directory)
+        image_a_paths, image_b_paths, flow_paths = preprocessor.get_data_paths()
+
+        def _read_paths(paths):
+            image_a_path, image_b_path, flow_path = paths
+            name = os.path.splitext(os.path.basename(image_a_path))[0]
+            sequence = os.path.relpath(os.path.dirname(image_a_path), directory)
+            return (name, sequence, read_image(image_a_path, as_float=True), read_image(image_b_path, as_float=True),
+                    load_flow_file(flow_path))
+
+        for example in pool.imap(_read_paths, zip(image_a_paths, image_b_paths, flow_paths), chunksize=4):
+            yield example
+    pool.close()
+
+
+def _read_tf_record(file_name):
+    """
+    :param file_name: Str. Path to a FlowDataSet tf record.
+    :return: List of examples in the format of read_examples.
+    """
+    examples = []
+    sequence = os.path.basename(file_name)
+    options = tf.python_io.TFRecordOptions(tf.python_io.TFRecordCompressionType.GZIP)
+    for i, record in enumerate(tf.python_io.tf_record_iterator(file_name, options=options)):
+        features = tf.train.Example.FromString(record).features.feature
+        H = features[FlowDataSet.HEIGHT].int64_list.value[0]
+        W = features[FlowDataSet.WIDTH].int64_list.value[0]
+        image_a = np.frombuffer(features[FlowDataSet.IMAGE_A_RAW].bytes_list.value[0], dtype=np.uint8)
+        image_b = np.frombuffer(features[FlowDataSet.IMAGE_B_RAW].bytes_list.value[0], dtype=np.uint8)
+        flow = np.frombuffer(features[FlowDataSet.FLOW_RAW].bytes_list.value[0], dtype=np.float32)
+        examples.append(('%s_%d' % (sequence, i), sequence,
+                         image_a.reshape((H, W, 3)).astype(np.float32) / 255.0,
+                         image_b.reshape((H, W, 3)).astype(np.float32) / 255.0,
+                         flow.reshape((H, W, 2))))
+    return examples
+
+
+def evaluate_batch(engine, batch, input_adapter, sequence_errors, output_directory=None):
+    """
+    Runs inference on a batch of examples that all have the same adapted resolution, and accumulates their errors at
+    the original resolution.
+    :param engine: InferenceEngine of PWCNet.
+    :param batch: List of examples in the format of read_examples.
+    :param input_adapter: InputAdapter.
+    :param sequence_errors: Dict. Key is the sequence name and value is a list of [sum of endpoint errors,
+                            number of pixels]. Updated in place.
+    :param output_directory: Str or None. If not None, the predicted flows are written here as .flo files.
+    :return: Float. Seconds spent in inference, excluding the one-time cost of a new resolution.
+    """
+    images_a = np.stack([input_adapter.adapt(example[2]) for example in batch])
+    images_b = np.stack([input_adapter.adapt(example[3]) for example in batch])
+
+    engine.warm_up([images_a.shape[1:3]], batch_size=len(batch))
+    start = time.time()
+    flows = engine.run([images_a, images_b])
+    elapsed = time.time() - start
+
+    for (name, sequence, _, _, gt_flow), flow in zip(batch, flows):
+        flow = input_adapter.restore_flow(flow, gt_flow.shape)
+        endpoint_errors = np.sqrt(np.sum(np.square(flow - gt_flow), axis=-1))
+        errors = sequence_errors.setdefault(sequence, [0.0, 0])
+        errors[0] += np.sum(endpoint_errors)
+        errors[1] += endpoint_errors.size
+        if output_directory is not None:
+            sequence_directory = os.path.join(output_directory, sequence)
+            os.makedirs(sequence_directory, exist_ok=True)
+            write_flow_file(os.path.join(sequence_directory, name + '.flo'), flow)
+    return elapsed
+
+
+def print_results(sequence_errors, num_frames, inference_time, total_time):
+    """
+    :param sequence_errors: Dict. See evaluate_batch.
+    :param num_frames: Int.
+    :param inference_time: Float. Seconds spent in inference.
+    :param total_time: Float. Seconds spent in total, including reading the data.
+    :return: Nothing.
+    """
+    print('%-40s %10s' % ('Sequence', 'AEPE'))
+    total_error = 0.0
+    total_pixels = 0
+    for sequence in sorted(sequence_errors.keys()):
+        error, num_pixels = sequence_errors[sequence]
+        total_error += error
+        total_pixels += num_pixels
+        print('%-40s %10.4f' % (sequence, error / num_pixels))
+    print('%-40s %10.4f' % ('All', total_error / max(total_pixels, 1)))
+    print('')
+    print('Frames:', num_frames)
+    print('Inference throughput: %.2f fps' % (num_frames / max(inference_time, 1e-9)))
+    print('End-to-end throughput: %.2f fps' % (num_frames / max(total_time, 1e-9)))
+
+
+def print_exit_level_table(configs, config_errors, inference_times, num_frames):
+    """
+    Prints the accuracy against the latency of every early-exit configuration.
+    :param configs: List of (exit level (int), whether the context network is applied (bool)) tuples.
+    :param config_errors: List of dicts in the format of sequence_errors of evaluate_batch, one per configuration.
+    :param inference_times: List of floats. Seconds spent in inference, one per configuration.
+    :param num_frames: Int.
+    :return: Nothing.
+    """
+    print('%-12s %-16s %10s %12s %10s' % ('Exit level', 'Context network', 'AEPE', 'Latency (ms)', 'fps'))
+    for (exit_level, exit_context_network), sequence_errors, inference_time in zip(configs, config_errors,
+                                                                                    inference_times):
+        total_error = sum(error for error, _ in sequence_errors.values())
+        total_pixels = sum(num_pixels for _, num_pixels in sequence_errors.values())
+        print('%-12d %-16s %10.4f %12.2f %10.2f' % (
+            exit_level, 'yes' if exit_context_network else 'no', total_error / max(total_pixels, 1),
+            1000.0 * inference_time / max(num_frames, 1), num_frames / max(inference_time, 1e-9)))
+
+
+def add_args(parser):
+    parser.add_argument('-w', '--weights', type=str,
+                        help='Path to the pwcnet_weights.npz file.')
+    parser.add_argument('-mc', '--model_config', type=str, default=None,
+                        help='Model config json file path, i.e. mains/configs/pwcnet_model/pwcnet_small.json. The '
+                             'weights must have been trained with the same config.')
+    parser.add_argument('-d', '--directory', type=str,
+                        help='Directory of the tf records or of the raw dataset.')
+    parser.add_argument('-src', '--data_source', type=str, default='flowdataset',
+                        help='Data source can be flowdataset (tf records), sintel, flyingchairs, or flyingthings.')
+    parser.add_argument('-s', '--split', type=str, default='valid',
+                        help='Which tf records of a flowdataset to evaluate. Can be train, valid, or all.')
+    parser.add_argument('-b', '--batch_size', type=int, default=4,
+                        help='Maximum number of examples of the same adapted resolution to run at once.')
+    parser.add_argument('-m', '--adapt_mode', type=str, default=InputAdapter.PAD,
+                        help='How inputs are brought to a valid resolution. Can be pad or resize.')
+    parser.add_argument('-c', '--max_cached_shapes', type=int, default=4,
+                        help='Maximum number of resolutions whose compiled graphs are kept alive.')
+    parser.add_argument('-e', '--exit_levels', type=str, default='2',
+                        help='Comma separated pyramid levels at which the flow refinement stops, i.e. 2,3,4. The '
+                             'first one is reported per sequence, and all of them are compared in a table of accuracy '
+                             'against latency. Level 2 is the full network.')
+    parser.add_argument('--no_exit_context_network', action='store_true',
+                        help='Whether the context network is skipped at exit levels coarser than 2. It is always '
+                             'skipped at levels whose features it wasn\'t trained on, i.e. every early exit of the '
+                             'default dense PWC-Net.')
+    parser.add_argument('-r', '--num_readers', type=int, default=multiprocessing.cpu_count(),
+                        help='Number of threads reading the data.')
+    parser.add_argument('-o', '--output_directory', type=str, default=None,
+                        help='If given, the predicted flows are written here as .flo files.')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+import argparse
+import time
+import numpy as np
+import tensorflow as tf
+from common.utils.tf import optimistic_restore, strict_restore
+from context_interp.frozen_graph import freeze_context_interp, write_frozen_graph, FrozenContextInterp
+from context_interp.model import ContextInterp, PRESETS, QUALITY, SPLAT, BACKWARD_WARP
+
+
+def main():
+    """
+    Exports a trained ContextInterp as a single frozen GraphDef for inference, and compares its latency with that of the
+    training graph. See context_interp/frozen_graph.py for loading it.
+    """
+    parser = argparse.ArgumentParser()
+    add_args(parser)
+    args = parser.parse_args()
+
+    checkpoint_file = tf.train.latest_checkpoint(args.checkpoint_directory)
+    assert checkpoint_file is not None, 'No checkpoint in ' + args.checkpoint_directory + '.'
+
+    def _get_restore_weights(model):
+        def _restore_weights(session):
+            # A checkpoint that doesn't match the model would otherwise leave random weights in the frozen graph.
+            if args.pwcnet_weights_path is None:
+                strict_restore(session, checkpoint_file)
+                return
+            # The PWCNet weights go first, so that those of the checkpoint (i.e. fine-tuned ones) take precedence.
+            model.load_pwcnet_weights(args.pwcnet_weights_path, session)
+            pwcnet_scope = model.enclosing_scope.name + model.name + '/' + model.pwcnet.name + '/'
+            strict_restore(session, checkpoint_file,
+                           [var for var in tf.global_variables() if not var.op.name.startswith(pwcnet_scope)])
+            optimistic_restore(session, checkpoint_file)
+        return _restore_weights
+
+    print('Freezing...')
+    model = ContextInterp(preset=args.preset, warp_mode=args.warp_mode, use_batch_norm=args.use_batch_norm)
+    graph_def = freeze_context_interp(model, _get_restore_weights(model), height=args.height, width=args.width)
+    write_frozen_graph(graph_def, args.output_path)
+    print('Wrote', args.output_path, 'with', len(graph_def.node), 'nodes.')
+
+    if args.num_runs > 0:
+        print('Benchmarking...')
+        height = args.height if args.height is not None else 256
+        width = args.width if args.width is not None else 256
+        images_a = np.random.rand(args.batch_size, height, width, 3).astype(np.float32)
+        images_b = np.random.rand(args.batch_size, height, width, 3).astype(np.float32)
+        # A separate model, since the PWCNet assign ops of the first one belong to the graph that was frozen.
+        training_model = ContextInterp(preset=args.preset, warp_mode=args.warp_mode, use_batch_norm=args.use_batch_norm)
+        training_latency = benchmark_training_graph(training_model, _get_restore_weights(training_model), images_a,
+                                                    images_b, args.num_runs)
+        frozen_model = FrozenContextInterp(args.output_path)
+        frozen_latency = get_latency(lambda: frozen_model.run(images_a, images_b), args.num_runs)
+        frozen_model.close()
+        print('')
+        print('%-16s %12s %10s' % ('Graph', 'Latency (ms)', 'fps'))
+        for name, latency in [('Training', training_latency), ('Frozen', frozen_latency)]:
+            print('%-16s %12.2f %10.2f' % (name, 1000.0 * latency, args.batch_size / max(latency, 1e-9)))
+
+
+def benchmark_training_graph(model, restore_weights, images_a, images_b, num_runs):
+    """
+    :param model: ContextInterp.
+    :param restore_weights: Function that takes the session and restores the weights.
+    :param images_a: Np array of shape [batch_size, H, W, 3].
+    :param images_b: Np array of shape [batch_size, H, W, 3].
+    :param num_runs: Int.
+    :return: Float. Seconds per run of get_forward as it is built for training.
+    """
+    graph = tf.Graph()
+    with graph.as_default():
+        image_a_placeholder = tf.placeholder(shape=images_a.shape, dtype=tf.float32)
+        image_b_placeholder = tf.placeholder(shape=images_b.shape, dtype=tf.float32)
+        interpolated, _, _, _, _ = model.get_forward(image_a_placeholder, image_b_placeholder, 0.5)
+        config = tf.ConfigProto()
+        config.gpu_options.allow_growth = True
+        with tf.Session(config=config) as session:
+            session.run(tf.global_variables_initializer())
+            restore_weights(session)
+            run_fn = session.make_callable(interpolated, feed_list=[image_a_placeholder, image_b_placeholder])
+            return get_latency(lambda: run_fn(images_a, images_b), num_runs)
+
+
+def get_latency(run_fn, num_runs, num_warmup_runs=5):
+    """
+    :param run_fn: Function without arguments.
+    :param num_runs: Int.
+    :param num_warmup_runs: Int. Runs that aren't timed, so that one-time costs (i.e. cuDNN autotuning and memory
+                            allocation) are left out.
+    :return: Float. Average seconds per run.
+    """
+    for _ in range(num_warmup_runs):
+        run_fn()
+    start = time.time()
+    for _ in range(num_runs):
+        run_fn()
+    return (time.time() - start) / max(num_runs, 1)
+
+
+def add_args(parser):
+    parser.add_argument('-c', '--checkpoint_directory', type=str,
+                        help='Directory of the ContextInterp checkpoints.')
+    parser.add_argument('-w', '--pwcnet_weights_path', type=str, default=None,
+                        help='Path to the .npz weights for a pre-trained PWCNet, if the checkpoints don\'t have them.')
+    parser.add_argument('-o', '--output_path', type=str, default='context_interp.pb',
+                        help='Path of the frozen GraphDef.')
+    parser.add_argument('-p', '--preset', type=str, default=QUALITY,
+                        help='Speed/quality preset that the checkpoints were trained with. Can be ' +
+                             ', '.join(sorted(PRESETS.keys())) + '.')
+    parser.add_argument('-wm', '--warp_mode', type=str, default=SPLAT,
+                        help='Can be ' + SPLAT + ' or ' + BACKWARD_WARP + '.')
+    parser.add_argument('--use_batch_norm', action='store_true',
+                        help='Whether the checkpoints are of a GridNet with batch norms, which are folded away.')
+    parser.add_argument('--height', type=int, default=None,
+                        help='Static input height of the exported graph. If not given, any height works.')
+    parser.add_argument('--width', type=int, default=None,
+                        help='Static input width of the exported graph. If not given, any width works.')
+    parser.add_argument('-b', '--batch_size', type=int, default=1,
+                        help='Batch size of the benchmark.')
+    parser.add_argument('-r', '--num_runs', type=int, default=20,
+                        help='Number of timed runs of the benchmark. 0 to skip it. The benchmark resolution is the '
+                             'static input size, or 256x256.')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+import argparse
+import glob
+import os
+import time
+import numpy as np
+import tensorflow as tf
+from common.utils.img import read_image, write_image
+from common.utils.incremental import IncrementalInference
+from common.utils.inference import InferenceEngine
+from common.utils.input_adapter import InputAdapter
+from common.utils.tf import strict_restore
+from context_interp.frame_classifier import FrameClassifier, ClassificationStatistics, get_skipped_interpolation, \
+    STATIC, CUT, MOTION
+from context_interp.model import ContextInterp, PRESETS, QUALITY, SPLAT, BACKWARD_WARP
+
+
+IMAGE_EXTENSIONS = ['.png', '.jpg', '.jpeg']
+
+
+def main():
+    """
+    Doubles the frame rate of clips with a trained ContextInterp. A clip is a directory of frames, ordered by their file
+    names. The input directory is either a single clip, or contains one clip per subdirectory.
+    Pairs of frames that are static or a scene cut are recognized ahead of inference (see FrameClassifier), and get a
+    blend or a duplicate frame instead. How much inference this skipped is printed per clip.
+    In incremental mode, the network only runs on the regions that changed since the previous interpolated pair (see
+    IncrementalInference), which suits footage that changes in small regions.
+    """
+    parser = argparse.ArgumentParser()
+    add_args(parser)
+    args = parser.parse_args()
+
+    print('Creating network...')
+    model = ContextInterp(preset=args.preset, warp_mode=args.warp_mode)
+    checkpoint_file = tf.train.latest_checkpoint(args.checkpoint_directory)
+    assert checkpoint_file is not None, 'No checkpoint in ' + args.checkpoint_directory + '.'
+    t = tf.placeholder(shape=[], dtype=tf.float32)
+    engine = InferenceEngine(lambda inputs: model.get_forward(inputs[0], inputs[1], t, training=False)[0],
+                             lambda sess: strict_restore(sess, checkpoint_file), [3, 3], shared_inputs=[t],
+                             max_cached_shapes=args.max_cached_shapes)
+    coarse_flow_engine = None
+    if args.coarse_flow:
+        # Shares the session and variables of the main engine. The classifier can need it before the main engine has
+        # built anything, so it restores the checkpoint as well.
+        coarse_flow_engine = InferenceEngine(lambda inputs: _build_coarse_flow(model, inputs),
+                                             lambda sess: strict_restore(sess, checkpoint_file), [3, 3],
+                                             session=engine.session)
+    input_adapter = InputAdapter(model.get_size_multiple(), mode=args.adapt_mode)
+    classifier = None
+    if not args.no_classifier:
+        classifier = FrameClassifier(static_threshold=args.static_threshold, cut_threshold=args.cut_threshold)
+
+    def _run(inputs):
+        return engine.run([x[np.newaxis] for x in inputs], shared_values=[0.5])[0]
+
+    incremental = None
+    if args.incremental:
+        incremental = IncrementalInference(_run, model.get_size_multiple(), tile_size=args.tile_size,
+                                           padding=args.padding, margin=args.margin)
+
+    def _interpolate(image_a, image_b):
+        inputs = [input_adapter.adapt(image_a), input_adapter.adapt(image_b)]
+        interpolated = incremental.run(inputs) if incremental is not None else _run(inputs)
+        return input_adapter.restore_image(interpolated, image_a.shape)
+
+    def _get_coarse_flow(image_a, image_b):
+        return coarse_flow_engine.run([input_adapter.adapt(image_a)[np.newaxis],
+                                       input_adapter.adapt(image_b)[np.newaxis]])[0]
+
+    clip_statistics = []
+    for clip_name, frame_paths in get_clips(args.input_directory):
+        print('Interpolating', clip_name, '...')
+        output_directory = os.path.join(args.output_directory, clip_name)
+        os.makedirs(output_directory, exist_ok=True)
+        statistics = interpolate_clip(frame_paths, output_directory, _interpolate, classifier=classifier,
+                                      get_coarse_flow=_get_coarse_flow if coarse_flow_engine is not None else None)
+        clip_statistics.append((clip_name, statistics))
+    print('')
+    print_statistics(clip_statistics)
+    if incremental is not None:
+        print('')
+        print('Fraction of the interpolated area that the network ran on: %.3f' % incremental.get_computed_fraction())
+
+
+def _build_coarse_flow(model, inputs):
+    """
+    :param model: ContextInterp.
+    :param inputs: List of 2 image tensors of shape [batch_size, H, W, 3].
+    :return: Tensor of shape [batch_size, H / 64, W / 64, 2]. The flow of the coarsest PWCNet level, in pixels of the
+             inputs.
+    """
+    with tf.variable_scope(model.name, reuse=tf.AUTO_REUSE):
+        pwcnet = model.pwcnet
+        _, previous_flows = pwcnet.get_forward(inputs[0], inputs[1], exit_level=pwcnet.num_feature_levels,
+                                               exit_context_network=False)
+    # The flows of the levels are already in pixels of the inputs, apart from the flow scaling.
+    return previous_flows[-1] / pwcnet.flow_scaling
+
+
+def get_clips(directory):
+    """
+    :param directory: Str. Directory of the frames of a clip, or of subdirectories with the frames of a clip each.
+    :return: List of tuples of (clip name (str), frame paths (list of str)), sorted by name.
+    """
+    def _get_frame_paths(clip_directory):
+        paths = glob.glob(os.path.join(clip_directory, '*'))
+        return sorted(path for path in paths if os.path.splitext(path)[1].lower() in IMAGE_EXTENSIONS)
+
+    frame_paths = _get_frame_paths(directory)
+    if len(frame_paths) > 0:
+        return [(os.path.basename(os.path.normpath(directory)), frame_paths)]
+    clips = []
+    for clip_directory in sorted(glob.glob(os.path.join(directory, '*'))):
+        frame_paths = _get_frame_paths(clip_directory)
+        if os.path.isdir(clip_directory) and len(frame_paths) > 0:
+            clips.append((os.path.basename(clip_directory), frame_paths))
+    return clips
+
+
+def interpolate_clip(frame_paths, output_directory, interpolate, classifier=None, get_coarse_flow=None):
+    """
+    Writes the frames of a clip with an interpolated frame in between every pair.
+    :param frame_paths: List of str.
+    :param output_directory: Str. The frames are written as 000000.png, 000001.png, ...
+    :param interpolate: Function that takes 2 np images of shape [H, W, 3] and returns the frame in the middle.
+    :param classifier: FrameClassifier or None. If None, every pair is interpolated.
+    :param get_coarse_flow: Function that takes 2 np images of shape [H, W, 3] and returns a coarse flow for the
+                            classifier, or None.
+    :return: ClassificationStatistics.
+    """
+    statistics = ClassificationStatistics()
+
+    def _write(index, image):
+        write_image(os.path.join(output_directory, '%06d.png' % index), image)
+
+    image_a = read_image(frame_paths[0], as_float=True)
+    _write(0, image_a)
+    for i, frame_path in enumerate(frame_paths[1:]):
+        image_b = read_image(frame_path, as_float=True)
+        pair_class = MOTION
+        if classifier is not None:
+            pair_get_coarse_flow = None
+            if get_coarse_flow is not None:
+                pair_get_coarse_flow = lambda: get_coarse_flow(image_a, image_b)
+            pair_class = classifier.classify(image_a, image_b, get_coarse_flow=pair_get_coarse_flow)
+
+        inference_time = 0.0
+        if pair_class == MOTION:
+            start = time.time()
+            interpolated = interpolate(image_a, image_b)
+            inference_time = time.time() - start
+        else:
+            interpolated = get_skipped_interpolation(image_a, image_b, pair_class)
+        statistics.add(pair_class, inference_time=inference_time)
+
+        _write(2 * i + 1, interpolated)
+        _write(2 * i + 2, image_b)
+        image_a = image_b
+    return statistics
+
+
+def print_statistics(clip_statistics):
+    """
+    :param clip_statistics: List of tuples of (clip name (str), ClassificationStatistics).
+    :return: Nothing.
+    """
+    print('%-30s %8s %8s %8s %8s %12s %14s %10s' % ('Clip', 'Pairs', 'Static', 'Cut', 'Motion', 'Skipped (%)',
+                                                    'Inference (s)', 'Saved (s)'))
+    for clip_name, statistics in clip_statistics:
+        print('%-30s %8d %8d %8d %8d %12.1f %14.2f %10.2f' % (
+            clip_name, statistics.get_num_pairs(), statistics.counts[STATIC], statistics.counts[CUT],
+            statistics.counts[MOTION], 100.0 * statistics.get_skipped_fraction(), statistics.inference_time,
+            statistics.get_saved_time()))
+
+
+def add_args(parser):
+    parser.add_argument('-i', '--input_directory', type=str,
+                        help='Directory of the frames of a clip, or of one subdirectory of frames per clip.')
+    parser.add_argument('-o', '--output_directory', type=str,
+                        help='The frames of every clip are written to a subdirectory of this.')
+    parser.add_argument('-c', '--checkpoint_directory', type=str,
+                        help='Directory of the ContextInterp checkpoints.')
+    parser.add_argument('-p', '--preset', type=str, default=QUALITY,
+                        help='Speed/quality preset that the checkpoints were trained with. Can be ' +
+                             ', '.join(sorted(PRESETS.keys())) + '.')
+    parser.add_argument('-w', '--warp_mode', type=str, default=SPLAT,
+                        help='Can be ' + SPLAT + ' or ' + BACKWARD_WARP + '.')
+    parser.add_argument('-m', '--adapt_mode', type=str, default=InputAdapter.PAD,
+                        help='How inputs are brought to a valid resolution. Can be pad or resize.')
+    parser.add_argument('--no_classifier', action='store_true',
+                        help='Whether every pair is interpolated, including static pairs and scene cuts.')
+    parser.add_argument('--static_threshold', type=float, default=0.02,
+                        help='Pairs whose downsampled frames differ by less than this everywhere are blended.')
+    parser.add_argument('--cut_threshold', type=float, default=0.5,
+                        help='Pairs whose color histograms are further apart than this, between [0, 1], are scene '
+                             'cuts and the first frame is duplicated.')
+    parser.add_argument('--incremental', action='store_true',
+                        help='Whether the network only runs on padded regions around the tiles that changed since the '
+                             'previous interpolated pair. Outputs beyond the margin of those tiles are copied from the '
+                             'previous output.')
+    parser.add_argument('--tile_size', type=int, default=32,
+                        help='In incremental mode, changes are detected per tile of this size.')
+    parser.add_argument('--padding', type=int, default=64,
+                        help='In incremental mode, pixels of context around the changed tiles. It should cover the '
+                             'margin plus the receptive field of the network.')
+    parser.add_argument('--margin', type=int, default=32,
+                        help='In incremental mode, pixels around the changed tiles whose outputs are updated. It '
+                             'should cover the receptive field of the network and the largest motion, and be less than '
+                             'the padding.')
+    parser.add_argument('--max_cached_shapes', type=int, default=16,
+                        help='Maximum number of resolutions whose compiled graphs are kept alive. In incremental mode, '
+                             'every region size is a resolution.')
+    parser.add_argument('--coarse_flow', action='store_true',
+                        help='Whether pairs that are static by their frames are checked with the coarsest PWCNet flow '
+                             'as well. Pairs with motion in the flow are then interpolated.')
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,10 @@
 import argparse
 import os
+import sys
 import tensorflow as tf
+from common.utils.distributed import DEFAULT_BASE_PORT, RingAllReduce, configure_worker_session, launch_workers
 from data.interp.interp_data import InterpDataSet
-from context_interp.model import ContextInterp
+from context_interp.model import ContextInterp, PRESETS, QUALITY, SPLAT, BACKWARD_WARP
 from train.context_interp.trainer import ContextInterpTrainer
 
 
@@ -11,29 +13,50 @@ def main():
     add_args(parser)
     args = parser.parse_args()
 
+    if args.num_workers > 1 and args.worker_rank < 0:
+        # Re-run this script once for each worker process.
+        sys.exit(launch_workers(args.num_workers))
+
     config_proto = tf.ConfigProto()
     config_proto.gpu_options.allow_growth = True
+
+    all_reducer = None
+    checkpoint_directory = args.checkpoint_directory
+    if args.num_workers > 1:
+        print('Connecting worker', args.worker_rank, 'of', args.num_workers, '...')
+        all_reducer = RingAllReduce(args.worker_rank, args.num_workers, base_port=args.ring_port)
+        all_reducer.connect()
+        configure_worker_session(config_proto, args.num_workers)
+        if args.worker_rank != 0:
+            # Only the first worker's checkpoints are meant to be used. The others are kept out of the way.
+            checkpoint_directory = os.path.join(checkpoint_directory, 'worker_' + str(args.worker_rank))
     session = tf.Session(config=config_proto)
 
-    if not os.path.exists(args.checkpoint_directory):
-        os.makedirs(args.checkpoint_directory)
+    if not os.path.exists(checkpoint_directory):
+        os.makedirs(checkpoint_directory)
 
     print('Creating network...')
-    model = ContextInterp()
+    model = ContextInterp(preset=args.preset, warp_mode=args.warp_mode, use_batch_norm=args.use_batch_norm)
 
     print('Creating dataset...')
     dataset = InterpDataSet(args.directory, [[1]],
-                            batch_size=args.batch_size)
+                            batch_size=args.batch_size, num_shards=args.num_workers,
+                            shard_index=max(args.worker_rank, 0))
 
     # TODO: Some of this stuff might want to go into a config json.
     config = {
         'learning_rate': 1E-4,
-        'checkpoint_directory': args.checkpoint_directory,
+        'gradient_accumulation_steps': args.gradient_accumulation_steps,
+        'checkpoint_directory': checkpoint_directory,
         'fine_tune': args.fine_tune,
+        'trace_sample_rate': 0.001,
+        'trace_level': 'software',
+        'summary_image_scale': 0.5,
+        'validation_image_batches': 2,
     }
 
     print('Initializing trainer...')
-    trainer = ContextInterpTrainer(model, dataset, session, config)
+    trainer = ContextInterpTrainer(model, dataset, session, config, all_reducer=all_reducer)
 
     print('Initializing variables...')
     session.run(tf.global_variables_initializer())
@@ -41,6 +64,9 @@ def main():
     print('Loading pre-trained PWCNet...')
     model.load_pwcnet_weights(args.pwcnet_weights_path, session)
     trainer.restore()
+    if all_reducer is not None:
+        print('Synchronizing variables with the first worker...')
+        all_reducer.broadcast_variables(session)
     trainer.train(validate_every=args.validate_every)
 
 
@@ -53,11 +79,26 @@ def add_args(parser):
                         help='Size of the batch.')
     parser.add_argument('-c', '--checkpoint_directory', type=str,
                         help='Directory of saved checkpoints.')
+    parser.add_argument('-ga', '--gradient_accumulation_steps', type=int, default=1,
+                        help='Number of batches to accumulate the gradients over before each update.')
     parser.add_argument('-f', '--fine_tune', dest='fine_tune',
                         action='store_true',
                         help='Whether to use fine tuning loss')
     parser.add_argument('-w', '--pwcnet_weights_path', type=str,
                         help='Path to the .npz weights for a pre-trained PWCNet.')
+    parser.add_argument('-p', '--preset', type=str, default=QUALITY,
+                        help='Speed/quality preset of the model. Can be ' + ', '.join(sorted(PRESETS.keys())) + '.')
+    parser.add_argument('-wm', '--warp_mode', type=str, default=SPLAT,
+                        help='How the inputs are warped to the interpolation point. Can be ' + SPLAT + ' or ' +
+                             BACKWARD_WARP + '.')
+    parser.add_argument('--use_batch_norm', action='store_true',
+                        help='Whether the GridNet has batch norms. Exports fold them away.')
+    parser.add_argument('-n', '--num_workers', type=int, default=1,
+                        help='Number of data-parallel worker processes to train with on this host.')
+    parser.add_argument('--worker_rank', type=int, default=-1,
+                        help='Rank of this worker process. If not set, all workers are launched from this process.')
+    parser.add_argument('--ring_port', type=int, default=DEFAULT_BASE_PORT,
+                        help='Worker i listens on ring_port + i for the gradient all-reduce.')
 
 
 if __name__ == "__main__":
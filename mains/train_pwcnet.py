@@ -1,9 +1,12 @@
 import argparse
 import os
+import sys
 import tensorflow as tf
 from common.utils.config import preprocess_var_refs, import_json
+from common.utils.distributed import DEFAULT_BASE_PORT, RingAllReduce, configure_worker_session, launch_workers
 from data.flow.flow_data import FlowDataSet
 from pwcnet.model import PWCNet
+from pwcnet.model_config import load_model_config
 from train.pwcnet.trainer import PWCNetTrainer
 from train.pwcnet.unflow_trainer import PWCNetUnflowTrainer
 
@@ -13,9 +16,24 @@ def main():
     add_args(parser)
     args = parser.parse_args()
 
+    if args.num_workers > 1 and args.worker_rank < 0:
+        # Re-run this script once for each worker process.
+        sys.exit(launch_workers(args.num_workers))
+
     config_proto = tf.ConfigProto()
     config_proto.gpu_options.allow_growth = True
     config_proto.allow_soft_placement = True
+
+    all_reducer = None
+    checkpoint_directory = args.checkpoint_directory
+    if args.num_workers > 1:
+        print('Connecting worker', args.worker_rank, 'of', args.num_workers, '...')
+        all_reducer = RingAllReduce(args.worker_rank, args.num_workers, base_port=args.ring_port)
+        all_reducer.connect()
+        configure_worker_session(config_proto, args.num_workers)
+        if args.worker_rank != 0:
+            # Only the first worker's checkpoints are meant to be used. The others are kept out of the way.
+            checkpoint_directory = os.path.join(checkpoint_directory, 'worker_' + str(args.worker_rank))
     session = tf.Session(config=config_proto)
 
     # Read the JSON config.
@@ -25,30 +43,34 @@ def main():
     print(config)
     print('')
     # Add extra fields to the config from argparse.
-    config['checkpoint_directory'] = args.checkpoint_directory
+    config['checkpoint_directory'] = checkpoint_directory
     config['directory'] = args.directory
     config['config'] = args.config
 
-    if not os.path.exists(args.checkpoint_directory):
-        os.makedirs(args.checkpoint_directory)
+    if not os.path.exists(checkpoint_directory):
+        os.makedirs(checkpoint_directory)
 
     print('Creating network...')
-    model = PWCNet()
+    model = PWCNet(config=load_model_config(args.model_config) if args.model_config is not None else None)
 
     print('Creating dataset...')
     dataset = FlowDataSet(args.directory, batch_size=config['batch_size'],
                           crop_size=(config['crop_height'], config['crop_width']),
-                          augmentation_config=config)
+                          augmentation_config=config, num_shards=args.num_workers,
+                          shard_index=max(args.worker_rank, 0))
 
     print('Initializing trainer and model ops...')
     if args.loss == 'unflow':
-        trainer = PWCNetUnflowTrainer(model, dataset, session, config)
+        trainer = PWCNetUnflowTrainer(model, dataset, session, config, all_reducer=all_reducer)
     else:
-        trainer = PWCNetTrainer(model, dataset, session, config)
+        trainer = PWCNetTrainer(model, dataset, session, config, all_reducer=all_reducer)
 
     print('Initializing variables...')
     session.run(tf.global_variables_initializer())
     trainer.restore()
+    if all_reducer is not None:
+        print('Synchronizing variables with the first worker...')
+        all_reducer.broadcast_variables(session)
 
     trainer.train(validate_every=config['validate_every'], iterations=args.iterations)
 
@@ -60,10 +82,19 @@ def add_args(parser):
                         help='Directory of saved checkpoints.')
     parser.add_argument('-j', '--config', type=str, default='mains/configs/train_pwcnet.json',
                         help='Config json file path.')
+    parser.add_argument('-mc', '--model_config', type=str, default=None,
+                        help='Model config json file path, i.e. mains/configs/pwcnet_model/pwcnet_small.json. '
+                             'Defaults to the original PWC-Net.')
     parser.add_argument('-i', '--iterations', type=int, default=1000000,
                         help='Number of iterations to train for.')
     parser.add_argument('-l', '--loss', type=str, default='supervised',
                         help='Loss type. Can be "supervised" or "unflow". Defaults to "supervised".')
+    parser.add_argument('-n', '--num_workers', type=int, default=1,
+                        help='Number of data-parallel worker processes to train with on this host.')
+    parser.add_argument('--worker_rank', type=int, default=-1,
+                        help='Rank of this worker process. If not set, all workers are launched from this process.')
+    parser.add_argument('--ring_port', type=int, default=DEFAULT_BASE_PORT,
+                        help='Worker i listens on ring_port + i for the gradient all-reduce.')
 
 
 if __name__ == "__main__":
@@ -1,12 +1,12 @@
 import tensorflow as tf
 from common.models import ConvNetwork
-from common.utils.tf import leaky_relu
+from common.utils.tf import leaky_relu, get_channel_axis, NHWC
 
 
 class ContextNetwork(ConvNetwork):
     def __init__(self, name='context_network', layer_specs=None,
                  activation_fn=leaky_relu,
-                 regularizer=None, dense_net=False):
+                 regularizer=None, dense_net=False, data_format=NHWC):
         """
         Context network -- usually has 6 layer + a delta optical flow output layer.
         The delta optical flow is added to the inputted optical flow.
@@ -15,6 +15,7 @@ class ContextNetwork(ConvNetwork):
         :param activation_fn: Tensorflow activation function.
         :param regularizer: Tf regularizer such as tf.contrib.layers.l2_regularizer.
         :param dense_net: Bool.
+        :param data_format: Str. NHWC or NCHW. See parent class.
         """
         if layer_specs is None:
             # PWC-Net default.
@@ -28,7 +29,7 @@ class ContextNetwork(ConvNetwork):
 
         super().__init__(name=name, layer_specs=layer_specs,
                          activation_fn=activation_fn, last_activation_fn=None,
-                         regularizer=regularizer, padding='SAME', dense_net=dense_net)
+                         regularizer=regularizer, padding='SAME', dense_net=dense_net, data_format=data_format)
 
     def get_forward(self, features, optical_flow, reuse_variables=tf.AUTO_REUSE):
         """
@@ -43,7 +44,8 @@ class ContextNetwork(ConvNetwork):
              optical_flow
                   |
              final_output
-        :param features: Tensor. Feature map of shape [batch_size, H, W, num_features].
+        :param features: Tensor. Feature map of shape [batch_size, H, W, num_features]. The shapes are
+                         [batch_size, num_features, H, W] if the data_format is NCHW.
         :param optical_flow: Tensor. Optical flow of shape [batch_size, H, W, 2].
         :param reuse_variables: tf reuse option. i.e. tf.AUTO_REUSE.
         :return: final_flow: Tensor. Optical flow of shape [batch_size, H, W, 2].
@@ -51,7 +53,7 @@ class ContextNetwork(ConvNetwork):
         """
         with tf.variable_scope(self.name, reuse=reuse_variables):
             # Initial input has shape [batch_size, H, W, num_features + 2].
-            initial_input = tf.concat([features, optical_flow], axis=-1)
+            initial_input = tf.concat([features, optical_flow], axis=get_channel_axis(self.data_format))
 
             delta_flow, layer_outputs, _ = self._get_conv_tower(initial_input)
 
@@ -2,6 +2,7 @@
 # Master branch commit 2225ad2082371126cc9c8e57a8b962a88933a8c0.
 import tensorflow as tf
 import os.path
+from common.utils.tf import NHWC, NCHW, to_data_format, from_data_format
 from sys import platform
 from tensorflow.python.framework import ops
 
@@ -18,26 +19,29 @@ else:
     mod = None
 
 
-def cost_volume(c1, c2, search_range=4):
+def cost_volume(c1, c2, search_range=4, data_format=NHWC):
     """
     See https://arxiv.org/pdf/1709.02371.pdf.
     For each pixel in c1, we will compute correlations with its spatial neighbors in c2.
     :param c1: Tensor. Feature map of shape [batch_size, H, W, num_features].
     :param c2: Input tensor with the exact same shape as c1.
     :param search_range: The search square's side length is equal to 2 * search_range + 1.
+    :param data_format: Str. NHWC or NCHW, in which case the shapes are [batch_size, num_features, H, W] and
+                        [batch_size, s * s, H, W].
     :return: Tensor. Cost volume of shape [batch_size, H, W, s * s], where s is equal to 2 * search_range + 1.
     """
     if mod is not None:
+        # The native op is NHWC only.
         results = mod.correlation(
-            c1, c2,
+            from_data_format(c1, data_format), from_data_format(c2, data_format),
             max_displacement=search_range,
             pad=search_range,
             stride_1=1,
             stride_2=1
         )
-        return results[0]
+        return to_data_format(results[0], data_format)
     else:
-        return cost_volume_tensorflow(c1, c2, search_range=search_range)
+        return cost_volume_tensorflow(c1, c2, search_range=search_range, data_format=data_format)
 
 
 if mod is not None:
@@ -54,14 +58,16 @@ if mod is not None:
         return [grad0, grad1]
 
 
-def cost_volume_tensorflow(c1, c2, search_range=4):
+def cost_volume_tensorflow(c1, c2, search_range=4, data_format=NHWC):
     with tf.name_scope('cost_volume'):
         square_len = 2 * search_range + 1
         square_area = square_len ** 2
-        cv_shape = tf.concat([tf.shape(c1)[:-1], [square_area]], axis=0)
 
         # Form an index matrix to help us update sparsely later on.
-        cv_height, cv_width = cv_shape[1], cv_shape[2]
+        if data_format == NCHW:
+            cv_height, cv_width = tf.shape(c1)[2], tf.shape(c1)[3]
+        else:
+            cv_height, cv_width = tf.shape(c1)[1], tf.shape(c1)[2]
         x_1d, y_1d, z_1d = tf.range(0, cv_width), tf.range(0, cv_height), tf.range(0, square_area)
         x_3d, y_3d, z_3d = tf.meshgrid(x_1d, y_1d, z_1d)
         indices_3d = tf.stack([y_3d, x_3d, z_3d], axis=-1)
@@ -86,7 +92,10 @@ def cost_volume_tensorflow(c1, c2, search_range=4):
                 else:
                     slice_w, slice_w_r = slice(None), slice(None)
 
-                costs = tf.reduce_mean(c1[:, slice_h, slice_w, :] * c2[:, slice_h_r, slice_w_r, :], axis=-1)
+                if data_format == NCHW:
+                    costs = tf.reduce_mean(c1[:, :, slice_h, slice_w] * c2[:, :, slice_h_r, slice_w_r], axis=1)
+                else:
+                    costs = tf.reduce_mean(c1[:, slice_h, slice_w, :] * c2[:, slice_h_r, slice_w_r, :], axis=-1)
 
                 # Get the coordinates for scatter update, where each element is a (y, x, z) coordinate.
                 cur_indices = indices_3d[slice_h, slice_w, cur_z_index]
@@ -104,5 +113,7 @@ def cost_volume_tensorflow(c1, c2, search_range=4):
         batch_dim = tf.shape(c1)[0]
         target_shape = [cv_height, cv_width, square_area, batch_dim]
         cv = tf.scatter_nd(all_indices, all_costs, target_shape)
+        if data_format == NCHW:
+            return tf.transpose(cv, [3, 2, 0, 1])
         cv = tf.transpose(cv, [3, 0, 1, 2])
         return cv
@@ -1,6 +1,7 @@
 import numpy as np
 import tensorflow as tf
 import unittest
+from common.utils.tf import NCHW
 from pwcnet.cost_volume.cost_volume import cost_volume
 from tensorflow.python.ops import gradient_checker
 
@@ -275,6 +276,19 @@ class TestCostVolume(unittest.TestCase):
             self.assertLessEqual(err_c1, self.max_allowable_grad_err)
             self.assertLessEqual(err_c2, self.max_allowable_grad_err)
 
+    def test_nchw(self):
+        image_shape = (2, 5, 7, 3)
+        c1 = np.random.rand(*image_shape)
+        c2 = np.random.rand(*image_shape)
+        input1 = tf.placeholder(shape=image_shape, dtype=tf.float32)
+        input2 = tf.placeholder(shape=image_shape, dtype=tf.float32)
+        cv = cost_volume(input1, input2, 2)
+        cv_nchw = cost_volume(tf.transpose(input1, [0, 3, 1, 2]), tf.transpose(input2, [0, 3, 1, 2]), 2,
+                              data_format=NCHW)
+        cv, cv_nchw = self.sess.run([cv, cv_nchw], feed_dict={input1: c1, input2: c2})
+        self.assertTupleEqual((2, 25, 5, 7), cv_nchw.shape)
+        self.assertTrue(np.allclose(cv, np.transpose(cv_nchw, [0, 2, 3, 1]), atol=1e-6))
+
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
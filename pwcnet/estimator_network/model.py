@@ -1,6 +1,6 @@
 import tensorflow as tf
 from common.models import ConvNetwork
-from common.utils.tf import leaky_relu
+from common.utils.tf import leaky_relu, get_channel_axis, NHWC
 from pwcnet.cost_volume.cost_volume import cost_volume
 from pwcnet.warp.warp import backward_warp
 
@@ -8,7 +8,7 @@ from pwcnet.warp.warp import backward_warp
 class EstimatorNetwork(ConvNetwork):
     def __init__(self, name='estimator_network', layer_specs=None,
                  activation_fn=leaky_relu,
-                 regularizer=None, search_range=4, dense_net=True, cost_volume_activation=True):
+                 regularizer=None, search_range=4, dense_net=True, cost_volume_activation=True, data_format=NHWC):
         """
         :param name: Str. For variable scoping.
         :param layer_specs: See parent class.
@@ -16,6 +16,7 @@ class EstimatorNetwork(ConvNetwork):
         :param regularizer: Tf regularizer such as tf.contrib.layers.l2_regularizer.
         :param dense_net: Bool. Default for PWC-Net is true.
         :param cost_volume_activation: Bool. Whether to put an activation function on the cost volume.
+        :param data_format: Str. NHWC or NCHW. See parent class.
         """
         if layer_specs is None:
             # PWC-Net default.
@@ -28,7 +29,7 @@ class EstimatorNetwork(ConvNetwork):
 
         super().__init__(name=name, layer_specs=layer_specs,
                          activation_fn=activation_fn, last_activation_fn=None,
-                         regularizer=regularizer, padding='SAME', dense_net=dense_net)
+                         regularizer=regularizer, padding='SAME', dense_net=dense_net, data_format=data_format)
 
         self.search_range = search_range
         self.cost_volume_activation = cost_volume_activation
@@ -47,7 +48,8 @@ class EstimatorNetwork(ConvNetwork):
                          [LAYER N-1]
                               |
                          final_output
-        :param features1: Tensor. Feature map of shape [batch_size, H, W, num_features]. Time = 0.
+        :param features1: Tensor. Feature map of shape [batch_size, H, W, num_features]. Time = 0. The shapes of all
+                          tensors are [batch_size, num_features, H, W] if the data_format is NCHW.
         :param features2: Tensor. Feature map of shape [batch_size, H, W, num_features]. Time = 1.
         :param optical_flow: Tensor or None. Optical flow of shape [batch_size, H, W, 2].
         :param previous_estimator_feature: Tensor or None. Feature map of shape [batch_size, H, W, num_features].
@@ -61,10 +63,10 @@ class EstimatorNetwork(ConvNetwork):
             # Warp layer.
             warped = features2
             if optical_flow is not None:
-                warped = backward_warp(warped, optical_flow * pre_warp_scaling)
+                warped = backward_warp(warped, optical_flow * pre_warp_scaling, data_format=self.data_format)
 
             # Cost volume layer.
-            cv = cost_volume(features1, warped, search_range=self.search_range)
+            cv = cost_volume(features1, warped, search_range=self.search_range, data_format=self.data_format)
             if self.cost_volume_activation:
                 cv = self.activation_fn(cv)
 
@@ -75,7 +77,7 @@ class EstimatorNetwork(ConvNetwork):
                 input_stack = input_stack + [optical_flow]
             if previous_estimator_feature is not None:
                 input_stack = input_stack + [previous_estimator_feature]
-            initial_input = tf.concat(input_stack, axis=-1, name='conv_tower_input')
+            initial_input = tf.concat(input_stack, axis=get_channel_axis(self.data_format), name='conv_tower_input')
             final_flow, layer_outputs, dense_outputs = self._get_conv_tower(initial_input)
 
             return final_flow, layer_outputs, dense_outputs
@@ -1,18 +1,19 @@
 import tensorflow as tf
 from common.models import ConvNetwork
-from common.utils.tf import leaky_relu
+from common.utils.tf import leaky_relu, NHWC
 
 
 class FeaturePyramidNetwork(ConvNetwork):
     def __init__(self, name='feature_pyramid_network', layer_specs=None,
                  activation_fn=leaky_relu,
-                 regularizer=None, dense_net=False):
+                 regularizer=None, dense_net=False, data_format=NHWC):
         """
         :param name: Str. For variable scoping.
         :param layer_specs: See parent class.
         :param activation_fn: Tensorflow activation function.
         :param regularizer: Tf regularizer such as tf.contrib.layers.l2_regularizer.
         :param dense_net: Bool.
+        :param data_format: Str. NHWC or NCHW. See parent class.
         """
         if layer_specs is None:
             # PWC-Net default.
@@ -36,7 +37,8 @@ class FeaturePyramidNetwork(ConvNetwork):
                            [3, 192, 1, 1]]  # C6
 
         super().__init__(name=name, layer_specs=layer_specs,
-                         activation_fn=activation_fn, regularizer=regularizer, padding='SAME', dense_net=dense_net)
+                         activation_fn=activation_fn, regularizer=regularizer, padding='SAME', dense_net=dense_net,
+                         data_format=data_format)
 
     def get_forward(self, image, reuse_variables=tf.AUTO_REUSE):
         """
@@ -47,7 +49,7 @@ class FeaturePyramidNetwork(ConvNetwork):
         [LAYER N-1]
              |
         final_features
-        :param image: Tensor. Shape [batch_size, H, W, 3].
+        :param image: Tensor. Shape [batch_size, H, W, 3], or [batch_size, 3, H, W] if the data_format is NCHW.
         :param reuse_variables: tf reuse option. i.e. tf.AUTO_REUSE.
         :return: final_features: features of shape [batch_size, H, W, 192].
                  layer_outputs: array of layer intermediate conv outputs. Length is len(layer_specs) + 1.
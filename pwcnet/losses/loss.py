@@ -22,31 +22,68 @@ def lq_diff(a, b, q=0.4, epsilon=0.01):
     return tf.pow(tf.abs(a - b) + epsilon, q)
 
 
-def create_multi_level_loss(expected_flow, flows, flow_scaling, flow_layer_loss_weights=None, diff_fn=l2_diff):
+def create_cascaded_pyramid(tensor, like_tensors, name='cascaded_pyramid'):
+    """
+    Resizes a full resolution tensor to the resolutions of like_tensors. Every level is resized from the next larger
+    level instead of from the full resolution, so only the largest level reads the full resolution tensor. Levels whose
+    static resolution is the same as the next larger level's reuse it.
+    This can also be used in a tf.data pipeline to precompute the pyramid on the CPU.
+    :param tensor: Tensor of shape [B, H, W, C].
+    :param like_tensors: List of tensors of shape [B, H_i, W_i, ...]. If their static resolutions are not all known,
+                         they must be in increasing resolution.
+    :param name: Str.
+    :return: List of tensors of shape [B, H_i, W_i, C], in the same order as like_tensors.
+    """
+    static_shapes = [like_tensor.shape[1:3] for like_tensor in like_tensors]
+    if all(static_shape.is_fully_defined() for static_shape in static_shapes):
+        # From the largest to the smallest.
+        order = sorted(range(len(like_tensors)), key=lambda i: -static_shapes[i].num_elements())
+    else:
+        order = list(reversed(range(len(like_tensors))))
+
+    with tf.name_scope(name):
+        levels = [None] * len(like_tensors)
+        previous_level = tensor
+        previous_static_shape = tensor.shape[1:3]
+        for i in order:
+            if not (static_shapes[i].is_fully_defined() and previous_static_shape.is_fully_defined() and
+                    static_shapes[i].as_list() == previous_static_shape.as_list()):
+                H, W = tf.shape(like_tensors[i])[1], tf.shape(like_tensors[i])[2]
+                previous_level = tf.image.resize_bilinear(previous_level, [H, W], name='level_' + str(i))
+            levels[i] = previous_level
+            previous_static_shape = static_shapes[i]
+        return levels
+
+
+def create_multi_level_loss(expected_flow, flows, flow_scaling, flow_layer_loss_weights=None, diff_fn=l2_diff,
+                            expected_flow_pyramid=None):
     """
     Creates the PWC Net multi-level loss.
     :param expected_flow: Tensor of shape [B, H, W, 2]. Ground truth.
-    :param flows: List of flow tensors. Flows at different resolutions.
+    :param flows: List of flow tensors. Flows at different resolutions (see create_cascaded_pyramid for their order).
     :param flow_scaling: Float. Scales the expected_flow before comparing it to the flows.
     :param flow_layer_loss_weights: List of floats. Loss weights that correspond to the flows list.
     :param diff_fn: Function.
+    :param expected_flow_pyramid: List of tensors or None. Ground truth at the resolutions of the flows (i.e.
+                                  precomputed with create_cascaded_pyramid). If None, it is created from expected_flow.
     :return: total_loss: Scalar tensor. Sum off all weighted level losses.
              layer_losses: List of scalar tensors. Weighted loss at each level.
     """
     if flow_layer_loss_weights is None:
         flow_layer_loss_weights = [0.32, 0.08, 0.02, 0.01, 0.0025, 0.005]
 
-    scaled_gt = expected_flow * flow_scaling
+    # Ground truth needs to be resized to match the size of the flows.
+    if expected_flow_pyramid is None:
+        expected_flow_pyramid = create_cascaded_pyramid(expected_flow, flows, name='expected_flow_pyramid')
+    assert len(expected_flow_pyramid) == len(flows)
 
     layer_losses = []
     for i, flow in enumerate(flows):
         if flow_layer_loss_weights[i] == 0:
             continue
         with tf.name_scope('layer_' + str(i) + '_loss'):
-            H, W = tf.shape(flow)[1], tf.shape(flow)[2]
-
-            # Ground truth needs to be resized to match the size of the previous flow.
-            resized_scaled_gt = tf.image.resize_bilinear(scaled_gt, [H, W])
+            # Scaling commutes with the bilinear resize, so it's done at the lower resolution.
+            resized_scaled_gt = expected_flow_pyramid[i] * flow_scaling
 
             # squared_difference has the shape [batch_size, H, W, 2].
             squared_difference = diff_fn(resized_scaled_gt, flow)
@@ -60,7 +97,8 @@ def create_multi_level_loss(expected_flow, flows, flow_scaling, flow_layer_loss_
 
 
 def create_multi_level_unflow_loss(image_a, image_b, forward_flows, backward_flows, flow_scaling,
-                                   flow_layer_loss_weights=None, layer_patch_distances=None, loss_weights=None):
+                                   flow_layer_loss_weights=None, layer_patch_distances=None, loss_weights=None,
+                                   image_pyramids=None):
     """
     :param image_a: Tensor of shape [B, H, W, 3].
     :param image_b: Tensor of shape [B, H, W, 3].
@@ -75,6 +113,9 @@ def create_multi_level_unflow_loss(image_a, image_b, forward_flows, backward_flo
     :param flow_layer_loss_weights: List of floats. Loss weights that correspond to the flows list.
     :param layer_patch_distances: List of ints. These should be in the same order as flow_layer_loss_weights.
     :param loss_weights: Dict. Key is the loss name and the value is the weight.
+    :param image_pyramids: Tuple of (list of tensors, list of tensors) or None. Image a and image b at the resolutions
+                           of the flows (i.e. precomputed with create_cascaded_pyramid). If None, they are created from
+                           image_a and image_b.
     :return: total_loss: Scalar tensor. Sum off all weighted level losses.
              layer_losses: List of scalar tensors. Weighted loss at each level.
              forward_occlusion_masks: List of tensors of shape [B, H, W, 1].
@@ -99,6 +140,20 @@ def create_multi_level_unflow_loss(image_a, image_b, forward_flows, backward_flo
     assert len(forward_flows) == len(layer_patch_distances)
     assert len(forward_flows) == len(backward_flows)
 
+    # Resize the input images to match the corresponding flow sizes. Both images are resized together, and the same
+    # pyramid serves the forward and the backward directions.
+    if image_pyramids is None:
+        # Static, so that the pyramid levels keep a known number of channels.
+        num_channels = image_a.get_shape().as_list()[-1]
+        assert num_channels is not None, 'The images must have a static number of channels.'
+        images_pyramid = create_cascaded_pyramid(tf.concat([image_a, image_b], axis=-1), forward_flows,
+                                                 name='images_pyramid')
+        image_pyramids = ([level[..., :num_channels] for level in images_pyramid],
+                          [level[..., num_channels:] for level in images_pyramid])
+    image_a_pyramid, image_b_pyramid = image_pyramids
+    assert len(image_a_pyramid) == len(forward_flows)
+    assert len(image_b_pyramid) == len(forward_flows)
+
     layer_losses = []
     forward_occlusion_masks = []
     backward_occlusion_masks = []
@@ -109,11 +164,9 @@ def create_multi_level_unflow_loss(image_a, image_b, forward_flows, backward_flo
         if flow_layer_loss_weights[i] == 0.0:
             continue
         with tf.name_scope('layer_' + str(i) + '_loss'):
-            _, flow_height, flow_width, _ = tf.unstack(tf.shape(forward_flow))
-
-            # Resize the input images to match the corresponding flow size.
-            resize_image_a = tf.image.resize_bilinear(image_a, (flow_height, flow_width))
-            resize_image_b = tf.image.resize_bilinear(image_b, (flow_height, flow_width))
+            flow_height = tf.shape(forward_flow)[1]
+            resize_image_a = image_a_pyramid[i]
+            resize_image_b = image_b_pyramid[i]
 
             # We must do this to interop with the rest of the network that uses a scaled flow due to the regular PWC Net
             # loss function.
@@ -1,7 +1,7 @@
 import numpy as np
 import tensorflow as tf
 import unittest
-from pwcnet.losses.loss import create_multi_level_loss, create_multi_level_unflow_loss
+from pwcnet.losses.loss import create_cascaded_pyramid, create_multi_level_loss, create_multi_level_unflow_loss
 
 
 class TestPWCNetLosses(unittest.TestCase):
@@ -61,6 +61,25 @@ class TestPWCNetLosses(unittest.TestCase):
         self.assertTrue(np.allclose(np.asarray([[[[0., -1.]]],
                                                 [[[0., -1.]]]]), grads[2]))
 
+    def test_cascaded_pyramid(self):
+        tensor = tf.placeholder(shape=[None, 16, 16, 3], dtype=tf.float32)
+        # Out of order, with a repeated resolution.
+        like_tensors = [tf.zeros([1, 4, 4, 2]), tf.zeros([1, 16, 16, 2]), tf.zeros([1, 8, 8, 2]),
+                        tf.zeros([1, 8, 8, 2])]
+        levels = create_cascaded_pyramid(tensor, like_tensors)
+        self.assertEqual(4, len(levels))
+        self.assertIs(tensor, levels[1])
+        self.assertIs(levels[2], levels[3])
+
+        direct_levels = [tf.image.resize_bilinear(tensor, [4, 4]), tf.image.resize_bilinear(tensor, [8, 8])]
+        values = np.random.rand(2, 16, 16, 3).astype(np.float32)
+        level_values, direct_level_values = self.sess.run([levels, direct_levels], feed_dict={tensor: values})
+        self.assertListEqual([(2, 4, 4, 3), (2, 16, 16, 3), (2, 8, 8, 3), (2, 8, 8, 3)],
+                             [level_value.shape for level_value in level_values])
+        # Bilinear downsampling by powers of 2 samples the same pixels whether it's cascaded or not.
+        self.assertTrue(np.allclose(direct_level_values[0], level_values[0]))
+        self.assertTrue(np.allclose(direct_level_values[1], level_values[2]))
+
     def test_multi_level_unflow_loss(self):
         height = 8
         width = 8
@@ -4,7 +4,6 @@ import tensorflow as tf
 import numpy as np
 from common.forward_warp.forward_warp import create_disocclusion_mask
 from pwcnet.warp.warp import backward_warp
-from tensorflow.contrib.distributions import Normal
 
 
 # List of all possible loss terms.
@@ -176,6 +175,8 @@ def norm(x, sigma):
     :param sigma: Tensor.
     :return: Tensor.
     """
+    # Tf contrib is slow to import, so it is imported on first use.
+    from tensorflow.contrib.distributions import Normal
     dist = Normal(0.0, sigma)
     return dist.pdf(x) / dist.pdf(0.0)
 
@@ -1,60 +1,141 @@
 import tensorflow as tf
+from common.forward_warp.forward_warp import forward_warp, DISOCC_THRESH
 from common.models import RestorableNetwork
+from common.utils.tf import l2_regularizer, get_layers_data_format, get_spatial_shape, to_data_format, \
+    from_data_format, resize_bilinear, NHWC
 from pwcnet.estimator_network.model import EstimatorNetwork
 from pwcnet.context_network.model import ContextNetwork
 from pwcnet.feature_pyramid_network.model import FeaturePyramidNetwork
 from pwcnet.losses.loss import create_multi_level_loss, l2_diff, lq_diff, create_multi_level_unflow_loss
-from tensorflow.contrib.layers import l2_regularizer
+from pwcnet.model_config import get_default_model_config, validate_model_config, get_level_values
 
 
 VERBOSE = False
 
 
 class PWCNet(RestorableNetwork):
-    def __init__(self, name='pwc_net', regularizer=l2_regularizer(4e-4), flow_scaling=0.05, search_range=4):
+    def __init__(self, name='pwc_net', regularizer=l2_regularizer(4e-4), flow_scaling=0.05, search_range=4,
+                 config=None, data_format=NHWC):
         """
         :param name: Str.
         :param regularizer: Tf regularizer.
         :param flow_layer_loss_weights: List of floats. Corresponds to the weight of a loss for a flow at some layer.
                                         i.e. flow_layer_loss_weights[0] corresponds to previous_flows[0].
         :param flow_scaling: In the PWC-Net paper, ground truth is scaled by this amount to normalize the flows.
-        :param search_range: The search range to use for the cost volume layer.
+        :param search_range: The search range to use for the cost volume layer. Ignored if there is a config.
+        :param config: Dict or None. Architecture in the format of pwcnet.model_config.DEFAULT_MODEL_CONFIG, i.e. from
+                       pwcnet.model_config.load_model_config. None is the original PWC-Net. Saved weights can only be
+                       restored into a model of the same config.
+        :param data_format: Str. NHWC or NCHW. Layout that the network runs in, which is usually faster in NCHW on GPUs
+                            and MKL-DNN CPUs. The inputs and outputs are NHWC either way, and only converted once at
+                            the model boundary. Saved weights are the same for both. The native correlation and warp
+                            ops and tf.image.resize_bilinear only have NHWC kernels, so in NCHW their inputs and outputs
+                            are transposed, which adds up to 8 transposes per level. NCHW only pays off when the
+                            convolutions dominate the runtime.
         """
         super().__init__(name=name)
 
+        if config is None:
+            config = get_default_model_config()
+            config['search_range'] = search_range
+        validate_model_config(config)
+        self.config = config
         self.regularizer = regularizer
         self.flow_scaling = flow_scaling
+        self.data_format = data_format
 
         # Number of times the flow is estimated and refined.
         # If this number changes, then the feature_pyramid needs to be reconfigured.
-        self.num_feature_levels = 6
+        self.num_feature_levels = config['num_feature_levels']
         # This is the output feature level. This can be anywhere between [1, self.num_feature_levels].
-        self.output_level = 2
+        self.output_level = config['output_level']
         # A range that counts down from [self.num_flow_estimates, self.output_level] inclusive.
         self.iter_range = range(self.num_feature_levels, self.output_level - 1, -1)
 
-        self.feature_pyramid = FeaturePyramidNetwork(regularizer=self.regularizer)
+        search_ranges = get_level_values(config['search_range'], len(self.iter_range))
+        dense_nets = get_level_values(config['dense_net'], len(self.iter_range))
+        self.feature_pyramid = FeaturePyramidNetwork(layer_specs=config['feature_pyramid_layer_specs'],
+                                                     regularizer=self.regularizer, data_format=data_format)
         self.estimator_networks = [EstimatorNetwork(name='estimator_network_' + str(i),
+                                                    layer_specs=config['estimator_layer_specs'],
                                                     regularizer=self.regularizer,
-                                                    search_range=search_range)
-                                   for i in self.iter_range]
-        self.context_network = ContextNetwork(regularizer=self.regularizer)
+                                                    search_range=level_search_range,
+                                                    dense_net=level_dense_net,
+                                                    data_format=data_format)
+                                   for i, level_search_range, level_dense_net in zip(self.iter_range, search_ranges,
+                                                                                     dense_nets)]
+        self.context_network = ContextNetwork(layer_specs=config['context_layer_specs'], regularizer=self.regularizer,
+                                              data_format=data_format)
 
-    def get_forward(self, image_a, image_b, reuse_variables=tf.AUTO_REUSE):
+    def get_forward(self, image_a, image_b, reuse_variables=tf.AUTO_REUSE, exit_level=None,
+                    exit_context_network=False, initial_flow=None, initial_flow_level=4,
+                    forward_warp_initial_flow=False):
         """
         :param image_a: Tensor of shape [batch_size, H, W, 3].
         :param image_b: Tensor of shape [batch_size, H, W, 3].
         :param reuse_variables: tf reuse option. i.e. tf.AUTO_REUSE.
+        :param exit_level: Int or None. For inference, the flow refinement can stop early at a coarser level between
+                           [self.output_level, self.num_feature_levels], i.e. 4 for quarter of the usual resolution.
+                           The finer estimators are still in the graph so that the variables match the saved weights,
+                           but they don't run unless their outputs are fetched. None is the same as self.output_level.
+        :param exit_context_network: Bool. Whether the context network refines the flow at an exit_level that is
+                                     coarser than self.output_level. Only for the levels whose estimator features
+                                     have the channels that it was trained on (see supports_exit_context_network).
+        :param initial_flow: Tensor of shape [batch_size, H, W, 2] or None. For video, a flow estimate in the format of
+                             final_flow (i.e. the flow of the previous pair of frames) to warm start from. It replaces
+                             the estimates of the levels coarser than initial_flow_level, so those estimators don't run
+                             unless their outputs are fetched. Those estimators also upsample their features into the
+                             estimator at initial_flow_level, which gets zeros in their place instead. That estimator
+                             never saw zero features in training, so its refinement is outside the training
+                             distribution. The finer levels see the usual inputs and have to correct for it.
+        :param initial_flow_level: Int. Level between [exit_level, self.num_feature_levels) at which the initial_flow is
+                                   injected. The coarsest level has no input flow, so it can't take one.
+        :param forward_warp_initial_flow: Bool. Whether the initial_flow is moved along itself first, which predicts
+                                          the next flow when the initial_flow is that of the previous pair and the
+                                          motion is steady.
+        :return: final_flow: up-sampled final flow.
+                 previous_flows: all previous flow outputs of the estimator networks and the context network, from the
+                                 initial_flow_level if there is an initial_flow, up to the exit_level.
+        """
+        return self._get_forward(image_a, image_b, bidirectional=False, reuse_variables=reuse_variables,
+                                 exit_level=exit_level, exit_context_network=exit_context_network,
+                                 initial_flow=initial_flow, initial_flow_level=initial_flow_level,
+                                 forward_warp_initial_flow=forward_warp_initial_flow)
+
+    def _get_forward(self, image_a, image_b, bidirectional, reuse_variables, exit_level=None,
+                     exit_context_network=False, initial_flow=None, initial_flow_level=4,
+                     forward_warp_initial_flow=False):
+        """
+        :param image_a: Tensor of shape [batch_size, H, W, 3].
+        :param image_b: Tensor of shape [batch_size, H, W, 3].
+        :param bidirectional: Bool. If true, the flows from a to b and from b to a are estimated together, and the
+                              outputs have a batch size of 2 * batch_size (the a to b flows come first).
+        :param reuse_variables: tf reuse option. i.e. tf.AUTO_REUSE.
+        :param exit_level: Int or None. See get_forward.
+        :param exit_context_network: Bool. See get_forward.
+        :param initial_flow: Tensor or None. See get_forward.
+        :param initial_flow_level: Int. See get_forward.
+        :param forward_warp_initial_flow: Bool. See get_forward.
         :return: final_flow: up-sampled final flow.
                  previous_flows: all previous flow outputs of the estimator networks and the context network.
         """
+        if exit_level is None:
+            exit_level = self.output_level
+        assert self.output_level <= exit_level <= self.num_feature_levels
+        if exit_context_network:
+            assert self.supports_exit_context_network(exit_level), \
+                'The context network can\'t refine the flow at level %d. Exit without it instead.' % exit_level
+        if initial_flow is not None:
+            assert exit_level <= initial_flow_level < self.num_feature_levels, \
+                'The initial flow must go in between levels %d and %d.' % (exit_level, self.num_feature_levels - 1)
+
         with tf.variable_scope(self.name, reuse=reuse_variables):
             batch_size = tf.shape(image_a)[0]
             img_height = tf.shape(image_a)[1]
             img_width = tf.shape(image_a)[2]
             # Siamese networks (i.e. image_a and image_b are fed through the same network with shared weights).
             # Implemented by combining the the image_a and image_b batches.
-            images_a_b = tf.concat([image_a, image_b], axis=0)
+            images_a_b = to_data_format(tf.concat([image_a, image_b], axis=0), self.data_format)
             _, features = self.feature_pyramid.get_forward(images_a_b, reuse_variables=reuse_variables)
 
             # The initial flow is None. The estimator not do warping if flow is None.
@@ -63,20 +144,37 @@ class PWCNet(RestorableNetwork):
             previous_flows = []
             # Intermediate features from the previous estimator network.
             previous_estimator_features = None
+            # Flows of an early exit.
+            exit_flow = None
+            exit_flows = None
 
             # Counts down from [self.num_flow_estimates, self.output_level] inclusive.
             for i in self.iter_range:
                 if VERBOSE:
                     print('Creating estimator at level', i)
                 # Get the features at this level.
-                features_a_n, features_b_n = self._get_image_features_for_level(features, i, batch_size)
+                features_a_n, features_b_n = self._get_image_features_for_level(features, i, batch_size,
+                                                                                bidirectional=bidirectional)
 
                 # Setup the previous flow and feature map for input into the estimator network at this level.
-                H, W = tf.shape(features_a_n)[1], tf.shape(features_a_n)[2]
+                H, W = get_spatial_shape(features_a_n, self.data_format)
+                warm_start = initial_flow is not None and i == initial_flow_level
+                if warm_start:
+                    # The estimates of the coarser levels are replaced by the initial flow, which has the scale of the
+                    # ground truth.
+                    previous_flow = to_data_format(initial_flow * self.flow_scaling, self.data_format)
+                    previous_flows = []
                 resized_flow, pre_warp_scaling = self._create_resized_flow_for_next_estimator(
                     previous_flow, H, W, img_height, name='resize_previous_flow' + str(i))
                 upsampled_previous_features = self._create_upsampled_features_for_next_estimator(
                     previous_estimator_features, name='deconv_estimator_features_' + str(i))
+                if warm_start:
+                    if forward_warp_initial_flow:
+                        resized_flow = self._forward_warp_flow(resized_flow, pre_warp_scaling,
+                                                               name='forward_warp_initial_flow' + str(i))
+                    # There are no estimator features for the initial flow. The deconvolution above still exists so
+                    # that the variables match the saved weights, but it isn't part of this path.
+                    upsampled_previous_features = tf.zeros_like(resized_flow)
 
                 # Get the estimator network.
                 estimator_network = self.estimator_networks[self.num_feature_levels - i]
@@ -103,6 +201,23 @@ class PWCNet(RestorableNetwork):
                     previous_flow, _ = self.context_network.get_forward(
                         previous_estimator_features, previous_flow, reuse_variables=reuse_variables)
                     previous_flows.append(previous_flow)
+                elif i == exit_level:
+                    exit_flow = previous_flow
+                    exit_flows = list(previous_flows)
+                    if exit_context_network:
+                        exit_flow, _ = self.context_network.get_forward(
+                            previous_estimator_features, previous_flow, reuse_variables=reuse_variables)
+                        exit_flows.append(exit_flow)
+
+            if exit_flow is not None:
+                previous_flow = exit_flow
+                previous_flows = exit_flows
+
+            # The flows are small, so they are the only tensors converted back.
+            if self.data_format != NHWC:
+                with tf.name_scope('from_data_format'):
+                    previous_flows = [from_data_format(flow, self.data_format) for flow in previous_flows]
+                    previous_flow = previous_flows[-1]
 
             final_flow = tf.image.resize_bilinear(previous_flow, [img_height, img_width])
             final_flow = tf.divide(final_flow, self.flow_scaling, name='final_flow')
@@ -119,14 +234,12 @@ class PWCNet(RestorableNetwork):
                  previous_forward_flows: all previous flow outputs of the estimator networks and the context network.
                  previous_backward_flows: all previous flow outputs of the estimator networks and the context network.
         """
-        with tf.name_scope('preprocess_bidirectional'):
-            batch_size = tf.shape(image_a)[0]
-            input_stack_a = tf.concat([image_a, image_b], axis=0)
-            input_stack_b = tf.concat([image_b, image_a], axis=0)
-
-        final_flow, previous_flows = self.get_forward(input_stack_a, input_stack_b, reuse_variables=reuse_variables)
+        # The feature pyramid only runs on image_a and image_b once. The backward direction swaps their features.
+        final_flow, previous_flows = self._get_forward(image_a, image_b, bidirectional=True,
+                                                       reuse_variables=reuse_variables)
 
         with tf.name_scope('postprocess_bidirectional'):
+            batch_size = tf.shape(image_a)[0]
             final_forward_flow = final_flow[0:batch_size, ...]
             final_backward_flow = final_flow[batch_size:, ...]
             previous_forward_flows = []
@@ -137,15 +250,102 @@ class PWCNet(RestorableNetwork):
 
         return final_forward_flow, final_backward_flow, previous_forward_flows, previous_backward_flows
 
-    def _get_image_features_for_level(self, feature_levels, level, batch_size):
+    def supports_exit_context_network(self, exit_level):
+        """
+        The context network was trained on the features of the estimator at the output level. At an early exit, it only
+        takes the features of the estimator at the exit level if they have the same channels, and is never given
+        anything else in their place. For dense estimators, the features include the pyramid features, the cost volume,
+        the input flow and the upsampled features of the coarser estimator. So the pyramid channels and the search range
+        must match, and the coarsest level (which has no input flow) is ruled out. With the default PWC-Net, whose
+        pyramid widens at every level, this leaves only the output level.
+        :param exit_level: Int. Level between [self.output_level, self.num_feature_levels].
+        :return: Bool. Whether get_forward can apply the context network at exit_level.
+        """
+        if exit_level == self.output_level:
+            return True
+        exit_estimator = self.estimator_networks[self.num_feature_levels - exit_level]
+        output_estimator = self.estimator_networks[-1]
+        if exit_estimator.dense_net != output_estimator.dense_net:
+            return False
+        if not exit_estimator.dense_net:
+            return exit_estimator.layer_specs[-2][1] == output_estimator.layer_specs[-2][1]
+        pyramid_specs = self.feature_pyramid.layer_specs
+        exit_pyramid_channels = pyramid_specs[self.feature_pyramid.get_c_n_idx(exit_level)][1]
+        output_pyramid_channels = pyramid_specs[self.feature_pyramid.get_c_n_idx(self.output_level)][1]
+        return exit_level < self.num_feature_levels and exit_estimator.search_range == output_estimator.search_range \
+            and exit_pyramid_channels == output_pyramid_channels
+
+    def get_size_multiple(self):
+        """
+        :return: Int. The input height and width must be multiples of this, since the feature pyramid halves the
+                 resolution at every level.
+        """
+        return 2 ** self.num_feature_levels
+
+    def get_num_flops(self, height, width):
+        """
+        Counts the floating point operations of the convolutions and cost volumes of get_forward, as 2 per
+        multiply-add. Activations, warps and resizes are comparatively cheap and aren't counted.
+        :param height: Int. Input image height. Must be a multiple of get_size_multiple().
+        :param width: Int. Input image width. Must be a multiple of get_size_multiple().
+        :return: Int. FLOPs per image pair.
+        """
+        def _get_conv_tower_macs(layer_specs, num_channels, h, w, dense_net):
+            macs = 0
+            for kernel_size, num_output_channels, _, stride in layer_specs:
+                h, w = -(-h // stride), -(-w // stride)
+                macs += h * w * kernel_size * kernel_size * num_channels * num_output_channels
+                num_channels = num_channels + num_output_channels if dense_net else num_output_channels
+            return macs, num_channels
+
+        # The pyramid runs on both images.
+        pyramid_specs = self.feature_pyramid.layer_specs
+        macs, _ = _get_conv_tower_macs(pyramid_specs, 3, height, width, False)
+        macs *= 2
+
+        previous_num_channels = None
+        for i, estimator_network in zip(self.iter_range, self.estimator_networks):
+            h, w = height // 2 ** i, width // 2 ** i
+            num_features = pyramid_specs[self.feature_pyramid.get_c_n_idx(i)][1]
+            cost_volume_size = (2 * estimator_network.search_range + 1) ** 2
+            macs += h * w * num_features * cost_volume_size
+            num_channels = num_features + cost_volume_size
+            if previous_num_channels is not None:
+                # The transposed convolution of the previous estimator features, and the flow and those features as
+                # inputs.
+                macs += (h // 2) * (w // 2) * 4 * 4 * previous_num_channels * 2
+                num_channels += 4
+            layer_specs = estimator_network.layer_specs
+            estimator_macs, _ = _get_conv_tower_macs(layer_specs, num_channels, h, w, estimator_network.dense_net)
+            macs += estimator_macs
+            # The features of the next estimator are the second to last outputs.
+            if estimator_network.dense_net:
+                _, previous_num_channels = _get_conv_tower_macs(layer_specs[:-1], num_channels, h, w, True)
+            else:
+                previous_num_channels = layer_specs[-2][1]
+
+        h, w = height // 2 ** self.output_level, width // 2 ** self.output_level
+        context_macs, _ = _get_conv_tower_macs(self.context_network.layer_specs, previous_num_channels + 2, h, w,
+                                               self.context_network.dense_net)
+        macs += context_macs
+        return 2 * macs
+
+    def _get_image_features_for_level(self, feature_levels, level, batch_size, bidirectional=False):
         """
         Extracts the features for image_a and image_b from the feature pyramid.
         :param feature_levels: List of features from the feature pyramid.
         :param level: Int.
         :param batch_size: Scalar tensor.
-        :return: features_a_n, features_b_n: Tensors of shape [batch_size, height, width, channels].
+        :param bidirectional: Bool. If true, the features are stacked as [a, b] and [b, a] for both flow directions.
+        :return: features_a_n, features_b_n: Tensors of shape [batch_size, height, width, channels], or
+                 [2 * batch_size, height, width, channels] if bidirectional.
         """
         features_n = feature_levels[self.feature_pyramid.get_c_n_idx(level)]
+        if bidirectional:
+            # The pyramid features are already stacked as [a, b].
+            with tf.name_scope('features_b_' + str(level)):
+                features_b_n = tf.concat([features_n[batch_size:, ...], features_n[0:batch_size, ...]], axis=0)
+            return features_n, features_b_n
         with tf.name_scope('features_a_' + str(level)):
             features_a_n = features_n[0:batch_size, ...]
         with tf.name_scope('features_b_' + str(level)):
@@ -170,9 +370,30 @@ class PWCNet(RestorableNetwork):
             dimension_scaling = tf.cast(desired_height, tf.float32) / tf.cast(img_height, tf.float32)
             pre_warp_scaling = dimension_scaling / self.flow_scaling
             # Upsample to the size of the current layer.
-            resized_flow = tf.image.resize_bilinear(previous_flow, [desired_height, desired_width], name=name)
+            resized_flow = resize_bilinear(previous_flow, [desired_height, desired_width], data_format=self.data_format,
+                                           name=name)
         return resized_flow, pre_warp_scaling
 
+    def _forward_warp_flow(self, flow, pre_warp_scaling, name):
+        """
+        Moves a flow along itself, i.e. from the pixels of the first frame of a pair to the pixels of the second frame,
+        assuming constant motion. Pixels that nothing lands on keep the unwarped flow.
+        :param flow: Tensor of shape [batch, height, width, 2].
+        :param pre_warp_scaling: Scalar tensor. Scaling that denormalizes the flow to pixels at this resolution.
+        :param name: Str.
+        :return: Tensor of shape [batch, height, width, 2].
+        """
+        with tf.name_scope(name):
+            # The forward warp is NHWC only.
+            flow = from_data_format(flow, self.data_format)
+            # The splatted weights are warped along with the flow to normalize it.
+            ones = tf.ones_like(flow[..., 0:1])
+            warped = forward_warp(tf.concat([flow, ones], axis=-1), flow * pre_warp_scaling)
+            warped_flow, weights = warped[..., 0:2], warped[..., 2:3]
+            filled = tf.cast(tf.greater(weights, DISOCC_THRESH), tf.float32)
+            warped_flow = warped_flow / tf.maximum(weights, DISOCC_THRESH)
+            return to_data_format(filled * warped_flow + (1.0 - filled) * flow, self.data_format)
+
     def _create_upsampled_features_for_next_estimator(self, features, name):
         """
         Upsamples a feature map and encodes it into 2 channels.
@@ -184,34 +405,37 @@ class PWCNet(RestorableNetwork):
         if features is not None:
             upsampled_features = tf.layers.conv2d_transpose(
                 features, filters=2, kernel_size=4, strides=2, padding='same', use_bias=True,
-                kernel_regularizer=self.regularizer, bias_regularizer=self.regularizer, name=name)
+                kernel_regularizer=self.regularizer, bias_regularizer=self.regularizer,
+                data_format=get_layers_data_format(self.data_format), name=name)
         return upsampled_features
 
-    def _get_loss(self, previous_flows, expected_flow, diff_fn):
+    def _get_loss(self, previous_flows, expected_flow, diff_fn, expected_flow_pyramid=None):
         """
         :param previous_flows: List of previous outputs from the PWC-Net forward pass.
         :param expected_flow: Tensor of shape [batch_size, H, W, 2]. These are the ground-truth labels.
         :param diff_fn: Function to diff 2 tensors.
+        :param expected_flow_pyramid: List of tensors or None. See create_multi_level_loss.
         :return: Tf scalar loss term, and an array of all the inidividual loss terms.
         """
 
         total_loss, layer_losses = create_multi_level_loss(
-            expected_flow=expected_flow, flows=previous_flows, flow_scaling=self.flow_scaling, diff_fn=diff_fn)
+            expected_flow=expected_flow, flows=previous_flows, flow_scaling=self.flow_scaling, diff_fn=diff_fn,
+            expected_flow_pyramid=expected_flow_pyramid)
 
         # Add the regularization loss.
         total_loss += tf.add_n(tf.losses.get_regularization_losses(scope=self.name))
 
         return total_loss, layer_losses
 
-    def get_training_loss(self, previous_flows, expected_flow):
+    def get_training_loss(self, previous_flows, expected_flow, expected_flow_pyramid=None):
         """
         Uses an L2 diffing loss.
         :return: Tf scalar loss term, and an array of all the inidividual loss terms.
         """
         with tf.name_scope('training_loss'):
-            return self._get_loss(previous_flows, expected_flow, l2_diff)
+            return self._get_loss(previous_flows, expected_flow, l2_diff, expected_flow_pyramid=expected_flow_pyramid)
 
-    def get_fine_tuning_loss(self, previous_flows, expected_flow, q=0.4, epsilon=0.01):
+    def get_fine_tuning_loss(self, previous_flows, expected_flow, q=0.4, epsilon=0.01, expected_flow_pyramid=None):
         """
         Uses an Lq diffing loss.
         :return: Tf scalar loss term, and an array of all the inidividual loss terms.
@@ -219,7 +443,8 @@ class PWCNet(RestorableNetwork):
         with tf.name_scope('fine_tuning_loss'):
             def lq_diff_with_args(a, b):
                 return lq_diff(a, b, q=q, epsilon=epsilon)
-            return self._get_loss(previous_flows, expected_flow, lq_diff_with_args)
+            return self._get_loss(previous_flows, expected_flow, lq_diff_with_args,
+                                  expected_flow_pyramid=expected_flow_pyramid)
 
     def get_unflow_training_loss(self, image_a, image_b, previous_forward_flows, previous_backward_flows):
         """
@@ -0,0 +1,98 @@
+import copy
+from common.utils.config import import_json, preprocess_var_refs, merge_dicts
+
+
+# Configuration of the original PWC-Net. Layer specs of None are the defaults of the sub-networks.
+# Values that are per estimator level can either be a single value for all levels, or a list ordered from the coarsest
+# level (num_feature_levels) to the finest (output_level).
+DEFAULT_MODEL_CONFIG = {
+    # Number of levels of the feature pyramid. The pyramid has 3 layers per level.
+    'num_feature_levels': 6,
+    # Level at which the context network is applied. The flow is estimated at every level in between.
+    'output_level': 2,
+    # Int or list of ints per level. Search range of the cost volume.
+    'search_range': 4,
+    # Bool or list of bools per level. Whether the estimators are dense nets.
+    'dense_net': True,
+    # Layer specs in the format of ConvNetwork, or None.
+    'feature_pyramid_layer_specs': None,
+    'estimator_layer_specs': None,
+    'context_layer_specs': None
+}
+
+# A reduced variant for CPU deployments (see mains/configs/pwcnet_model/pwcnet_small.json). The pyramid and the context
+# network have about half the channels, the estimators are narrower non-dense nets, and the search range shrinks at the
+# finer levels. PWCNet.get_num_flops counts, per image pair:
+#     Resolution (W x H)      Default       Small
+#     448 x 384           63.3 GFLOPs  8.3 GFLOPs
+#     1024 x 448         168.8 GFLOPs 22.0 GFLOPs
+#     1920 x 1088        768.6 GFLOPs 100.2 GFLOPs
+# Latency depends on the device, and is reported for trained weights by mains/evaluate_pwcnet.py with -mc. For random
+# weights, pwcnet/model_profile.py profiles the forward and backward passes.
+SMALL_MODEL_CONFIG_FILE = 'mains/configs/pwcnet_model/pwcnet_small.json'
+
+
+def get_default_model_config():
+    """
+    :return: Dict. A copy of DEFAULT_MODEL_CONFIG.
+    """
+    return copy.deepcopy(DEFAULT_MODEL_CONFIG)
+
+
+def load_model_config(file_name):
+    """
+    Reads a model config JSON. It can have a 'parent_json' and 'vars' like the other configs, and missing values are
+    taken from DEFAULT_MODEL_CONFIG.
+    :param file_name: Str.
+    :return: Dict in the format of DEFAULT_MODEL_CONFIG.
+    """
+    config = import_json(file_name)
+    preprocess_var_refs(config)
+    config.pop('parent_json', None)
+    merge_dicts(get_default_model_config(), config)
+    validate_model_config(config)
+    return config
+
+
+def validate_model_config(config):
+    """
+    :param config: Dict in the format of DEFAULT_MODEL_CONFIG.
+    :return: Nothing.
+    """
+    unknown_keys = set(config.keys()) - set(DEFAULT_MODEL_CONFIG.keys())
+    assert len(unknown_keys) == 0, 'Unknown model config keys: ' + str(sorted(unknown_keys))
+    num_feature_levels = config['num_feature_levels']
+    output_level = config['output_level']
+    assert 1 <= output_level <= num_feature_levels
+    num_estimators = num_feature_levels - output_level + 1
+    for key in ['search_range', 'dense_net']:
+        assert not isinstance(config[key], list) or len(config[key]) == num_estimators, \
+            key + ' must have one value per estimator level.'
+
+    feature_pyramid_layer_specs = config['feature_pyramid_layer_specs']
+    if feature_pyramid_layer_specs is None:
+        # The default pyramid has 6 levels.
+        assert num_feature_levels == DEFAULT_MODEL_CONFIG['num_feature_levels']
+    else:
+        assert len(feature_pyramid_layer_specs) == 3 * num_feature_levels
+        for i in range(num_feature_levels):
+            strides = [layer_spec[3] for layer_spec in feature_pyramid_layer_specs[3 * i:3 * i + 3]]
+            assert strides == [2, 1, 1], 'Every pyramid level must halve the resolution once.'
+    for key in ['estimator_layer_specs', 'context_layer_specs']:
+        layer_specs = config[key]
+        if layer_specs is not None:
+            assert len(layer_specs) > 1
+            assert all(layer_spec[3] == 1 for layer_spec in layer_specs), 'Layers must keep the resolution.'
+            assert layer_specs[-1][1] == 2, 'The last layer must output a flow.'
+
+
+def get_level_values(value, num_levels):
+    """
+    :param value: A value or a list of values per level.
+    :param num_levels: Int.
+    :return: List of num_levels values.
+    """
+    if isinstance(value, list):
+        assert len(value) == num_levels
+        return list(value)
+    return [value] * num_levels
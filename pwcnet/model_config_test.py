@@ -0,0 +1,66 @@
+import os
+import unittest
+from common.utils.config import read_raw_json
+from pwcnet.model_config import DEFAULT_MODEL_CONFIG, SMALL_MODEL_CONFIG_FILE, get_default_model_config, \
+    load_model_config, validate_model_config, get_level_values
+
+
+class TestModelConfig(unittest.TestCase):
+    def setUp(self):
+        self.temp_file = os.path.join('pwcnet', 'temp_model_config_test.json')
+
+    def test_default_config_file(self):
+        config = load_model_config('mains/configs/pwcnet_model/pwcnet.json')
+        self.assertDictEqual(DEFAULT_MODEL_CONFIG, config)
+
+    def test_small_config_file(self):
+        config = load_model_config(SMALL_MODEL_CONFIG_FILE)
+        self.assertDictEqual(read_raw_json(SMALL_MODEL_CONFIG_FILE), config)
+        self.assertFalse(config['dense_net'])
+        self.assertListEqual([4, 4, 4, 3, 2], get_level_values(config['search_range'], 5))
+
+    def test_missing_values_are_defaults(self):
+        with open(self.temp_file, 'w') as file:
+            file.write('{ "parent_json": "%s", "dense_net": true }' % SMALL_MODEL_CONFIG_FILE)
+        config = load_model_config(self.temp_file)
+        expected = read_raw_json(SMALL_MODEL_CONFIG_FILE)
+        expected['dense_net'] = True
+        self.assertDictEqual(expected, config)
+
+        with open(self.temp_file, 'w') as file:
+            file.write('{ "search_range": 3 }')
+        config = load_model_config(self.temp_file)
+        expected = get_default_model_config()
+        expected['search_range'] = 3
+        self.assertDictEqual(expected, config)
+
+    def test_invalid_config(self):
+        def _get_config(**kwargs):
+            config = get_default_model_config()
+            config.update(kwargs)
+            return config
+
+        validate_model_config(_get_config(search_range=[4, 4, 3, 3, 2]))
+        with self.assertRaises(AssertionError):
+            validate_model_config(_get_config(search_range=[4, 4, 3]))
+        with self.assertRaises(AssertionError):
+            validate_model_config(_get_config(num_layers=3))
+        with self.assertRaises(AssertionError):
+            # The default pyramid can't have 5 levels.
+            validate_model_config(_get_config(num_feature_levels=5))
+        with self.assertRaises(AssertionError):
+            validate_model_config(_get_config(feature_pyramid_layer_specs=[[3, 16, 1, 2]] * 18))
+        with self.assertRaises(AssertionError):
+            validate_model_config(_get_config(estimator_layer_specs=[[3, 32, 1, 1], [3, 3, 1, 1]]))
+
+    def test_get_level_values(self):
+        self.assertListEqual([True, True, True], get_level_values(True, 3))
+        self.assertListEqual([1, 2, 3], get_level_values([1, 2, 3], 3))
+
+    def tearDown(self):
+        if os.path.isfile(self.temp_file):
+            os.remove(self.temp_file)
+
+
+if __name__ == '__main__':
+    unittest.main()
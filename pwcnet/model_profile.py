@@ -1,7 +1,9 @@
+import sys
 import numpy as np
 import tensorflow as tf
 from common.utils.profile import run_tensorboard_profiler
 from pwcnet.model import PWCNet
+from pwcnet.model_config import load_model_config
 
 if __name__ == '__main__':
     height = 384
@@ -13,7 +15,9 @@ if __name__ == '__main__':
     image_shape = [batch_size, height, width, im_channels]
     image_a_placeholder = tf.placeholder(shape=image_shape, dtype=tf.float32)
     image_b_placeholder = tf.placeholder(shape=image_shape, dtype=tf.float32)
-    pwcnet = PWCNet()
+    # An optional model config file, i.e. mains/configs/pwcnet_model/pwcnet_small.json.
+    pwcnet = PWCNet(config=load_model_config(sys.argv[1]) if len(sys.argv) > 1 else None)
+    print('GFLOPs per image pair:', pwcnet.get_num_flops(height, width) / 1e9)
     flow, _ = pwcnet.get_forward(image_a_placeholder, image_b_placeholder)
     grads = tf.gradients(flow, [image_a_placeholder, image_b_placeholder])
 
@@ -2,6 +2,7 @@ import numpy as np
 import tensorflow as tf
 import unittest
 from pwcnet.model import PWCNet
+from pwcnet.model_config import get_default_model_config, load_model_config, SMALL_MODEL_CONFIG_FILE
 from tensorflow.contrib.layers import l2_regularizer
 
 
@@ -226,6 +227,243 @@ class TestPWCModel(unittest.TestCase):
         pwc_net_shared.get_bidirectional(input_image_a, input_image_b)
         self.assertEqual(trainable_vars_after, len(tf.trainable_variables()))
 
+    def test_bidirectional_matches_forward(self):
+        height = 64
+        width = 128
+        batch_size = 2
+
+        # Create the graph.
+        input_image_a = tf.placeholder(shape=[None, height, width, 3], dtype=tf.float32)
+        input_image_b = tf.placeholder(shape=[None, height, width, 3], dtype=tf.float32)
+        final_forward_flow, final_backward_flow, previous_forward_flows, previous_backward_flows = \
+            self.pwc_net.get_bidirectional(input_image_a, input_image_b)
+        trainable_vars = len(tf.trainable_variables())
+        # The bidirectional flow used to be computed by stacking the directions.
+        final_flow, previous_flows = self.pwc_net.get_forward(tf.concat([input_image_a, input_image_b], axis=0),
+                                                              tf.concat([input_image_b, input_image_a], axis=0))
+        self.assertEqual(trainable_vars, len(tf.trainable_variables()))
+
+        self.sess.run(tf.global_variables_initializer())
+        image_a = np.random.rand(batch_size, height, width, 3).astype(np.float32)
+        image_b = np.random.rand(batch_size, height, width, 3).astype(np.float32)
+        query = [final_forward_flow, final_backward_flow, final_flow] + previous_forward_flows + \
+            previous_backward_flows + previous_flows
+        results = self.sess.run(query, feed_dict={input_image_a: image_a, input_image_b: image_b})
+        num_flows = len(previous_flows)
+        forward, backward, stacked = results[0], results[1], results[2]
+        self.assertTrue(np.allclose(stacked, np.concatenate([forward, backward], axis=0), atol=1e-5))
+        for i in range(num_flows):
+            forward = results[3 + i]
+            backward = results[3 + num_flows + i]
+            stacked = results[3 + 2 * num_flows + i]
+            self.assertTrue(np.allclose(stacked, np.concatenate([forward, backward], axis=0), atol=1e-5))
+
+    def test_size_multiple(self):
+        size_multiple = self.pwc_net.get_size_multiple()
+        self.assertEqual(64, size_multiple)
+
+        # The smallest valid input.
+        input_image_a = tf.placeholder(shape=[None, size_multiple, size_multiple, 3], dtype=tf.float32)
+        input_image_b = tf.placeholder(shape=[None, size_multiple, size_multiple, 3], dtype=tf.float32)
+        final_flow, _ = self.pwc_net.get_forward(input_image_a, input_image_b)
+        self.sess.run(tf.global_variables_initializer())
+        image = np.zeros(shape=[1, size_multiple, size_multiple, 3], dtype=np.float32)
+        flow = self.sess.run(final_flow, feed_dict={input_image_a: image, input_image_b: image})
+        self.assertTupleEqual((1, size_multiple, size_multiple, 2), flow.shape)
+
+    def test_early_exit(self):
+        height = 128
+        width = 128
+        batch_size = 2
+
+        input_image_a = tf.placeholder(shape=[None, height, width, 3], dtype=tf.float32)
+        input_image_b = tf.placeholder(shape=[None, height, width, 3], dtype=tf.float32)
+        final_flow, previous_flows = self.pwc_net.get_forward(input_image_a, input_image_b)
+        num_variables = len(tf.trainable_variables(scope='pwc_net'))
+
+        exit_flow, exit_flows = self.pwc_net.get_forward(input_image_a, input_image_b, exit_level=4)
+        # The early exits share all the variables of the full network.
+        self.assertEqual(num_variables, len(tf.trainable_variables(scope='pwc_net')))
+        # Estimators at levels 6, 5 and 4.
+        self.assertEqual(3, len(exit_flows))
+
+        image_a = np.zeros(shape=[batch_size, height, width, 3], dtype=np.float32)
+        image_a[:, 10:height - 10, 10:width - 10, :] = 1.0
+        image_b = np.zeros(shape=[batch_size, height, width, 3], dtype=np.float32)
+        image_b[:, 5:height - 5, 5:width - 5, :] = 1.0
+
+        self.sess.run(tf.global_variables_initializer())
+        query = [final_flow, exit_flow] + previous_flows + exit_flows
+        results = self.sess.run(query, feed_dict={input_image_a: image_a, input_image_b: image_b})
+        full, exit = results[0:2]
+        previous = results[2:2 + len(previous_flows)]
+        exit_previous = results[2 + len(previous_flows):]
+
+        self.assertTupleEqual((batch_size, height, width, 2), exit.shape)
+        self.assertTupleEqual((batch_size, height / 16, width / 16, 2), exit_previous[-1].shape)
+        # The coarser estimates are the same as in the full network.
+        for i in range(3):
+            self.assertTrue(np.allclose(previous[i], exit_previous[i], atol=1e-5))
+        self.assertFalse(np.allclose(full, exit))
+
+    def test_early_exit_context_network_levels(self):
+        height = 128
+        width = 128
+        input_image_a = tf.placeholder(shape=[None, height, width, 3], dtype=tf.float32)
+        input_image_b = tf.placeholder(shape=[None, height, width, 3], dtype=tf.float32)
+
+        # The pyramid of the default PWC-Net widens at every level, so the dense features of no early exit fit the
+        # context network.
+        self.assertTrue(self.pwc_net.supports_exit_context_network(2))
+        for level in range(3, 7):
+            self.assertFalse(self.pwc_net.supports_exit_context_network(level))
+        with self.assertRaises(AssertionError):
+            self.pwc_net.get_forward(input_image_a, input_image_b, exit_level=4, exit_context_network=True)
+
+        # Dense features fit if the pyramid channels and the search range match, apart from the coarsest level, which
+        # has no input flow.
+        config = get_default_model_config()
+        config['feature_pyramid_layer_specs'] = [[3, 16, 1, 2 if i % 3 == 0 else 1] for i in range(18)]
+        pwc_net_narrow = PWCNet(name='narrow_pwc_net', config=config)
+        self.assertTrue(pwc_net_narrow.supports_exit_context_network(5))
+        self.assertFalse(pwc_net_narrow.supports_exit_context_network(6))
+        config['search_range'] = [4, 4, 4, 3, 2]
+        pwc_net_search_ranges = PWCNet(name='search_ranges_pwc_net', config=config)
+        self.assertFalse(pwc_net_search_ranges.supports_exit_context_network(4))
+
+        # Estimators that aren't dense always fit, and the context network refines their early exits.
+        pwc_net_small = PWCNet(name='exit_small_pwc_net', config=load_model_config(SMALL_MODEL_CONFIG_FILE))
+        self.assertTrue(all(pwc_net_small.supports_exit_context_network(level) for level in range(2, 7)))
+        exit_flow, exit_flows = pwc_net_small.get_forward(input_image_a, input_image_b, exit_level=4,
+                                                          exit_context_network=True)
+        exit_flow_no_context, exit_flows_no_context = pwc_net_small.get_forward(input_image_a, input_image_b,
+                                                                                exit_level=4)
+        # Estimators at levels 6, 5 and 4, followed by the context network.
+        self.assertEqual(4, len(exit_flows))
+        self.assertEqual(3, len(exit_flows_no_context))
+
+        image_a = np.random.rand(1, height, width, 3).astype(np.float32)
+        image_b = np.roll(image_a, 2, axis=2)
+        self.sess.run(tf.global_variables_initializer())
+        exit, exit_no_context = self.sess.run([exit_flow, exit_flow_no_context],
+                                              feed_dict={input_image_a: image_a, input_image_b: image_b})
+        self.assertTupleEqual((1, height, width, 2), exit.shape)
+        self.assertFalse(np.allclose(exit, exit_no_context))
+
+    def test_warm_start(self):
+        height = 128
+        width = 128
+        batch_size = 2
+
+        input_image_a = tf.placeholder(shape=[None, height, width, 3], dtype=tf.float32)
+        input_image_b = tf.placeholder(shape=[None, height, width, 3], dtype=tf.float32)
+        input_flow = tf.placeholder(shape=[None, height, width, 2], dtype=tf.float32)
+        self.pwc_net.get_forward(input_image_a, input_image_b)
+        num_variables = len(tf.trainable_variables(scope='pwc_net'))
+
+        warm_flow, warm_flows = self.pwc_net.get_forward(input_image_a, input_image_b, initial_flow=input_flow,
+                                                         initial_flow_level=4)
+        warped_warm_flow, _ = self.pwc_net.get_forward(input_image_a, input_image_b, initial_flow=input_flow,
+                                                       initial_flow_level=4, forward_warp_initial_flow=True)
+        # The warm start shares all the variables of the full network.
+        self.assertEqual(num_variables, len(tf.trainable_variables(scope='pwc_net')))
+        # Estimators at levels 4, 3 and 2, followed by the context network.
+        self.assertEqual(4, len(warm_flows))
+
+        # The initial flow can go in at the second coarsest level at most, since the coarsest estimator has no input
+        # flow. It can't go in below the exit level either.
+        _, coarse_warm_flows = self.pwc_net.get_forward(input_image_a, input_image_b, initial_flow=input_flow,
+                                                        initial_flow_level=5)
+        self.assertEqual(5, len(coarse_warm_flows))
+        with self.assertRaises(AssertionError):
+            self.pwc_net.get_forward(input_image_a, input_image_b, initial_flow=input_flow, initial_flow_level=6)
+        with self.assertRaises(AssertionError):
+            self.pwc_net.get_forward(input_image_a, input_image_b, exit_level=4, initial_flow=input_flow,
+                                     initial_flow_level=3)
+
+        image_a = np.zeros(shape=[batch_size, height, width, 3], dtype=np.float32)
+        image_a[:, 10:height - 10, 10:width - 10, :] = 1.0
+        image_b = np.zeros(shape=[batch_size, height, width, 3], dtype=np.float32)
+        image_b[:, 5:height - 5, 5:width - 5, :] = 1.0
+
+        self.sess.run(tf.global_variables_initializer())
+        query = [warm_flow, warped_warm_flow, warm_flows[0]]
+        zero_flow = np.zeros(shape=[batch_size, height, width, 2], dtype=np.float32)
+        results = self.sess.run(query, feed_dict={input_image_a: image_a, input_image_b: image_b,
+                                                  input_flow: zero_flow})
+        self.assertTupleEqual((batch_size, height, width, 2), results[0].shape)
+        self.assertTupleEqual((batch_size, height / 16, width / 16, 2), results[2].shape)
+        # Forward warping a zero flow doesn't move it.
+        self.assertTrue(np.allclose(results[0], results[1], atol=1e-5))
+
+        # The result depends on the initial flow.
+        constant_flow = np.ones(shape=[batch_size, height, width, 2], dtype=np.float32)
+        result = self.sess.run(warm_flow, feed_dict={input_image_a: image_a, input_image_b: image_b,
+                                                     input_flow: constant_flow})
+        self.assertFalse(np.allclose(results[0], result))
+
+    def test_small_config(self):
+        height = 128
+        width = 128
+        batch_size = 2
+
+        pwc_net_small = PWCNet(name='pwc_net_small', regularizer=l2_regularizer(1e-4),
+                               config=load_model_config(SMALL_MODEL_CONFIG_FILE))
+        self.assertFalse(pwc_net_small.estimator_networks[0].dense_net)
+        self.assertListEqual([4, 4, 4, 3, 2], [network.search_range for network in pwc_net_small.estimator_networks])
+        self.assertLess(pwc_net_small.get_num_flops(height, width), self.pwc_net.get_num_flops(height, width) / 4)
+
+        input_image_a = tf.placeholder(shape=[None, height, width, 3], dtype=tf.float32)
+        input_image_b = tf.placeholder(shape=[None, height, width, 3], dtype=tf.float32)
+        final_flow, previous_flows = pwc_net_small.get_forward(input_image_a, input_image_b)
+        self.pwc_net.get_forward(input_image_a, input_image_b)
+        self.assertEqual(6, len(previous_flows))
+        small_num_parameters = sum(np.prod(var.get_shape().as_list())
+                                   for var in tf.trainable_variables(scope='pwc_net_small'))
+        num_parameters = sum(np.prod(var.get_shape().as_list()) for var in tf.trainable_variables(scope='pwc_net/'))
+        self.assertLess(small_num_parameters, num_parameters)
+
+        image = np.zeros(shape=[batch_size, height, width, 3], dtype=np.float32)
+        self.sess.run(tf.global_variables_initializer())
+        flow = self.sess.run(final_flow, feed_dict={input_image_a: image, input_image_b: image})
+        self.assertTupleEqual((batch_size, height, width, 2), flow.shape)
+
+    def test_num_flops(self):
+        # The pyramid, 5 cost volumes and the estimators and context network dominate.
+        num_flops = self.pwc_net.get_num_flops(384, 448)
+        self.assertGreater(num_flops, 50e9)
+        self.assertLess(num_flops, 100e9)
+        # The count is linear in the number of pixels.
+        self.assertEqual(4 * num_flops, self.pwc_net.get_num_flops(768, 896))
+
+    def test_nchw(self):
+        if not tf.test.is_gpu_available():
+            self.skipTest('NCHW convolutions are not supported on this CPU.')
+        height = 128
+        width = 128
+        batch_size = 2
+
+        pwc_net_nchw = PWCNet(name='nchw_pwc_net', regularizer=l2_regularizer(1e-4), data_format='NCHW')
+        input_image_a = tf.placeholder(shape=[None, height, width, 3], dtype=tf.float32)
+        input_image_b = tf.placeholder(shape=[None, height, width, 3], dtype=tf.float32)
+        final_flow, previous_flows = self.pwc_net.get_forward(input_image_a, input_image_b)
+        final_flow_nchw, previous_flows_nchw = pwc_net_nchw.get_forward(input_image_a, input_image_b)
+
+        # The weights are interchangeable.
+        self.sess.run(tf.global_variables_initializer())
+        weights = PWCNet.rename_np_dict(self.pwc_net.get_save_np(self.sess), 'pwc_net', 'nchw_pwc_net')
+        pwc_net_nchw.restore_from_np(weights, self.sess)
+
+        image_a = np.random.rand(batch_size, height, width, 3).astype(np.float32)
+        image_b = np.random.rand(batch_size, height, width, 3).astype(np.float32)
+        query = [final_flow, final_flow_nchw] + previous_flows + previous_flows_nchw
+        results = self.sess.run(query, feed_dict={input_image_a: image_a, input_image_b: image_b})
+        num_flows = len(previous_flows)
+        self.assertTrue(np.allclose(results[0], results[1], atol=1e-3))
+        for i in range(num_flows):
+            self.assertTupleEqual(results[2 + i].shape, results[2 + num_flows + i].shape)
+            self.assertTrue(np.allclose(results[2 + i], results[2 + num_flows + i], atol=1e-3))
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -1,5 +1,6 @@
 import tensorflow as tf
 import os.path
+from common.utils.tf import NHWC, to_data_format, from_data_format
 from pwcnet.warp.spacial_transformer_network.transformer import spatial_transformer_network
 from sys import platform
 from tensorflow.python.framework import ops
@@ -17,20 +18,26 @@ else:
     mod = None
 
 
-def backward_warp(images, optical_flows, bilinear_sample=True):
+def backward_warp(images, optical_flows, bilinear_sample=True, data_format=NHWC):
     """
     Given a flow at image A that flows from B to A,
     warp image B to image A.
     :param images: Tensor of shape (Batch, Height, Width, Channels).
     :param optical_flows: Tensor of shape (Batch, Height, Width, 2).
     :param bilinear_sample: Whether to use bilinear interpolation sampling or just nearest-pixel sampling.
+    :param data_format: Str. NHWC or NCHW, in which case the shapes are (Batch, Channels, Height, Width) and
+                        (Batch, 2, Height, Width). Both warps gather along the spatial dimensions, so they are NHWC only
+                        and NCHW tensors are transposed around them.
     :return: Warped images -- tensors of shape (Batch, Height, Width, Channels).
     """
+    images = from_data_format(images, data_format)
+    optical_flows = from_data_format(optical_flows, data_format)
     if mod is not None:
-        return mod.backward_warp(images, optical_flows)
+        warped = mod.backward_warp(images, optical_flows)
     else:
         with tf.name_scope('warp'):
-            return spatial_transformer_network(images, optical_flows, True, bilinear_sample=bilinear_sample)
+            warped = spatial_transformer_network(images, optical_flows, True, bilinear_sample=bilinear_sample)
+    return to_data_format(warped, data_format)
 
 
 if mod is not None:
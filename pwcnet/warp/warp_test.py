@@ -181,6 +181,19 @@ class TestSpacialTransformTranslate(unittest.TestCase):
             self.assertLessEqual(max(error1, error2), self.max_allowable_grad_err,
                                  'Exceeded the error threshold. Note that this test may be flaky.')
 
+    def test_nchw(self):
+        img_b = np.random.rand(2, 6, 8, 3)
+        flow_ab = (np.random.rand(2, 6, 8, 2) - 0.5) * 3
+        input = tf.placeholder(shape=img_b.shape, dtype=tf.float32)
+        flow_tensor = tf.placeholder(shape=flow_ab.shape, dtype=tf.float32)
+        warped_tensor = backward_warp(input, flow_tensor)
+        warped_nchw_tensor = backward_warp(tf.transpose(input, [0, 3, 1, 2]), tf.transpose(flow_tensor, [0, 3, 1, 2]),
+                                           data_format='NCHW')
+        warped, warped_nchw = self.sess.run([warped_tensor, warped_nchw_tensor],
+                                            feed_dict={input: img_b, flow_tensor: flow_ab})
+        self.assertTupleEqual((2, 3, 6, 8), warped_nchw.shape)
+        self.assertTrue(np.allclose(warped, np.transpose(warped_nchw, [0, 2, 3, 1]), atol=1e-6))
+
     def single_warp_test_helper(self, flow_ab_path, img_a_path, img_b_path, tolerance):
         """
         Runs warp test for a set of 2 images and a flow between them.
@@ -1,6 +1,10 @@
 import os.path
 import tensorflow as tf
+from common.utils.checkpoint import AsyncCheckpointWriter
+from common.utils.metrics import get_image_metrics, StreamingMetrics
 from common.utils.misc import print_progress_bar
+from common.utils.multi_gpu import create_apply_gradients_op
+from common.utils.profile import StepTracer
 from common.utils.tf import AdamaxOptimizer, optimistic_restore, Logger
 from common.utils.flow import get_tf_flow_visualization
 from context_interp.model import ContextInterp
@@ -9,8 +13,8 @@ from train.trainer import Trainer
 
 
 class ContextInterpTrainer(Trainer):
-    def __init__(self, model, dataset, session, config, verbose=True):
-        super().__init__(model, dataset, session, config, verbose)
+    def __init__(self, model, dataset, session, config, verbose=True, all_reducer=None):
+        super().__init__(model, dataset, session, config, verbose, all_reducer)
         assert isinstance(self.model, ContextInterp)
         assert isinstance(dataset, InterpDataSet)
 
@@ -32,16 +36,29 @@ class ContextInterpTrainer(Trainer):
         # Get the optimizer.
         with tf.variable_scope('train'):
             self.global_step = tf.Variable(initial_value=0, trainable=False, dtype=tf.int32, name='global_step')
-            self.train_op = AdamaxOptimizer(config['learning_rate'], beta1=0.9, beta2=0.999).minimize(
-                self.loss, global_step=self.global_step
-            )
+            optimizer = AdamaxOptimizer(config['learning_rate'], beta1=0.9, beta2=0.999)
+            self.train_op = create_apply_gradients_op(
+                optimizer, optimizer.compute_gradients(self.loss), self.global_step,
+                accumulation_steps=config['gradient_accumulation_steps'], all_reducer=self.all_reducer)
+            with tf.control_dependencies([self.train_op]):
+                # The global step after the update, so that it can be fetched in the same run as the train op.
+                self.trained_global_step = tf.identity(self.global_step)
 
         # Checkpoint saving.
-        self.saver = tf.train.Saver()
+        self.checkpoint_writer = AsyncCheckpointWriter(os.path.join(self.config['checkpoint_directory'], 'model.ckpt'))
         self.valid_logger = Logger(os.path.join(self.config['checkpoint_directory'], 'valid'), self.session.graph)
         self.train_logger = Logger(os.path.join(self.config['checkpoint_directory'], 'train'), self.session.graph)
         self._make_summaries_dict()
 
+        # Validation metrics, accumulated in the graph over a validation epoch.
+        image_metrics = get_image_metrics(self.images_b_pred, self.images_b)
+        image_metrics['total_loss'] = self.loss
+        self.valid_metrics = StreamingMetrics(image_metrics)
+
+        # Step tracing.
+        self.tracer = StepTracer(os.path.join(self.config['checkpoint_directory'], 'train', 'traces'),
+                                 sample_rate=self.config['trace_sample_rate'], trace_level=self.config['trace_level'])
+
     def restore(self):
         """
         Overridden.
@@ -51,102 +68,113 @@ class ContextInterpTrainer(Trainer):
             checkpoint_file = tf.train.latest_checkpoint(self.config['checkpoint_directory'])
             optimistic_restore(self.session, checkpoint_file)
 
+    def train(self, validate_every=10000, iterations=1000000):
+        """
+        Overridden. The last checkpoint write is always waited for, and its exception is raised if it failed. The
+        logged images that are still being encoded are written as well.
+        """
+        try:
+            super().train(validate_every=validate_every, iterations=iterations)
+        finally:
+            self.train_logger.close()
+            self.valid_logger.close()
+            self.checkpoint_writer.close()
+
     def train_for(self, iterations):
         """
         Overridden.
         """
+        # Saved as is if there are no iterations.
+        global_step = self._eval_global_step()
         for i in range(iterations):
+            # Only a sampled few steps are traced.
+            run_options, run_metadata = self.tracer.get_run_options()
             if i == iterations - 1:
-                # Write the summary on the last iteration.
-                run_options = tf.RunOptions(trace_level=tf.RunOptions.FULL_TRACE)
-                run_metadata = tf.RunMetadata()
-                _ = self.session.run(self.train_op,
-                                     feed_dict=self.dataset.get_train_feed_dict(),
-                                     options=run_options, run_metadata=run_metadata)
+                # Fetch the summaries on the last iteration, in the same run as the train op.
+                _, np_summary_dict, global_step = self.session.run(
+                    [self.train_op, self.summaries_dict, self.trained_global_step],
+                    feed_dict=self.dataset.get_train_feed_dict(), options=run_options, run_metadata=run_metadata)
 
                 # Write summaries.
-                global_step = self._eval_global_step()
-                self.train_logger.add_run_metadata(run_metadata, global_step)
                 loss_key = 'total_loss'
-                np_summary_dict = self._get_np_summaries(feed_dict=self.dataset.get_train_feed_dict())
                 for key, value in np_summary_dict.items():
                     if key != loss_key:
                         self.train_logger.log_images(key, value, global_step)
                 self.train_logger.log_scalar(loss_key, np_summary_dict[loss_key], global_step)
             else:
-                loss, _ = self.session.run([self.loss, self.train_op], feed_dict=self.dataset.get_train_feed_dict())
+                _, global_step = self.session.run([self.train_op, self.trained_global_step],
+                                                  feed_dict=self.dataset.get_train_feed_dict(),
+                                                  options=run_options, run_metadata=run_metadata)
+            if run_metadata is not None:
+                self.tracer.save(run_metadata, global_step, summary_writer=self.train_logger.writer)
             print_progress_bar(i + 1, iterations, prefix='Train Steps', suffix='Complete', use_percentage=False)
 
+        # The checkpoint is written in the background while training continues.
         print('Saving model checkpoint...')
-        save_path = self.saver.save(self.session, os.path.join(self.config['checkpoint_directory'], 'model.ckpt'),
-                                    global_step=self._eval_global_step())
-        print('Model saved in path:', save_path)
+        self.checkpoint_writer.save(self.session, global_step)
 
     def validate(self):
         """
         Overridden.
         """
         self.dataset.init_validation_data(self.session)
+        self.valid_metrics.reset(self.session)
         global_step = self._eval_global_step()
         loss_key = 'total_loss'
         batch_iter = 0
-        total_loss = 0
-
-        # Log 1 example every image_logging_period examples (regardless of batch size).
-        image_logging_period = 50
         while True:
             try:
-                np_summary_dict = self._get_np_summaries(self.dataset.get_validation_feed_dict())
-                for key, value in np_summary_dict.items():
-                    if key != loss_key:
-                        for i, image in enumerate(value):
-                            cur_iter = batch_iter * self.dataset.batch_size + i
-                            if cur_iter % image_logging_period == 0:
-                                sample_number = cur_iter / image_logging_period
+                feed_dict = self.dataset.get_validation_feed_dict()
+                if batch_iter < self.config['validation_image_batches']:
+                    # Only the images of the first few batches are logged.
+                    _, np_summary_dict = self.session.run([self.valid_metrics.update_op, self.summaries_dict],
+                                                          feed_dict=feed_dict)
+                    for key, value in np_summary_dict.items():
+                        if key != loss_key:
+                            for i, image in enumerate(value):
+                                sample_number = batch_iter * self.dataset.batch_size + i
                                 sample_name = key + '/sample_%d' % sample_number
                                 self.valid_logger.log_images(sample_name, [image], global_step)
-                total_loss += np_summary_dict[loss_key]
+                else:
+                    self.session.run(self.valid_metrics.update_op, feed_dict=feed_dict)
                 batch_iter += 1
             except tf.errors.OutOfRangeError:
                 # End of validation epoch.
                 break
 
-        total_loss /= batch_iter
-        self.valid_logger.log_scalar(loss_key, total_loss, global_step)
+        for key, value in self.valid_metrics.get_values(self.session).items():
+            self.valid_logger.log_scalar(key, value, global_step)
+
+        # Wait for the images that are being encoded in the background.
+        self.train_logger.flush()
+        self.valid_logger.flush()
 
     def _eval_global_step(self):
         return self.session.run(self.global_step)
 
-    def _get_np_summaries(self, feed_dict):
-        np_summaries_dict = {}
-        tensors = []
-        for key, value in self.summaries_dict.items():
-            tensors.append(value)
-
-        np_vals = self.session.run(tensors, feed_dict=feed_dict)
-        for i, (key, value) in enumerate(self.summaries_dict.items()):
-            np_summaries_dict[key] = np_vals[i]
-        return np_summaries_dict
-
     def _make_summaries_dict(self):
         with tf.name_scope('summaries'):
+            scale = self.config['summary_image_scale']
+
+            def _prepare_image(images):
+                # Downsample and quantize the images before they are copied to the host.
+                if scale != 1.0:
+                    size = tf.cast(tf.cast(tf.shape(images)[1:3], tf.float32) * scale, tf.int32)
+                    images = tf.image.resize_area(images, size)
+                # Images will appear 'washed out' otherwise, due to tensorboard's own normalization scheme.
+                return tf.image.convert_image_dtype(tf.clip_by_value(images, 0.0, 1.0), tf.uint8, saturate=True)
 
             # Get overlays.
             weight = 0.60
             image_overlays = self.images_a * weight + self.images_c * (1 - weight)
 
-            # Images will appear 'washed out' otherwise, due to tensorboard's own normalization scheme.
-            clipped_preds = tf.clip_by_value(self.images_b_pred, 0.0, 1.0)
-            clipped_warp_a_b = tf.clip_by_value(self.warped_a_c[..., 0:3], 0.0, 1.0)
-            clipped_warp_b_a = tf.clip_by_value(self.warped_c_a[..., 0:3], 0.0, 1.0)
-
             self.summaries_dict = {
-                'overlay': image_overlays,
+                'overlay': _prepare_image(image_overlays),
                 'total_loss': self.loss,
-                'inbetween_gt': self.images_b,
-                'inbetween_pred': clipped_preds,
-                'warped_a_c': clipped_warp_a_b,
-                'warped_c_a': clipped_warp_b_a,
-                'flow_a_c': get_tf_flow_visualization(self.flow_a_c),
-                'flow_c_a': get_tf_flow_visualization(self.flow_c_a)
+                'inbetween_gt': _prepare_image(self.images_b),
+                'inbetween_pred': _prepare_image(self.images_b_pred),
+                'warped_a_c': _prepare_image(self.warped_a_c[..., 0:3]),
+                'warped_c_a': _prepare_image(self.warped_c_a[..., 0:3]),
+                'flow_a_c': _prepare_image(get_tf_flow_visualization(self.flow_a_c)),
+                'flow_c_a': _prepare_image(get_tf_flow_visualization(self.flow_c_a))
             }
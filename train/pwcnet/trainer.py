@@ -1,19 +1,25 @@
 import os.path
 import tensorflow as tf
+from common.utils.checkpoint import AsyncCheckpointWriter
 from common.utils.flow import get_tf_flow_visualization
+from common.utils.metrics import get_flow_metrics, StreamingMetrics
 from common.utils.multi_gpu import get_available_gpus, TensorIO, create_train_op
-from common.utils.profile import save_timeline
+from common.utils.profile import StepTracer
 from data.flow.flow_data import FlowDataSet
 from pwcnet.model import PWCNet
 from train.trainer import Trainer
 
 
 class PWCNetTrainer(Trainer):
-    def __init__(self, model, dataset, session, config, verbose=True):
-        super().__init__(model, dataset, session, config, verbose)
+    def __init__(self, model, dataset, session, config, verbose=True, all_reducer=None):
+        super().__init__(model, dataset, session, config, verbose, all_reducer)
         assert isinstance(self.model, PWCNet)
         assert isinstance(dataset, FlowDataSet)
 
+        # Each GPU tower can read its own sub-batch instead of slicing the batch on the host.
+        self.devices = get_available_gpus()
+        if self.config['per_tower_input_pipelines'] and len(self.devices) > 1:
+            self.dataset.set_num_towers(len(self.devices))
         self.dataset.load(self.session)
         self.images_a, self.images_b, self.flows = self.dataset.get_next_batch()
 
@@ -34,9 +40,24 @@ class PWCNetTrainer(Trainer):
         self.valid_log_dir = os.path.join(self.config['checkpoint_directory'], 'valid')
         self._make_summaries()
 
+        # Validation metrics, accumulated in the graph over a validation epoch.
+        flow_metrics = get_flow_metrics(self.final_flow, self.flows)
+        flow_metrics['total_loss'] = self.loss
+        self.valid_metrics = StreamingMetrics(flow_metrics)
+
+        # Step tracing.
+        self.tracer = StepTracer(os.path.join(self.train_log_dir, 'traces'),
+                                 sample_rate=self.config['trace_sample_rate'], trace_level=self.config['trace_level'],
+                                 op_filter=self.config['trace_op_filter'], top_k=self.config['trace_top_k'],
+                                 max_to_keep=self.config['max_traces_to_keep'],
+                                 chrome_trace=self.config['trace_chrome_timeline'])
+
         # Checkpoint saving.
         self.saver = tf.train.Saver()
         self.npz_save_file = os.path.join(self.config['checkpoint_directory'], 'pwcnet_weights.npz')
+        self.checkpoint_writer = AsyncCheckpointWriter(
+            os.path.join(self.train_log_dir, 'model.ckpt'), npz_file=self.npz_save_file,
+            npz_variables=tf.trainable_variables(self.model.name), max_to_keep=self.config['max_checkpoints_to_keep'])
 
     def _create_ops(self):
         optimizer = tf.train.AdamOptimizer(self.config['learning_rate'])
@@ -58,14 +79,32 @@ class PWCNetTrainer(Trainer):
 
         # Use a helper function to split the batch across multiple GPUs.
         self.train_op, self.global_step, outputs = create_train_op(
-            optimizer, build_network_outputs, [self.images_a, self.images_b, self.flows], [],
-            available_devices=get_available_gpus(), verbose=True)
+            optimizer, build_network_outputs, self._get_batched_network_args(), [],
+            available_devices=self.devices, verbose=True,
+            accumulation_steps=self.config['gradient_accumulation_steps'], all_reducer=self.all_reducer,
+            tower_network_args=self._get_tower_network_args())
 
         self.final_flow = outputs['final_flow'].first()
         self.previous_flows = outputs['previous_flows'].tensors
         self.loss = outputs['loss'].first()
         self.layer_losses = outputs['layer_losses'].tensors
 
+    def _get_batched_network_args(self):
+        """
+        :return: List of tensors to slice between the GPU towers. Empty if the towers have their own input pipelines.
+        """
+        if self.dataset.num_towers > 1:
+            return []
+        return [self.images_a, self.images_b, self.flows]
+
+    def _get_tower_network_args(self):
+        """
+        :return: List of lists of tensors, 1 per GPU tower. None if the towers slice the batch instead.
+        """
+        if self.dataset.num_towers > 1:
+            return [list(tower_batch) for tower_batch in self.dataset.get_next_tower_batches()]
+        return None
+
     def restore(self):
         """
         Overridden.
@@ -78,44 +117,62 @@ class PWCNetTrainer(Trainer):
             print('Restoring weights from npz...')
             self.model.restore_from(self.npz_save_file, self.session)
 
+    def train(self, validate_every=10000, iterations=1000000):
+        """
+        Overridden. The last checkpoint write is always waited for, and its exception is raised if it failed.
+        """
+        try:
+            super().train(validate_every=validate_every, iterations=iterations)
+        finally:
+            self.checkpoint_writer.close()
+
     def train_for(self, iterations):
         """
         Overridden.
         """
         for i in range(iterations):
+            # Only a sampled few steps are traced.
+            run_options, run_metadata = self.tracer.get_run_options()
             if i == iterations - 1:
                 # Write the summary on the last iteration.
-                run_options = tf.RunOptions(trace_level=tf.RunOptions.FULL_TRACE)
-                run_metadata = tf.RunMetadata()
                 _, summ = self.session.run([self.train_op, self.merged_summ],
                                            feed_dict=self.dataset.get_train_feed_dict(),
                                            options=run_options, run_metadata=run_metadata)
                 global_step = self._eval_global_step()
-                self.train_writer.add_run_metadata(run_metadata, 'step%d' % global_step, global_step=global_step)
                 self.train_writer.add_summary(summ, global_step=global_step)
                 self.train_writer.flush()
-                self.model.save_to(self.npz_save_file, self.session)
-                save_timeline(run_metadata, self.train_log_dir, detailed=False)
             else:
-                loss, _ = self.session.run([self.loss, self.train_op], feed_dict=self.dataset.get_train_feed_dict())
+                loss, _ = self.session.run([self.loss, self.train_op], feed_dict=self.dataset.get_train_feed_dict(),
+                                           options=run_options, run_metadata=run_metadata)
+            if run_metadata is not None:
+                self.tracer.save(run_metadata, self._eval_global_step(), summary_writer=self.train_writer)
 
+        # The checkpoint and npz files are written in the background while training continues.
         print('Saving model checkpoint...')
-        save_path = self.saver.save(self.session, os.path.join(self.train_log_dir, 'model.ckpt'),
-                                    global_step=self._eval_global_step())
-        print('Model saved in path:', save_path)
+        self.checkpoint_writer.save(self.session, self._eval_global_step())
 
     def validate(self):
         """
         Overridden.
         """
         self.dataset.init_validation_data(self.session)
+        self.valid_metrics.reset(self.session)
+        global_step = self._eval_global_step()
+        num_batches = 0
         while True:
             try:
-                summ = self.session.run(self.merged_summ, feed_dict=self.dataset.get_validation_feed_dict())
-                self.valid_writer.add_summary(summ, self._eval_global_step())
+                feed_dict = self.dataset.get_validation_feed_dict()
+                if num_batches < self.config['validation_image_batches']:
+                    # Only the first few batches are visualized.
+                    _, summ = self.session.run([self.valid_metrics.update_op, self.merged_summ], feed_dict=feed_dict)
+                    self.valid_writer.add_summary(summ, global_step)
+                else:
+                    self.session.run(self.valid_metrics.update_op, feed_dict=feed_dict)
+                num_batches += 1
             except tf.errors.OutOfRangeError:
                 # End of validation epoch.
                 break
+        self.valid_writer.add_summary(self.session.run(self.valid_metrics.summary), global_step)
         self.valid_writer.flush()
 
     def _eval_global_step(self):
@@ -1,17 +1,17 @@
 import tensorflow as tf
 from common.utils.flow import get_tf_flow_visualization
-from common.utils.multi_gpu import get_available_gpus, TensorIO, create_train_op
+from common.utils.multi_gpu import TensorIO, create_train_op
 from train.pwcnet.trainer import PWCNetTrainer
 
 
 class PWCNetUnflowTrainer(PWCNetTrainer):
-    def __init__(self, model, dataset, session, config, verbose=True):
+    def __init__(self, model, dataset, session, config, verbose=True, all_reducer=None):
         self.final_backward_flow = None
         self.previous_backward_flows = None
         self.forward_occlusion_masks = None
         self.backward_occlusion_masks = None
         self.unflow_loss_terms = {}
-        super().__init__(model, dataset, session, config, verbose)
+        super().__init__(model, dataset, session, config, verbose, all_reducer)
 
     def _create_ops(self):
         """
@@ -49,8 +49,10 @@ class PWCNetUnflowTrainer(PWCNetTrainer):
 
         # Use a helper function to split the batch across multiple GPUs.
         self.train_op, self.global_step, outputs = create_train_op(
-            optimizer, build_network_outputs, [self.images_a, self.images_b, self.flows], [],
-            available_devices=get_available_gpus(), verbose=True)
+            optimizer, build_network_outputs, self._get_batched_network_args(), [],
+            available_devices=self.devices, verbose=True,
+            accumulation_steps=self.config['gradient_accumulation_steps'], all_reducer=self.all_reducer,
+            tower_network_args=self._get_tower_network_args())
 
         self.final_flow = outputs['final_forward_flow'].first()
         self.final_backward_flow = outputs['final_backward_flow'].first()
@@ -3,13 +3,15 @@ from data.dataset import DataSet
 
 
 class Trainer:
-    def __init__(self, model, dataset, session, config, verbose=True):
+    def __init__(self, model, dataset, session, config, verbose=True, all_reducer=None):
         """
         :param model: A neural network model.
         :param dataset: A dataset object.
         :param session: Tensorflow session.
         :param config: Dictionary.
         :param verbose: Bool.
+        :param all_reducer: RingAllReduce or None. If not None, gradients are averaged with the other worker processes
+                            before every update.
         """
         assert isinstance(session, tf.Session)
         assert isinstance(dataset, DataSet)
@@ -18,6 +20,7 @@ class Trainer:
         self.session = session
         self.config = config
         self.verbose = verbose
+        self.all_reducer = all_reducer
 
     def restore(self):
         raise NotImplementedError('restore() is not implemented.')